@@ -5,6 +5,7 @@ import sys
 import readline
 import traceback
 import shutil
+from contextlib import nullcontext
 sys.path.append('miniDB')
 
 from database import Database
@@ -93,6 +94,9 @@ def create_query_plan(query, keywords, action):
         else:
             dic['desc'] = None
 
+        # the values are the arguments of Database.select, in order (group by comes after desc)
+        dic['group by'] = dic.pop('group by')
+
     if action=='create table':
         args = dic['create table'][dic['create table'].index('('):dic['create table'].index(')')+1]
         dic['create table'] = dic['create table'].removesuffix(args).strip()
@@ -106,21 +110,44 @@ def create_query_plan(query, keywords, action):
         else:
             dic['primary key'] = None
     
+    if action=='export':
+        # export the result of a query, e.g. 'export (select * from instructor where salary>80000) to rich.csv'
+        if dic['export'].startswith('(') and dic['export'].endswith(')'):
+            dic['export'] = interpret(dic['export'][1:-1].strip())
+
     if action=='import': 
         dic = {'import table' if key=='import' else key: val for key, val in dic.items()}
 
     if action=='insert into':
-        if dic['values'][0] == '(' and dic['values'][-1] == ')':
-            dic['values'] = dic['values'][1:-1]
+        # (values is None if a paren is not closed, the rest of the query is then inside the parens)
+        if dic['values'] is not None and dic['values'][0] == '(' and dic['values'][-1] == ')':
+            # e.g. '( 1,a )' or, for many rows, '( 1,a ) , ( 2,b )'
+            if not re.fullmatch(r'\([^()]*\)(\s*,\s*\([^()]*\))*', dic['values']):
+                raise ValueError('Your parens are not right m8')
+            rows = re.findall(r'\(([^()]*)\)', dic['values'])
+            if len(rows) == 1:
+                dic['values'] = rows[0]
+            else:
+                dic = {'insert many': dic['insert into'], 'values': rows}
         else:
             raise ValueError('Your parens are not right m8')
     
+    if action=='lock table':
+        if dic['mode'] is None:
+            dic['mode'] = 'x'
+
     if action=='unlock table':
         if dic['force'] is not None:
             dic['force'] = True
         else:
             dic['force'] = False
 
+    if action in ('begin', 'commit', 'rollback'):
+        # e.g. 'begin', 'begin transaction', 'commit work'
+        if dic[action] not in ('', 'transaction', 'work'):
+            raise ValueError(f'Unexpected "{dic[action]}" after "{action}".')
+        dic[action] = None
+
     return dic
 
 
@@ -170,14 +197,18 @@ def interpret(query):
                      'import': ['import', 'from'],
                      'export': ['export', 'to'],
                      'insert into': ['insert into', 'values'],
-                     'select': ['select', 'from', 'where', 'distinct', 'order by', 'limit'],
+                     'select': ['select', 'from', 'where', 'distinct', 'order by', 'limit', 'group by'],
                      'lock table': ['lock table', 'mode'],
                      'unlock table': ['unlock table', 'force'],
                      'delete from': ['delete from', 'where'],
                      'update table': ['update table', 'set', 'where'],
                      'create index': ['create index', 'on', 'using'],
                      'drop index': ['drop index'],
-                     'create view' : ['create view', 'as']
+                     'create view' : ['create view', 'as'],
+                     'vacuum': ['vacuum'],
+                     'begin': ['begin'],
+                     'commit': ['commit'],
+                     'rollback': ['rollback']
                      }
 
     if query[-1]!=';':
@@ -191,16 +222,160 @@ def interpret(query):
 
     return create_query_plan(query, kw_per_action[action]+[';'], action)
 
-def execute_dic(dic):
+def execute_dic(dic, database=None):
     '''
-    Execute the given dictionary
+    Execute the given dictionary on the specified database (the global db if None)
     '''
+    if database is None:
+        database = db
     for key in dic.keys():
         if isinstance(dic[key],dict):
-            dic[key] = execute_dic(dic[key])
+            if 'select' in dic and key == 'from' and 'join' in dic[key]:
+                # the rows of the join stream into the select (see Database.select), only its subqueries are executed
+                dic[key] = {join_key: execute_dic(value, database) if isinstance(value, dict) else value for join_key, value in dic[key].items()}
+            else:
+                dic[key] = execute_dic(dic[key], database)
     
     action = list(dic.keys())[0].replace(' ','_')
-    return getattr(db, action)(*dic.values())
+    args = list(dic.values())
+    if args == [None]: # statements without arguments (e.g. commit)
+        args = []
+    return getattr(database, action)(*args)
+
+def serve(path, default_db, workers=4, max_clients=64, queue_size=8):
+    '''
+    Serve the queries of clients (see miniDB/client.py) over a Unix socket. The databases are loaded once and
+    kept in memory, so clients do not pay for the interpreter startup and the database load.
+
+    The front-end is asyncio based: client sessions are handled by the event loop, which also parses the queries,
+    and the statements are executed by a pool of worker threads.
+        - At most max_clients sessions are served at a time, further connections wait until a session ends.
+        - Every session queues up to queue_size queries. When its queue is full, the server stops reading from
+          the client (backpressure).
+        - Sessions take turns (round robin): a worker executes one query of a session and then moves on to the next
+          session with queued queries, so a busy client cannot starve the others. The queries of a session are
+          executed in order.
+        - Queries on the same database run in parallel if they only read (select), while the rest of the
+          statements run alone (the Database object is shared by all the sessions).
+        - Transactions (begin/commit/rollback) are not supported, since the queries of a session are not always
+          executed by the same worker thread.
+
+    Args:
+        path: string. Path of the Unix socket.
+        default_db: string. The database used by the clients that do not specify one.
+        workers: int. Number of worker threads (queries executed at the same time).
+        max_clients: int. Maximum number of sessions served at the same time.
+        queue_size: int. Maximum number of queued queries per session.
+    '''
+    import asyncio
+    import pickle
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from client import LENGTH
+    from locks import LockManager
+
+    databases = {} # database name -> Database object
+    databases_lock = threading.Lock()
+    # read (s) / write (x) locks of the databases, held by the worker threads while they execute a statement
+    statement_locks = LockManager(None, timeout=None)
+
+    def get_database(name):
+        with databases_lock:
+            if name not in databases:
+                databases[name] = Database(name, load=True, storage=os.getenv('STORAGE', 'pickle'))
+            return databases[name]
+
+    def execute(name, dic):
+        # runs in a worker thread
+        database = get_database(name)
+        statement_locks.acquire(name, 's' if 'select' in dic else 'x')
+        try:
+            return execute_dic(dic, database)
+        finally:
+            statement_locks.release(name)
+
+    class Session:
+        def __init__(self, writer):
+            self.writer = writer
+            self.requests = asyncio.Queue(queue_size)
+            self.scheduled = False # whether the session is in the ready queue (or one of its queries is executing)
+
+        async def send(self, response):
+            try:
+                payload = pickle.dumps(response, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                payload = pickle.dumps(('error', traceback.format_exc()), protocol=pickle.HIGHEST_PROTOCOL)
+            try:
+                self.writer.write(LENGTH.pack(len(payload))+payload)
+                await self.writer.drain()
+            except ConnectionError: # the client is gone
+                pass
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(workers)
+        sessions = asyncio.Semaphore(max_clients)
+        ready = asyncio.Queue() # sessions with queued queries, in the order they will be served
+
+        async def run(request):
+            name = request['db'] or default_db
+            query = request['query'].lower()
+            try:
+                if name is None:
+                    raise ValueError('No database specified (and the server has no default database).')
+                if query.startswith('explain'):
+                    return ('ok', interpret(query.removeprefix('explain ')))
+                dic = interpret(query)
+                if list(dic)[0] in ('begin', 'commit', 'rollback'):
+                    raise ValueError('Transactions are not supported in server mode.')
+                return ('ok', await loop.run_in_executor(executor, execute, name, dic))
+            except Exception:
+                return ('error', traceback.format_exc())
+
+        async def worker():
+            while True:
+                session = await ready.get()
+                request = session.requests.get_nowait()
+                await session.send(await run(request))
+                session.requests.task_done()
+                if session.requests.empty():
+                    session.scheduled = False
+                else: # back to the end of the line
+                    ready.put_nowait(session)
+
+        async def handle(reader, writer):
+            async with sessions:
+                session = Session(writer)
+                while True:
+                    try:
+                        length, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+                        request = pickle.loads(await reader.readexactly(length))
+                    except (asyncio.IncompleteReadError, ConnectionError, pickle.UnpicklingError): # the client disconnected (or sent garbage)
+                        break
+                    await session.requests.put(request)
+                    if not session.scheduled:
+                        session.scheduled = True
+                        ready.put_nowait(session)
+                # answer the queued queries before closing
+                await session.requests.join()
+                writer.close()
+
+        worker_tasks = [asyncio.create_task(worker()) for _ in range(workers)] # (referenced, so they are not garbage collected)
+        server = await asyncio.start_unix_server(handle, path)
+        os.chmod(path, 0o600) # only the user that runs the server can connect
+        print(f'Serving on {path}')
+        async with server:
+            await server.serve_forever()
+
+    if os.path.exists(path): # left by a previous server
+        os.remove(path)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print('\nbye!')
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
 
 def interpret_meta(command):
     """
@@ -231,6 +406,8 @@ def interpret_meta(command):
 
     def change_db(db_name):
         global db
+        if db.in_transaction():
+            raise Exception('A transaction is in progress. Commit or roll it back first.')
         db = Database(db_name, load=True, verbose=verbose)
     
     def remove_db(db_name):
@@ -250,21 +427,31 @@ if __name__ == "__main__":
     fname = os.getenv('SQL')
     dbname = os.getenv('DB')
 
-    db = Database(dbname, load=True)
+    if os.getenv('SERVE') is not None:
+        # server mode: SERVE is the path of the Unix socket, DB the default database of the clients
+        serve(os.getenv('SERVE'), dbname, workers=int(os.getenv('WORKERS', 4)), max_clients=int(os.getenv('MAX_CLIENTS', 64)))
+        sys.exit()
+
+    db = Database(dbname, load=True, storage=os.getenv('STORAGE', 'pickle'))
 
     
 
     if fname is not None:
-        for line in open(fname, 'r').read().splitlines():
-            if line.startswith('--'): continue
-            if line.startswith('explain'):
-                dic = interpret(line.removeprefix('explain '))
-                pprint(dic, sort_dicts=False)
-            else :
-                dic = interpret(line.lower())
-                result = execute_dic(dic)
-                if isinstance(result,Table):
-                    result.show()
+        lines = open(fname, 'r').read().splitlines()
+        # the script runs as a batch: the database is loaded and saved once and, if a statement fails, the
+        # changes of the script are rolled back. Scripts that mark their own transactions (begin ... commit) run as written
+        explicit = any(line.lower().startswith('begin') for line in lines)
+        with (nullcontext() if explicit else db.batch()):
+            for line in lines:
+                if line.startswith('--'): continue
+                if line.startswith('explain'):
+                    dic = interpret(line.removeprefix('explain '))
+                    pprint(dic, sort_dicts=False)
+                else :
+                    dic = interpret(line.lower())
+                    result = execute_dic(dic)
+                    if isinstance(result,Table):
+                        result.show()
         
 
     from prompt_toolkit import PromptSession
@@ -296,3 +483,7 @@ if __name__ == "__main__":
                     result.show()
         except Exception:
             print(traceback.format_exc())
+
+    if db.in_transaction():
+        db.rollback()
+        print('The uncommitted transaction was rolled back.')
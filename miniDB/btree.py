@@ -65,7 +65,9 @@ class Node:
             if value<existing_val:
 
                 self.values.insert(index, value)
-                self.ptrs.insert(index+1, ptr)
+                # in a leaf, every value has its own ptr (same position). In a non leaf node, the ptr
+                # is the right child of the new value (the left one already exists)
+                self.ptrs.insert(index if self.is_leaf else index+1, ptr)
 
                 if ptr1:
                     self.ptrs.insert(index+1, ptr1)
@@ -130,7 +132,8 @@ class Btree:
         ops=0 # number of operations (<>= etc). Used for benchmarking
 
         #start with the root node
-        node = self.nodes[self.root]
+        idx = self.root
+        node = self.nodes[idx]
         # while the node that we are searching in is not a leaf
         # keep searching
         while not node.is_leaf:
@@ -140,9 +143,9 @@ class Btree:
 
         # finally return the index of the appropriate node (and the ops if you want to)
         if return_ops:
-            return self.nodes.index(node), ops
+            return idx, ops
         else:
-            return self.nodes.index(node)
+            return idx
 
 
     def split(self, node_id):
@@ -192,7 +195,7 @@ class Btree:
 
         # old node (left) keeps only the first half of the values/ptrs
         node.values = node.values[:len(node.values)//2]
-        if self.b%2==1:
+        if node.is_leaf or self.b%2==1:
             node.ptrs = node.ptrs[:len(node.ptrs)//2]
         else:
             node.ptrs = node.ptrs[:len(node.ptrs)//2+1]
@@ -223,6 +226,22 @@ class Btree:
 
 
 
+    def remap(self, new_ptrs):
+        '''
+        Replace the ptrs (row indexes) stored in the leaves, e.g. after the rows of the table have been moved.
+        Values whose ptr is not in new_ptrs (their row no longer exists) are removed from the tree.
+
+        Args:
+            new_ptrs: dict. Maps every old ptr to its new one.
+        '''
+        for node in self.nodes:
+            if not node.is_leaf:
+                continue
+            kept = [(value, new_ptrs[ptr]) for value, ptr in zip(node.values, node.ptrs) if ptr in new_ptrs]
+            node.values = [value for value, _ in kept]
+            node.ptrs = [ptr for _, ptr in kept]
+
+
     def show(self):
         '''
         Show important info for each node (sort by level - root first, then left to right).
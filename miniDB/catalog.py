@@ -0,0 +1,128 @@
+'''
+Lazily loaded collection of the tables of a database.
+'''
+import threading
+from collections.abc import MutableMapping
+
+
+class Catalog(MutableMapping):
+    '''
+    Maps table names to Table objects (like a dict). Tables that exist on disk are registered by name only.
+    They are loaded using the supplied loader function the first time they are accessed and are then kept in memory
+    until they are evicted (e.g. because their file was modified by another process).
+
+    A thread can keep its changes private (see begin): until it calls end, the tables it sets are only visible to it,
+    while the other threads keep seeing the shared ones.
+    '''
+    def __init__(self, loader):
+        '''
+        Args:
+            loader: function. Called with a table name, returns the loaded Table object.
+        '''
+        self.loader = loader
+        self._tables = {} # table name -> Table object, or None if the table is not loaded
+        self._local = threading.local() # the private tables of every thread (table name -> Table object)
+
+    def __getitem__(self, name):
+        private = self.private()
+        if private is not None and name in private:
+            return private[name]
+        table = self._tables[name]
+        if table is None:
+            table = self.loader(name)
+            self._tables[name] = table
+        return table
+
+    def __setitem__(self, name, table):
+        private = self.private()
+        if private is not None:
+            private[name] = table
+        else:
+            self._tables[name] = table
+
+    def __delitem__(self, name):
+        private = self.private()
+        if private is not None and name in private:
+            del private[name]
+            self._tables.pop(name, None)
+        else:
+            del self._tables[name]
+
+    def __contains__(self, name):
+        private = self.private()
+        return name in self._tables or (private is not None and name in private)
+
+    def __iter__(self):
+        private = self.private() or {}
+        return iter(list(self._tables)+[name for name in private if name not in self._tables])
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def begin(self):
+        '''
+        Keep the tables that the calling thread sets from now on private, until it calls end.
+        '''
+        self._local.tables = {}
+
+    def end(self):
+        '''
+        Stop keeping the changes of the calling thread private. Returns its private tables (name -> Table object),
+        which the caller can set again to make them visible to every thread, or drop.
+        '''
+        private = self.private()
+        self._local.tables = None
+        return private or {}
+
+    def private(self):
+        '''
+        Return the private tables of the calling thread, or None if it does not keep its changes private.
+        '''
+        return getattr(self._local, 'tables', None)
+
+    def set_loaded(self, name, table):
+        '''
+        Store a table that was just loaded from disk. Loaded tables are shared, even while the thread keeps its changes private.
+
+        Args:
+            name: string. Name of table.
+            table: Table. The loaded table.
+        '''
+        self._tables[name] = table
+
+    def register(self, name):
+        '''
+        Add a table that exists on disk, without loading it.
+
+        Args:
+            name: string. Name of table.
+        '''
+        self._tables.setdefault(name, None)
+
+    def evict(self, name):
+        '''
+        Drop the in-memory object of a table. The table will be loaded again on its next access.
+
+        Args:
+            name: string. Name of table.
+        '''
+        if name in self._tables:
+            self._tables[name] = None
+
+    def is_loaded(self, name):
+        '''
+        Check whether the specified table is in memory.
+
+        Args:
+            name: string. Name of table.
+        '''
+        private = self.private()
+        return self._tables.get(name) is not None or (private is not None and name in private)
+
+    def loaded(self):
+        '''
+        Return the (name, table) pairs of the tables that are in memory.
+        '''
+        tables = {name: table for name, table in self._tables.items() if table is not None}
+        tables.update(self.private() or {})
+        return list(tables.items())
@@ -0,0 +1,96 @@
+'''
+Client of the mdb server (see mdb.py, SERVE mode).
+
+The server keeps the databases in memory and executes the queries sent to it over a local Unix socket, so
+scripts do not pay for the interpreter startup and the database load on every run.
+
+Protocol: every message is a 4 byte (big endian) length followed by a pickled object.
+    request:  {'db': database name, 'query': the query (as typed in the mdb prompt)}
+    response: ('ok', result) or ('error', traceback of the exception raised by the server)
+Only connect to servers you trust, since responses are unpickled.
+'''
+import os
+import pickle
+import socket
+import struct
+import sys
+
+# results contain miniDB objects (e.g. miniDB.table.Table), which need to be importable to be unpickled
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LENGTH = struct.Struct('>I')
+
+
+def send_message(sock, obj):
+    '''
+    Send a (pickled) object over a socket.
+    '''
+    payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(LENGTH.pack(len(payload))+payload)
+
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size-len(data))
+        if not chunk:
+            raise ConnectionError('Connection closed.')
+        data.extend(chunk)
+    return bytes(data)
+
+
+def recv_message(sock):
+    '''
+    Receive a (pickled) object from a socket. Returns None if the connection was closed before a new message.
+    '''
+    try:
+        header = _recv_exactly(sock, LENGTH.size)
+    except ConnectionError:
+        return None
+    length, = LENGTH.unpack(header)
+    return pickle.loads(_recv_exactly(sock, length))
+
+
+class Client:
+    '''
+    A connection to an mdb server.
+
+    Example:
+        with Client('mdb.sock', 'smdb') as client:
+            client.execute('select * from instructor where salary>80000').show()
+    '''
+    def __init__(self, path='mdb.sock', db=None):
+        '''
+        Args:
+            path: string. Path of the server's Unix socket.
+            db: string. Name of the database the queries are executed on (the server's default database if None).
+        '''
+        self.db = db
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+
+    def execute(self, query):
+        '''
+        Execute a query on the server and return its result (e.g. a Table for select, None for most statements).
+        Exceptions raised by the server are raised again, with the server's traceback as message.
+
+        Args:
+            query: string. The query (e.g. 'select * from instructor').
+        '''
+        send_message(self.sock, {'db': self.db, 'query': query})
+        response = recv_message(self.sock)
+        if response is None:
+            raise ConnectionError('The server closed the connection.')
+        status, result = response
+        if status == 'error':
+            raise Exception(f'Query failed on the server:\n{result}')
+        return result
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
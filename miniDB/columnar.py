@@ -0,0 +1,403 @@
+'''
+Columnar storage for the rows of a table. Meant for analytics: scans that need a few columns of wide tables.
+
+Every column is stored in its own file(s) and is memory-mapped when it is first accessed:
+    - int/float columns: a contiguous array of 8 byte values (c<i>.values)
+    - str columns: the utf-8 encoded values one after the other (c<i>.values) and an array of n+1 offsets (c<i>.offsets)
+    - every column: a bitmap with a set bit for every None value (c<i>.nulls)
+    - int/float columns with values that do not fit in an array (e.g. 'NULL' strings, or values of updates that were
+      not casted): the pickled list of values (c<i>.pickle), read as a whole
+
+The files are written in a new generation directory (<table>.cols/<generation>) every time the table is saved,
+so a reader always sees a complete set of columns.
+'''
+import mmap
+import os
+import pickle
+import shutil
+from array import array
+from collections.abc import MutableSequence, Sequence
+from itertools import chain
+
+# column type -> array typecode of its values
+TYPECODES = {int: 'q', float: 'd'}
+# byte -> its 8 bits (least significant first). Used to expand a nulls bitmap a byte at a time
+BITS = [tuple(byte >> k & 1 for k in range(8)) for byte in range(256)]
+
+
+def is_supported(column_types):
+    '''
+    Check whether a table with the specified column types can be stored in columnar format.
+
+    Args:
+        column_types: list. Types of columns.
+    '''
+    return all(column_type in (int, float, str) for column_type in column_types)
+
+
+def _map(filename, typecode='B'):
+    '''
+    Memory-map a file (read only) and return it as a typed memoryview. No data is copied.
+    '''
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0: # empty files cannot be mapped
+            return memoryview(array(typecode))
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)).cast(typecode)
+
+
+def _fsync(path):
+    '''
+    Flush a file or a directory to disk.
+    '''
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class NullableColumn(Sequence):
+    '''
+    A (memory-mapped) column of values, where the values whose bit is set in the nulls bitmap are None.
+    '''
+    def __init__(self, values, nulls):
+        self.values = values
+        self.nulls = nulls
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if self.nulls[i >> 3] & (1 << (i & 7)):
+            return None
+        return self.values[i]
+
+    def __iter__(self):
+        flags = chain.from_iterable(map(BITS.__getitem__, self.nulls))
+        return (None if is_null else value for value, is_null in zip(self.values, flags))
+
+
+class StrColumn(NullableColumn):
+    '''
+    A (memory-mapped) str column. The i-th value is the utf-8 decoded values[offsets[i]:offsets[i+1]].
+    '''
+    def __init__(self, values, offsets, nulls):
+        super().__init__(values, nulls)
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if self.nulls[i >> 3] & (1 << (i & 7)):
+            return None
+        return str(self.values[self.offsets[i]:self.offsets[i+1]], 'utf-8')
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+
+class ColumnarData(MutableSequence):
+    '''
+    The rows of a table, stored column by column. Behaves like the list of rows (Table.data), while column(idx)
+    returns a single column without reading any other.
+
+    The stored columns are read only. The first modification loads all the rows in memory (as a list)
+    and the table is written again in columnar format when it is saved.
+    '''
+    # indexes of the columns that are stored pickled (see the top of the file)
+    pickled = ()
+
+    def __init__(self, path, column_types, no_of_rows, has_nulls, pickled=()):
+        '''
+        Args:
+            path: string. The directory of the column files.
+            column_types: list. Types of columns.
+            no_of_rows: int. Number of rows.
+            has_nulls: list. Whether each column has any None values.
+            pickled: list. Indexes of the columns that are stored pickled.
+        '''
+        self.path = path
+        self.column_types = column_types
+        self.no_of_rows = no_of_rows
+        self.has_nulls = has_nulls
+        self.pickled = list(pickled)
+        self._columns = {} # column index -> mapped column
+        self._rows = None # the rows in memory, after the first modification
+
+    def __getstate__(self):
+        # the columns are not pickled, they are mapped again on access
+        return {key: (value if key not in ('_columns', '_rows') else None) for key, value in self.__dict__.items()}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._columns = {}
+
+    @classmethod
+    def create(cls, path, rows, column_types):
+        '''
+        Write the rows in a new generation directory under path and return them as a ColumnarData object.
+
+        Args:
+            path: string. The directory of the table's column files (<table>.cols).
+            rows: list. The rows to be stored.
+            column_types: list. Types of columns (int, float or str).
+        '''
+        rows = list(rows)
+        os.makedirs(path, exist_ok=True)
+        generations = [int(gen) for gen in os.listdir(path) if gen.isdigit()]
+        gen_path = f'{path}/{max(generations, default=0)+1}'
+        os.mkdir(gen_path)
+
+        has_nulls, pickled = [], []
+        for idx, column_type in enumerate(column_types):
+            column = [row[idx] for row in rows]
+            nulls = bytearray((len(column)+7)//8)
+            for i, value in enumerate(column):
+                if value is None:
+                    nulls[i >> 3] |= 1 << (i & 7)
+            has_nulls.append(any(nulls))
+
+            values = None
+            if column_type in TYPECODES:
+                # values of other types (even if they could be converted, e.g. ints in a float column) are pickled,
+                # so that they are read back as they were (like the list columns of TypedColumns)
+                default = column_type(0)
+                try:
+                    if all(value is None or type(value) is column_type for value in column):
+                        values = array(TYPECODES[column_type], [value if value is not None else default for value in column])
+                except OverflowError:
+                    pass
+                if values is None:
+                    pickled.append(idx)
+                    with open(f'{gen_path}/c{idx}.pickle', 'wb') as f:
+                        pickle.dump(column, f)
+                    continue
+
+            if column_type is str:
+                encoded = [value.encode('utf-8') if value is not None else b'' for value in column]
+                offsets = array('q', [0])
+                for value in encoded:
+                    offsets.append(offsets[-1]+len(value))
+                with open(f'{gen_path}/c{idx}.offsets', 'wb') as f:
+                    offsets.tofile(f)
+                with open(f'{gen_path}/c{idx}.values', 'wb') as f:
+                    f.write(b''.join(encoded))
+            else:
+                with open(f'{gen_path}/c{idx}.values', 'wb') as f:
+                    values.tofile(f)
+            with open(f'{gen_path}/c{idx}.nulls', 'wb') as f:
+                f.write(nulls)
+
+        # the columns must be on disk before the table (that points to this generation) is saved
+        for filename in os.listdir(gen_path):
+            _fsync(f'{gen_path}/{filename}')
+        _fsync(gen_path)
+        _fsync(path)
+        return cls(gen_path, list(column_types), len(rows), has_nulls, pickled)
+
+    def remove_old_generations(self):
+        '''
+        Delete the generation directories that are older than the one of this object.
+        (Processes that have them mapped can still read them.)
+        '''
+        path, current = os.path.split(self.path)
+        for gen in os.listdir(path):
+            if gen.isdigit() and int(gen) < int(current):
+                shutil.rmtree(f'{path}/{gen}', ignore_errors=True)
+
+    @property
+    def modified(self):
+        return self._rows is not None
+
+    def column(self, idx):
+        '''
+        Return the values of a column (without reading the rest of the columns).
+
+        Args:
+            idx: int. Index of the column.
+        '''
+        if self._rows is not None:
+            return [row[idx] for row in self._rows]
+        if idx not in self._columns:
+            column_type = self.column_types[idx]
+            if idx in self.pickled:
+                with open(f'{self.path}/c{idx}.pickle', 'rb') as f:
+                    self._columns[idx] = pickle.load(f)
+                return self._columns[idx]
+            nulls = _map(f'{self.path}/c{idx}.nulls')
+            if column_type is str:
+                column = StrColumn(_map(f'{self.path}/c{idx}.values'), _map(f'{self.path}/c{idx}.offsets', 'q'), nulls)
+            else:
+                column = _map(f'{self.path}/c{idx}.values', TYPECODES[column_type])
+                if self.has_nulls[idx]:
+                    column = NullableColumn(column, nulls)
+            self._columns[idx] = column
+        return self._columns[idx]
+
+    def copy(self):
+        '''
+        Return a copy that can be modified independently (the mapped columns are read only, so they are shared).
+        '''
+        data = ColumnarData(self.path, self.column_types, self.no_of_rows, self.has_nulls, self.pickled)
+        data._columns = self._columns
+        if self._rows is not None:
+            data._rows = list(self._rows)
+        return data
+
+    def _materialize(self):
+        if self._rows is None:
+            self._rows = list(self)
+            self._columns = {}
+        return self._rows
+
+    def __len__(self):
+        return len(self._rows) if self._rows is not None else self.no_of_rows
+
+    def __getitem__(self, index):
+        if self._rows is not None:
+            return self._rows[index]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if not -len(self) <= index < len(self):
+            raise IndexError('index out of range')
+        return [self.column(idx)[index] for idx in range(len(self.column_types))]
+
+    def __iter__(self):
+        if self._rows is not None:
+            return iter(self._rows)
+        return map(list, zip(*[self.column(idx) for idx in range(len(self.column_types))]))
+
+    def __setitem__(self, index, row):
+        self._materialize()[index] = row
+
+    def __delitem__(self, index):
+        del self._materialize()[index]
+
+    def insert(self, index, row):
+        self._materialize().insert(index, row)
+
+
+class TypedColumns(MutableSequence):
+    '''
+    The rows of a table, kept in memory column by column (the 'typed' storage, see Database.__init__). Behaves like
+    the list of rows (Table.data), but rows are only built when they are read, while column(idx) returns a column
+    without building any row.
+
+    int and float columns are typed arrays (8 bytes per value) with a bitmap of their None values. Columns of other
+    types, and columns with values that do not fit in an array (e.g. 'NULL' strings or huge ints), are lists.
+    '''
+    def __init__(self, column_types, rows=()):
+        '''
+        Args:
+            column_types: list. Types of columns.
+            rows: iterable. The initial rows.
+        '''
+        self.column_types = list(column_types)
+        self.columns = [array(TYPECODES[column_type]) if column_type in TYPECODES else [] for column_type in column_types]
+        # a bitmap with a set bit for every None value, for every array column (None for the list columns)
+        self.nulls = [bytearray() if isinstance(column, array) else None for column in self.columns]
+        self.null_counts = [0]*len(self.columns)
+        self.no_of_rows = 0
+        self.extend(rows)
+
+    def column(self, idx):
+        '''
+        Return the values of a column (without building any row). The returned object must not be modified.
+
+        Args:
+            idx: int. Index of the column.
+        '''
+        if self.null_counts[idx]:
+            return NullableColumn(self.columns[idx], self.nulls[idx])
+        return self.columns[idx]
+
+    def copy(self):
+        '''
+        Return a copy that can be modified independently.
+        '''
+        data = TypedColumns(self.column_types)
+        data.columns = [column[:] for column in self.columns]
+        data.nulls = [None if nulls is None else bytearray(nulls) for nulls in self.nulls]
+        data.null_counts = list(self.null_counts)
+        data.no_of_rows = self.no_of_rows
+        return data
+
+    def _index(self, index):
+        if index < 0:
+            index += self.no_of_rows
+        if not 0 <= index < self.no_of_rows:
+            raise IndexError('index out of range')
+        return index
+
+    def _store(self, idx, i, value):
+        '''
+        Store a value in row i of column idx (i equal to the length of the column appends it).
+        '''
+        column = self.columns[idx]
+        if isinstance(column, array):
+            # values of other types (even if they could be converted, e.g. ints in a float column) make it a list
+            if value is None or type(value) is self.column_types[idx]:
+                try:
+                    if i == len(column):
+                        column.append(0 if value is None else value)
+                    else:
+                        column[i] = 0 if value is None else value
+                except OverflowError:
+                    pass
+                else:
+                    self._set_null(idx, i, value is None)
+                    return
+            column = self.columns[idx] = list(self.column(idx))
+            self.nulls[idx] = None
+            self.null_counts[idx] = 0
+        if i == len(column):
+            column.append(value)
+        else:
+            column[i] = value
+
+    def _set_null(self, idx, i, is_null):
+        nulls = self.nulls[idx]
+        if i >> 3 == len(nulls):
+            nulls.append(0)
+        bit = 1 << (i & 7)
+        if is_null and not nulls[i >> 3] & bit:
+            nulls[i >> 3] |= bit
+            self.null_counts[idx] += 1
+        elif not is_null and nulls[i >> 3] & bit:
+            nulls[i >> 3] &= ~bit
+            self.null_counts[idx] -= 1
+
+    def __len__(self):
+        return self.no_of_rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = self._index(index)
+        return [None if nulls is not None and nulls[index >> 3] & (1 << (index & 7)) else column[index]
+                for column, nulls in zip(self.columns, self.nulls)]
+
+    def __iter__(self):
+        return map(list, zip(*[self.column(idx) for idx in range(len(self.columns))]))
+
+    def __setitem__(self, index, row):
+        index = self._index(index)
+        for idx, value in enumerate(row):
+            self._store(idx, index, value)
+
+    def __delitem__(self, index):
+        raise NotImplementedError('Rows cannot be removed from typed columns (replace them with rows of Nones instead).')
+
+    def insert(self, index, row):
+        if index != len(self):
+            raise NotImplementedError('Rows can only be appended to typed columns.')
+        if len(row) != len(self.columns):
+            raise ValueError(f'Expected {len(self.columns)} values, got {len(row)}.')
+        for idx, value in enumerate(row):
+            self._store(idx, self.no_of_rows, value)
+        self.no_of_rows += 1
@@ -0,0 +1,150 @@
+'''
+Compressed storage for the rows of a table, used when the table is saved (and decoded when it is loaded).
+
+Every column is encoded on its own, using the encoding that suits its values:
+    - 'rle': run-length encoding (value, run length) for columns with long runs of the same value (e.g. sorted columns)
+    - 'delta': the differences between consecutive values, bit-packed, for int columns (e.g. ids)
+    - 'dict': a dictionary of the distinct values and a code per row, for columns with few distinct values
+    - 'plain': the values as they are
+The encoded columns are then compressed with a stdlib compressor (zlib, bz2 or lzma).
+'''
+import bz2
+import lzma
+import pickle
+import zlib
+from array import array
+from itertools import groupby
+
+COMPRESSORS = {'zlib': zlib, 'bz2': bz2, 'lzma': lzma}
+
+
+def _smallest_typecode(max_value):
+    '''
+    Return the array typecode of the smallest unsigned type that can hold max_value.
+    '''
+    for typecode in ('B', 'H', 'I', 'Q'):
+        if max_value < 1 << (8*array(typecode).itemsize):
+            return typecode
+    return None
+
+
+def _pack_bits(values, width):
+    '''
+    Pack non negative ints in width bits each.
+    '''
+    if width == 0:
+        return b''
+    bits = ''.join(format(value, f'0{width}b') for value in values)
+    return int(bits, 2).to_bytes((len(bits)+7)//8, 'big')
+
+
+def _unpack_bits(packed, width, count):
+    if width == 0:
+        return [0]*count
+    bits = format(int.from_bytes(packed, 'big'), f'0{width*count}b')
+    return [int(bits[i:i+width], 2) for i in range(0, width*count, width)]
+
+
+def encode_column(values):
+    '''
+    Encode the values of a column. Returns an (encoding, data) tuple.
+
+    Args:
+        values: list. The values of the column.
+    '''
+    if not values:
+        return 'plain', values
+
+    # values are compared together with their type, so that e.g. 1 and 1.0 are not merged
+    runs = [(key[1], len(list(group))) for key, group in groupby(values, key=lambda value: (type(value), value))]
+    if len(runs) <= len(values)//4:
+        lengths = [length for _, length in runs]
+        return 'rle', ([value for value, _ in runs], array(_smallest_typecode(max(lengths)), lengths))
+
+    if all(type(value) is int for value in values):
+        # zigzag encode the deltas, so that small negative differences are small numbers too
+        deltas = [(b-a)*2 if b >= a else (a-b)*2-1 for a, b in zip(values, values[1:])]
+        width = max(deltas, default=0).bit_length()
+        return 'delta', (values[0], width, _pack_bits(deltas, width))
+
+    try:
+        codes = {}
+        for value in values:
+            codes.setdefault((type(value), value), len(codes))
+    except TypeError: # unhashable values (e.g. lists)
+        return 'plain', values
+    if len(codes) <= len(values)//2:
+        return 'dict', ([value for _, value in codes], array(_smallest_typecode(len(codes)), [codes[(type(value), value)] for value in values]))
+
+    return 'plain', values
+
+
+def decode_column(encoding, data, no_of_rows):
+    '''
+    Decode a column encoded with encode_column. Returns the list of its values.
+
+    Args:
+        encoding: string. The encoding of the column.
+        data: The encoded column.
+        no_of_rows: int. Number of values in the column.
+    '''
+    if encoding == 'plain':
+        return data
+    if encoding == 'rle':
+        run_values, lengths = data
+        values = []
+        for value, length in zip(run_values, lengths):
+            values.extend([value]*length)
+        return values
+    if encoding == 'delta':
+        first, width, packed = data
+        values = [first]
+        for delta in _unpack_bits(packed, width, no_of_rows-1):
+            values.append(values[-1] + (delta >> 1 if delta % 2 == 0 else -((delta+1) >> 1)))
+        return values
+    if encoding == 'dict':
+        dictionary, codes = data
+        return [dictionary[code] for code in codes]
+    raise ValueError(f'Unknown column encoding "{encoding}".')
+
+
+class CompressedRows:
+    '''
+    The rows of a table, encoded column by column and compressed. Pickled in place of the list of rows (Table.data).
+    '''
+    def __init__(self, no_of_rows, no_of_columns, compressor, payload):
+        '''
+        Args:
+            no_of_rows: int. Number of rows.
+            no_of_columns: int. Number of columns.
+            compressor: string. Name of the compressor of the payload (see COMPRESSORS).
+            payload: bytes. The compressed (pickled) list of encoded columns.
+        '''
+        self.no_of_rows = no_of_rows
+        self.no_of_columns = no_of_columns
+        self.compressor = compressor
+        self.payload = payload
+
+    @classmethod
+    def encode(cls, rows, no_of_columns, compressor='zlib'):
+        '''
+        Encode and compress the supplied rows.
+
+        Args:
+            rows: list. The rows of the table.
+            no_of_columns: int. Number of columns.
+            compressor: string. One of 'zlib', 'bz2', 'lzma'.
+        '''
+        rows = list(rows)
+        columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in range(no_of_columns)]
+        encoded = [encode_column(column) for column in columns]
+        payload = COMPRESSORS[compressor].compress(pickle.dumps(encoded, protocol=pickle.HIGHEST_PROTOCOL))
+        return cls(len(rows), no_of_columns, compressor, payload)
+
+    def decode(self):
+        '''
+        Return the list of rows.
+        '''
+        encoded = pickle.loads(COMPRESSORS[self.compressor].decompress(self.payload))
+        columns = [decode_column(encoding, data, self.no_of_rows) for encoding, data in encoded]
+        return [list(row) for row in zip(*columns)] if self.no_of_rows else []
@@ -0,0 +1,378 @@
+'''
+WHERE clauses with and, or, not, between and in (see Table._select_where, _update_rows and _delete_where).
+
+A condition is parsed once per query and compiled against the columns of a table into a plan of nodes:
+    column op value           (op: <, <=, =, !=, >=, >. 'value op column' and 'column op column' work too)
+    column [not] between low and high
+    column [not] in (value, value, ...)
+combined with and/or/not and parentheses (not binds tighter than and, and tighter than or).
+
+'not' is pushed down to the comparisons while compiling (e.g. not x>5 -> x<=5), so a NULL value never matches a
+comparison, negated or not. Every node is a callable that checks a single row, and can also find the matching rows
+of a table: comparisons scan their column at once (see misc.find_rows), the operands of an and are evaluated from
+the most to the least selective one (each only checks the rows that are left) and the operands of an or from the
+least to the most selective one (each only checks the rows that have not matched yet).
+'''
+import re
+from copy import copy
+
+from misc import OPERATORS, find_rows, get_op, reverse_op
+
+TOKENS = re.compile(r'\s*(?:("[^"]*")|(>=|<=|!=|=|>|<)|([(),])|([^\s()<>=!,"]+))')
+KEYWORDS = {'and', 'or', 'not', 'between', 'in'}
+NEGATED = {'>': '<=', '<=': '>', '<': '>=', '>=': '<', '=': '!=', '!=': '='}
+
+# selectivity estimates (fraction of the rows that match), for when nothing better is known (as in System R)
+EQUALITY = 0.1
+RANGE = 1/3
+BETWEEN = 0.25
+
+
+def compile_condition(condition, table):
+    '''
+    Parse a condition and compile it against the columns of a table (values are casted to the types of their columns).
+    Returns the root node of the plan (see the module's docstring).
+
+    Args:
+        condition: string. The condition (e.g. 'salary>80000 and (dept_name="comp. sci." or name in (wu, kim))').
+        table: Table. The table whose rows are checked (only its columns are used, the plan can be reused for its versions).
+    '''
+    return _Parser(condition, table).parse()
+
+
+class _Parser:
+    '''
+    Recursive descent parser:
+        or_expr    := and_expr ('or' and_expr)*
+        and_expr   := not_expr ('and' not_expr)*
+        not_expr   := 'not' not_expr | '(' or_expr ')' | predicate
+        predicate  := operand op operand | operand ['not'] 'between' operand 'and' operand
+                      | operand ['not'] 'in' '(' operand (',' operand)* ')'
+    '''
+    def __init__(self, condition, table):
+        self.condition = condition
+        self.table = table
+        self.tokens = []
+        position = 0
+        condition = condition.rstrip()
+        while position < len(condition):
+            match = TOKENS.match(condition, position)
+            if match is None or match.end() == position:
+                raise ValueError(f'Invalid condition: {self.condition}\nUnexpected "{condition[position:].strip()}".')
+            quoted, op, punctuation, word = match.groups()
+            if quoted is not None:
+                self.tokens.append(('value', quoted[1:-1]))
+            elif op is not None:
+                self.tokens.append(('op', op))
+            elif punctuation is not None:
+                self.tokens.append((punctuation, punctuation))
+            elif word in KEYWORDS:
+                self.tokens.append((word, word))
+            else:
+                self.tokens.append(('word', word))
+            position = match.end()
+        self.position = 0
+
+    def parse(self):
+        node = self._or()
+        if self.position < len(self.tokens):
+            self._fail(f'Unexpected "{self.tokens[self.position][1]}".')
+        return node
+
+    def _fail(self, message):
+        raise ValueError(f'Invalid condition: {self.condition}\n{message}')
+
+    def _peek(self):
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def _next(self, *kinds):
+        if self._peek() not in kinds:
+            found = 'the end of the condition' if self._peek() is None else f'"{self.tokens[self.position][1]}"'
+            self._fail(f'Expected {" or ".join(kinds)} instead of {found}.')
+        self.position += 1
+        return self.tokens[self.position-1][1]
+
+    def _or(self):
+        operands = [self._and()]
+        while self._peek() == 'or':
+            self._next('or')
+            operands.append(self._and())
+        return operands[0] if len(operands) == 1 else Or(operands)
+
+    def _and(self):
+        operands = [self._not()]
+        while self._peek() == 'and':
+            self._next('and')
+            operands.append(self._not())
+        return operands[0] if len(operands) == 1 else And(operands)
+
+    def _not(self):
+        if self._peek() == 'not':
+            self._next('not')
+            return self._not().negate()
+        if self._peek() == '(':
+            self._next('(')
+            node = self._or()
+            self._next(')')
+            return node
+        return self._predicate()
+
+    def _predicate(self):
+        left = self._next('word', 'value')
+        negated = self._peek() == 'not'
+        if negated:
+            self._next('not')
+            if self._peek() not in ('between', 'in'):
+                self._fail('Expected between or in after not.')
+
+        if self._peek() == 'between':
+            self._next('between')
+            low = self._next('word', 'value')
+            self._next('and')
+            high = self._next('word', 'value')
+            column = self._column(left)
+            return Between(self.table, column, self._cast(column, low), self._cast(column, high), negated)
+
+        if self._peek() == 'in':
+            self._next('in')
+            self._next('(')
+            values = [self._next('word', 'value')]
+            while self._peek() == ',':
+                self._next(',')
+                values.append(self._next('word', 'value'))
+            self._next(')')
+            column = self._column(left)
+            return In(self.table, column, [self._cast(column, value) for value in values], negated)
+
+        op = self._next('op')
+        right = self._next('word', 'value')
+        columns = self.table.column_names
+        if left in columns and right in columns and self.tokens[self.position-1][0] == 'word':
+            return ColumnComparison(self.table, left, op, right)
+        if left not in columns and right in columns: # value op column
+            left, op, right = right, reverse_op(op), left
+        column = self._column(left)
+        return Comparison(self.table, column, op, self._cast(column, right))
+
+    def _column(self, name):
+        if name not in self.table.column_names:
+            self._fail(f'Cant find column "{name}".')
+        return name
+
+    def _cast(self, column, value):
+        return self.table.column_types[self.table.column_names.index(column)](value)
+
+
+class Comparison:
+    '''
+    column op value
+    '''
+    def __init__(self, table, column, op, value):
+        self.column = column
+        self.op = op
+        self.value = value
+        self.column_idx = table.column_names.index(column)
+        self.is_pk = self.column_idx == table.pk_idx
+        self._compare = OPERATORS[op]
+
+    def __call__(self, row):
+        value = row[self.column_idx]
+        return value is not None and get_op(self.op, value, self.value)
+
+    def __repr__(self):
+        return f'{self.column}{self.op}{self.value!r}'
+
+    def negate(self):
+        negated = copy(self)
+        negated.op = NEGATED[self.op]
+        negated._compare = OPERATORS[negated.op]
+        return negated
+
+    def selectivity(self, table):
+        if self.op in ('=', '!='):
+            estimate = 1/max(len(table.data), 1) if self.is_pk else EQUALITY
+            return estimate if self.op == '=' else 1-estimate
+        return RANGE
+
+    def rows(self, table, candidates=None):
+        column = table.column_by_name(self.column)
+        if candidates is None:
+            return find_rows(column, self.op, self.value)
+        compare, value = self._compare, self.value
+        try:
+            return [i for i in candidates if column[i] is not None and compare(column[i], value)]
+        except TypeError: # values of other types (e.g. 'NULL' strings in an int column)
+            return [i for i in candidates if get_op(self.op, column[i], value)]
+
+
+class ColumnComparison:
+    '''
+    column op column (of the same row)
+    '''
+    def __init__(self, table, left, op, right):
+        self.left, self.op, self.right = left, op, right
+        self.left_idx = table.column_names.index(left)
+        self.right_idx = table.column_names.index(right)
+
+    def __call__(self, row):
+        left, right = row[self.left_idx], row[self.right_idx]
+        return left is not None and right is not None and get_op(self.op, left, right)
+
+    def __repr__(self):
+        return f'{self.left}{self.op}{self.right}'
+
+    def negate(self):
+        negated = copy(self)
+        negated.op = NEGATED[self.op]
+        return negated
+
+    def selectivity(self, table):
+        return EQUALITY if self.op == '=' else 1-EQUALITY if self.op == '!=' else RANGE
+
+    def rows(self, table, candidates=None):
+        left, right = table.column_by_name(self.left), table.column_by_name(self.right)
+        if candidates is None:
+            candidates = range(len(left))
+        return [i for i in candidates if left[i] is not None and right[i] is not None and get_op(self.op, left[i], right[i])]
+
+
+class Between:
+    '''
+    column [not] between low and high (inclusive)
+    '''
+    def __init__(self, table, column, low, high, negated=False):
+        self.column, self.low, self.high, self.negated = column, low, high, negated
+        self.column_idx = table.column_names.index(column)
+
+    def __call__(self, row):
+        return self._check(row[self.column_idx])
+
+    def __repr__(self):
+        return f'{self.column} {"not " if self.negated else ""}between {self.low!r} and {self.high!r}'
+
+    def _check(self, value):
+        try:
+            return value is not None and (self.low <= value <= self.high) != self.negated
+        except TypeError:
+            return False
+
+    def negate(self):
+        negated = copy(self)
+        negated.negated = not self.negated
+        return negated
+
+    def selectivity(self, table):
+        return 1-BETWEEN if self.negated else BETWEEN
+
+    def rows(self, table, candidates=None):
+        column = table.column_by_name(self.column)
+        if candidates is None:
+            if not self.negated: # two vectorized scans
+                high = set(find_rows(column, '<=', self.high))
+                return [i for i in find_rows(column, '>=', self.low) if i in high]
+            candidates = range(len(column))
+        check = self._check
+        return [i for i in candidates if check(column[i])]
+
+
+class In:
+    '''
+    column [not] in (value, value, ...)
+    '''
+    def __init__(self, table, column, values, negated=False):
+        self.column, self.values, self.negated = column, frozenset(values), negated
+        self.column_idx = table.column_names.index(column)
+        self.is_pk = self.column_idx == table.pk_idx
+
+    def __call__(self, row):
+        value = row[self.column_idx]
+        return value is not None and (value in self.values) != self.negated
+
+    def __repr__(self):
+        return f'{self.column} {"not " if self.negated else ""}in {tuple(sorted(self.values))}'
+
+    def negate(self):
+        negated = copy(self)
+        negated.negated = not self.negated
+        return negated
+
+    def selectivity(self, table):
+        estimate = len(self.values)*(1/max(len(table.data), 1) if self.is_pk else EQUALITY)
+        estimate = min(estimate, 1)
+        return 1-estimate if self.negated else estimate
+
+    def rows(self, table, candidates=None):
+        column = table.column_by_name(self.column)
+        if candidates is None:
+            candidates = range(len(column))
+        values, negated = self.values, self.negated
+        return [i for i in candidates if column[i] is not None and (column[i] in values) != negated]
+
+
+class And:
+    '''
+    operand and operand and ...
+    '''
+    def __init__(self, operands):
+        self.operands = operands
+        self._ordered = operands # in the order of the last rows() call
+
+    def __call__(self, row):
+        return all(operand(row) for operand in self._ordered)
+
+    def __repr__(self):
+        return '(' + ' and '.join(map(repr, self.operands)) + ')'
+
+    def negate(self):
+        return Or([operand.negate() for operand in self.operands])
+
+    def selectivity(self, table):
+        estimate = 1
+        for operand in self.operands:
+            estimate *= operand.selectivity(table)
+        return estimate
+
+    def rows(self, table, candidates=None):
+        # the operand that rejects the most rows goes first, so the rest check as few rows as possible
+        self._ordered = sorted(self.operands, key=lambda operand: operand.selectivity(table))
+        for operand in self._ordered:
+            candidates = operand.rows(table, candidates)
+            if not candidates:
+                break
+        return candidates
+
+
+class Or:
+    '''
+    operand or operand or ...
+    '''
+    def __init__(self, operands):
+        self.operands = operands
+        self._ordered = operands # in the order of the last rows() call
+
+    def __call__(self, row):
+        return any(operand(row) for operand in self._ordered)
+
+    def __repr__(self):
+        return '(' + ' or '.join(map(repr, self.operands)) + ')'
+
+    def negate(self):
+        return And([operand.negate() for operand in self.operands])
+
+    def selectivity(self, table):
+        estimate = 1
+        for operand in self.operands:
+            estimate *= 1-operand.selectivity(table)
+        return 1-estimate
+
+    def rows(self, table, candidates=None):
+        # the operand that matches the most rows goes first, so the rest check as few rows as possible
+        self._ordered = sorted(self.operands, key=lambda operand: operand.selectivity(table), reverse=True)
+        matched = set()
+        remaining = candidates
+        for operand in self._ordered:
+            matched.update(operand.rows(table, remaining))
+            remaining = [i for i in (range(len(table.data)) if remaining is None else remaining) if i not in matched]
+            if not remaining:
+                break
+        return sorted(matched)
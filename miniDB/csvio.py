@@ -0,0 +1,126 @@
+'''
+Reading tables from and writing tables to CSV files (see Database.import_table and Database.export).
+
+Files are read in chunks of rows, so they never have to fit in memory. Every chunk is parsed with the csv module
+(quoted fields may contain commas, quotes and newlines) and its values are casted column by column. Chunks can be
+parsed by a pool of worker processes, while the main process inserts the parsed rows.
+Rows are written one by one, through a buffered file, as they are read from the table.
+
+Files can be compressed (gzip, bz2 or lzma). The compression is inferred from the extension of the file
+(.gz, .bz2, .xz) unless it is specified.
+'''
+import bz2
+import csv
+import gzip
+import lzma
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+COMPRESSIONS = {'gzip': gzip, 'bz2': bz2, 'lzma': lzma}
+EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'lzma'}
+BUFFER_SIZE = 1 << 20
+
+
+def open_file(filename, mode='r', compression=None):
+    '''
+    Open a CSV file in text mode (as the csv module expects it).
+
+    Args:
+        filename: string. Path of the file.
+        mode: string. 'r' or 'w'.
+        compression: string. 'gzip', 'bz2' or 'lzma' (inferred from the extension of the file if None).
+    '''
+    if compression is None:
+        compression = EXTENSIONS.get(filename[filename.rfind('.'):])
+    if compression is None:
+        return open(filename, mode, newline='', buffering=BUFFER_SIZE)
+    if compression not in COMPRESSIONS:
+        raise ValueError(f'Unknown compression "{compression}". Use one of {", ".join(COMPRESSIONS)}.')
+    return COMPRESSIONS[compression].open(filename, mode+'t', newline='')
+
+
+def read_header(file):
+    '''
+    Read the first row of a CSV file (the column names).
+
+    Args:
+        file: file object. Opened in text mode with newline=''.
+    '''
+    return next(csv.reader([file.readline()]))
+
+
+def read_chunks(file, chunk_size=10000):
+    '''
+    Split the (rest of the) lines of a CSV file in chunks of about chunk_size rows. Returns a generator of lists of lines.
+    A chunk never ends inside a quoted field: a row continues on the next line while it has an odd number of quotes
+    (escaped quotes come in pairs).
+
+    Args:
+        file: file object. Opened in text mode with newline=''.
+        chunk_size: int. Number of lines per chunk.
+    '''
+    chunk = []
+    in_quotes = False
+    for line in file:
+        chunk.append(line)
+        if line.count('"') % 2 == 1:
+            in_quotes = not in_quotes
+        if len(chunk) >= chunk_size and not in_quotes:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_chunk(lines, schema):
+    '''
+    Parse a chunk of CSV lines and cast the values to the types of the columns. Returns the list of rows.
+    Empty lines are skipped.
+
+    Args:
+        lines: list. The lines of the chunk (see read_chunks).
+        schema: Table. A table with the columns of the rows (used to cast them, see Table._cast_rows).
+    '''
+    rows = [row for row in csv.reader(lines) if row]
+    schema._cast_rows(rows)
+    return rows
+
+
+def parse(file, schema, chunk_size=10000, workers=None):
+    '''
+    Parse the (rest of the) rows of a CSV file. Returns a generator of chunks (lists of casted rows), in file order.
+
+    Args:
+        file: file object. Opened in text mode with newline=''.
+        schema: Table. A table with the columns of the rows (without rows, it is sent to the worker processes).
+        chunk_size: int. Number of rows per chunk.
+        workers: int. Number of worker processes that parse the chunks (None to parse them in this process).
+    '''
+    if not workers:
+        yield from map(parse_chunk, read_chunks(file, chunk_size), repeat(schema))
+        return
+    with ProcessPoolExecutor(workers) as executor:
+        # only a few chunks are read ahead, so that memory use does not depend on the size of the file
+        pending = deque()
+        for chunk in read_chunks(file, chunk_size):
+            pending.append(executor.submit(parse_chunk, chunk, schema))
+            if len(pending) > 2*workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def write(file, column_names, rows):
+    '''
+    Write the column names and the rows of a table to a CSV file. Deleted rows (filled with Nones) are skipped and
+    None values are written as NULL.
+
+    Args:
+        file: file object. Opened in text mode with newline='' (see open_file).
+        column_names: list. The names of the columns.
+        rows: iterable. The rows of the table (read as they are written).
+    '''
+    writer = csv.writer(file)
+    writer.writerow(column_names)
+    writer.writerows(['NULL' if value is None else value for value in row] for row in rows if any(value is not None for value in row))
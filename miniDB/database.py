@@ -2,9 +2,13 @@ from __future__ import annotations
 import pickle
 from time import sleep, localtime, strftime
 import os,sys
+import shutil
+import threading
+import weakref
 import logging
 import warnings
 import readline
+from contextlib import contextmanager
 from tabulate import tabulate
 
 sys.path.append(f'{os.path.dirname(os.path.dirname(os.path.abspath(__file__)))}/miniDB')
@@ -13,8 +17,16 @@ sys.modules['table'] = table
 
 from joins import Inlj, Smj
 from btree import Btree
-from misc import split_condition
-from table import Table
+from conditions import compile_condition, Comparison
+from table import Table, AGGREGATE
+from catalog import Catalog
+from heapfile import HeapFile, buffer_pool
+from columnar import ColumnarData, TypedColumns
+import columnar
+from compression import CompressedRows
+import csvio
+from locks import LockManager
+import wal
 
 
 # readline.clear_history()
@@ -24,13 +36,82 @@ class Database:
     Main Database class, containing tables.
     '''
 
-    def __init__(self, name, load=True, verbose = True):
-        self.tables = {}
+    def __init__(self, name, load=True, verbose = True, checkpoint_interval=1000, storage='pickle', buffer_pool_pages=256, auto_vacuum=None, compressor='zlib', commit_window=0, lock_timeout=10):
+        '''
+        Args:
+            name: string. Name of the database.
+            load: boolean. Whether to load the database if it exists.
+            verbose: boolean. Whether to print/warn about the operations.
+            checkpoint_interval: int. Number of write-ahead log records after which the tables are saved and the log emptied.
+            storage: string. How the rows of the new (non meta) tables are stored:
+                'pickle': pickled with the table in a single file.
+                'heap': in a paged heap file, read and written through the buffer pool.
+                'columnar': column by column, in memory-mapped files (only for tables with int/float/str columns).
+                'compressed': pickled with the table, after every column is encoded (dictionary, run-length or
+                    delta encoding) and compressed (see compression.py). The rows are decoded when the table is loaded.
+                'typed': pickled with the table. In memory, the rows are kept column by column, int and float columns
+                    in typed arrays (see columnar.TypedColumns), which takes a fraction of the memory of lists of rows.
+            buffer_pool_pages: int. Number of pages the (process wide) buffer pool keeps in memory.
+            auto_vacuum: float. If set, a table is vacuumed after a delete when more than this fraction of its rows
+                are deleted rows (None to vacuum only with the vacuum command).
+            compressor: string. The compressor used by the 'compressed' storage ('zlib', 'bz2' or 'lzma').
+            commit_window: float. Seconds a write-ahead log flush waits for the records of concurrent statements,
+                so that they are flushed together (group commit).
+            lock_timeout: float. Seconds a statement waits for a table that is locked by another thread or process
+                before it fails (None to wait forever).
+        '''
+        # tables are loaded the first time they are accessed (see load_database)
+        self.tables = Catalog(self._load_table)
         self._name = name
         self.verbose = verbose
+        self.storage = storage
+        self.auto_vacuum = auto_vacuum
+        self.compressor = compressor
+        buffer_pool.resize(buffer_pool_pages)
+        # table_name -> (table object, table version) at the time the table was last saved or loaded.
+        # Used to detect which tables are dirty and need to be written back to disk.
+        self._saved = {}
+        # same as above, for the last time the table's row count was stored in meta_length
+        self._counted = {}
+        # table_name -> (mtime, size, inode) of the table's file when it was last loaded or saved by this object
+        self._stats = {}
+        # files that saved tables no longer need (replaced heap pages, old column generations). Released by _sync_dir,
+        # once the new table files are durable, since a crash before that may leave the old table files in place
+        self._cleanups = []
 
         self.savedir = f'dbdata/{name}_db'
 
+        # table locks (shared or exclusive). Kept in memory and, across processes, as file locks under savedir/locks
+        self.lock_manager = LockManager(f'{self.savedir}/locks', lock_timeout)
+        # writers publish new versions of the tables under this lock, every version is tagged with a transaction id
+        self._versions_lock = threading.RLock()
+        self._xid = 0
+        # the versions that readers got (see _snapshot). A version that no reader has seen is modified in place
+        # by the next writer, instead of a copy of it (see _write_version)
+        self._read_versions = weakref.WeakSet()
+        # table_name -> (version, thread) of the tables that are being modified in place. Other threads read them
+        # as they were published (see Table._published)
+        self._writing = {}
+        # the state of the transaction (see begin) that every thread is running, if any
+        self._local = threading.local()
+
+        # inserts/updates/deletes are appended to the write-ahead log. The tables that have changes in the log
+        # (pending) are written to their files every checkpoint_interval records.
+        self.wal = wal.WriteAheadLog(f'{self.savedir}/wal.log', commit_window)
+        self.checkpoint_interval = checkpoint_interval
+        self._wal_pending = set()
+        self._wal_records = {} # table_name -> list of (operation, args) in the log. Replayed when the table is loaded
+        self._wal_stat = None
+
+        if load and os.path.isfile(self.wal.path):
+            # a record that was being appended when a process crashed is cut off (with no other process appending)
+            acquired = self.lock_manager.acquire(wal.LOCK, 'x')
+            try:
+                self.wal.recover()
+            finally:
+                if acquired:
+                    self.lock_manager.release(wal.LOCK)
+
         if load:
             try:
                 self.load_database()
@@ -52,44 +133,293 @@ class Database:
 
         # create all the meta tables
         self.create_table('meta_length', 'table_name,no_of_rows', 'str,int')
-        self.create_table('meta_locks', 'table_name,pid,mode', 'str,int,str')
         self.create_table('meta_insert_stack', 'table_name,indexes', 'str,list')
         self.create_table('meta_indexes', 'table_name,index_name', 'str,str')
         self.save_database()
 
     def save_database(self):
         '''
-        Save database as a pkl file. This method saves the database object, including all tables and attributes.
+        Save database as a pkl file. Only the tables that changed since they were last saved or loaded (dirty tables) are written.
+        Changes that are in the write-ahead log are written to the table files on checkpoints.
         '''
-        for name, table in self.tables.items():
-            with open(f'{self.savedir}/{name}.pkl', 'wb') as f:
-                pickle.dump(table, f)
+        if self.in_transaction(): # saved once, when the transaction commits
+            return
+        dirty = [name for name in self.tables.keys() if self._is_dirty(name)]
+        # if a table with logged changes has also changed in a way that is not logged (e.g. sort), its file must
+        # be brought up to date before the log is emptied. So we checkpoint.
+        if self._wal_pending.intersection(dirty) or self.wal.no_of_records >= self.checkpoint_interval:
+            self.checkpoint()
+            return
+        if not dirty:
+            return
+        # (not while another process checkpoints, see checkpoint)
+        acquired = self.lock_manager.acquire(wal.LOCK, 's')
+        try:
+            for name in dirty:
+                self._save_table(name, sync=False)
+            self._sync_dir()
+        finally:
+            if acquired:
+                self.lock_manager.release(wal.LOCK)
 
-    def _save_locks(self):
+    def checkpoint(self):
         '''
-        Stores the meta_locks table to file as meta_locks.pkl.
+        Write the tables with changes in the write-ahead log (and every other dirty table) to their files and empty the log.
         '''
-        with open(f'{self.savedir}/meta_locks.pkl', 'wb') as f:
-            pickle.dump(self.tables['meta_locks'], f)
+        if self.in_transaction(): # saved once, when the transaction commits
+            return
+        # other processes neither append to the log nor save tables until the log is emptied (they hold the log
+        # lock in shared mode while they do, see _log and save_database)
+        acquired = self.lock_manager.acquire(wal.LOCK, 'x')
+        try:
+            # the tables that other processes saved are loaded again, so that their changes are not overwritten
+            for name in self.tables.keys():
+                if self.tables.is_loaded(name) and not self._is_dirty(name) and \
+                        self._stats.get(name) != self._stat(f'{self.savedir}/{name}.pkl'):
+                    self._evict(name)
+            # records appended by other processes must make it to the table files too
+            self._refresh_log()
+            for name in self.tables.keys():
+                if name in self._wal_pending or self._is_dirty(name):
+                    self._save_table(name, sync=False)
+            # the saved tables (their pages/columns, see _save_table, and the renamed files) must be on disk before the log is emptied
+            self._sync_dir()
+            self.wal.truncate()
+            self._wal_pending.clear()
+            self._wal_records = {}
+            self._wal_stat = self._stat(self.wal.path)
+        finally:
+            if acquired:
+                self.lock_manager.release(wal.LOCK)
+
+    def _log(self, operation, table_name, *args):
+        '''
+        Append an operation on a table to the write-ahead log. The table does not need to be saved afterwards.
 
-    def load_database(self):
+        Args:
+            operation: int. One of wal.INSERT, wal.UPDATE, wal.DELETE.
+            table_name: string. Table name (must be part of database).
+            args: The arguments of the operation (see wal.py).
         '''
-        Load all tables that are part of the database (indices noted here are loaded).
+        if table_name[:4]=='meta': # meta tables are small, they are always saved as a whole
+            return
+        if self.in_transaction(): # the tables are saved when the transaction commits
+            return
+        table = self.tables[table_name]
+        acquired = self.lock_manager.acquire(wal.LOCK, 's')
+        try:
+            before = self._stat(self.wal.path)
+            size = self.wal.append(operation, table_name, *args)
+            after = self._stat(self.wal.path)
+        finally:
+            if acquired:
+                self.lock_manager.release(wal.LOCK)
+        self._wal_pending.add(table_name)
+        self._wal_records.setdefault(table_name, []).append((operation, args))
+        # the records in memory are up to date only if no one else appended to the log (or emptied it) meanwhile.
+        # Otherwise the log is read again (see _refresh_log)
+        if before == self._wal_stat and after is not None and after[1] == (0 if before is None else before[1])+size:
+            self._wal_stat = after
+        # if the logged operation is the only change since the table was last saved, the table counts as saved
+        saved_table, saved_version = self._saved.get(table_name, (None, None))
+        if saved_table is table and saved_version == table._version-1:
+            self._saved[table_name] = (table, table._version)
+
+    def _save_table(self, table_name, sync=True):
+        '''
+        Stores the specified table to file as table_name.pkl and marks it as clean.
+        The file is replaced atomically, so a crash while saving leaves the previous version of the table in place.
 
         Args:
-            path: string. Directory (path) of the database on the system.
+            table_name: string. Table name (must be part of database).
+            sync: boolean. If False, the caller needs to call _sync_dir to make the new file durable (useful when saving many tables).
+                The files that the previous version of the table used are only released then.
+        '''
+        table = self.tables[table_name]
+        if table._storage == 'heap':
+            # the rows are kept in a heap file (and are not part of the pickled table). Only modified pages are written,
+            # next to the pages of the saved layout, which is replaced by the new one below (see heapfile.py)
+            if isinstance(table.data, HeapFile):
+                table.data.flush()
+            else:
+                table.data = HeapFile.create(f'{self.savedir}/{table_name}.heap', table.data)
+        elif table._storage == 'columnar' and columnar.is_supported(table.column_types):
+            # the columns are written (in a new generation) only if the rows changed
+            if not isinstance(table.data, ColumnarData) or table.data.modified:
+                table.data = ColumnarData.create(f'{self.savedir}/{table_name}.cols', table.data, table.column_types)
+        elif table._storage == 'typed':
+            # statements that replace all the rows (e.g. sort, vacuum) or change the column types (cast) leave lists of rows
+            if not isinstance(table.data, TypedColumns) or table.data.column_types != table.column_types:
+                table.data = TypedColumns(table.column_types, table.data)
+        data = table.data
+        if table._storage == 'compressed':
+            # the encoded rows are pickled in place of the rows
+            table.data = CompressedRows.encode(data, len(table.column_names), self.compressor)
+        try:
+            self._write_file(f'{self.savedir}/{table_name}.pkl', table)
+        finally:
+            table.data = data
+        if isinstance(table.data, ColumnarData):
+            self._cleanups.append(table.data.remove_old_generations)
+        elif isinstance(table.data, HeapFile):
+            self._cleanups.append(table.data.saved)
+        if sync:
+            self._sync_dir()
+        self._saved[table_name] = (table, table._version)
+        self._stats[table_name] = self._stat(f'{self.savedir}/{table_name}.pkl')
+
+    def _write_file(self, filename, obj):
+        '''
+        Pickle an object to a file. The object is written (and flushed to disk) in a temporary file, which is then
+        renamed to filename, so readers (and a restart after a crash) see either the old or the new file, never a partial one.
+
+        Args:
+            filename: string. Path of the file.
+            obj: The object that will be pickled.
+        '''
+        tmp_filename = f'{filename}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_filename, 'wb') as f:
+                pickle.dump(obj, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_filename, filename)
+        except BaseException:
+            if os.path.isfile(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+
+    def _sync_dir(self, path=None):
+        '''
+        Flush the database directory to disk, so that the files renamed into it (see _write_file) survive a crash.
+        Then the files that the previous versions of the saved tables used are released.
+
+        Args:
+            path: string. The directory to flush (the database directory if None).
+        '''
+        fd = os.open(path or self.savedir, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        if path is None:
+            cleanups, self._cleanups = self._cleanups, []
+            for cleanup in cleanups:
+                cleanup()
+
+    def _is_dirty(self, table_name):
         '''
+        Check whether the specified table has been modified (or replaced) since it was last saved or loaded.
+
+        Args:
+            table_name: string. Table name (must be part of database).
+        '''
+        if not self.tables.is_loaded(table_name): # tables that are not in memory have not been modified
+            return False
+        table = self.tables[table_name]
+        saved_table, saved_version = self._saved.get(table_name, (None, None))
+        return saved_table is not table or saved_version != table._version
+
+    def load_database(self):
+        '''
+        Register all tables that are part of the database. A table is only loaded the first time it is accessed
+        and is then kept in memory. Tables whose file has been modified (e.g. by another process) since they were
+        loaded or saved by this object are evicted, so that they are loaded again on their next access.
+        The same goes for the tables with new records in the write-ahead log.
+        '''
+        if self.in_transaction(): # the transaction works on the tables as they were when it started
+            return
         path = f'dbdata/{self._name}_db'
+        on_disk = set()
         for file in os.listdir(path):
 
             if file[-3:]!='pkl': # if used to load only pkl files
                 continue
-            f = open(path+'/'+file, 'rb')
-            tmp_dict = pickle.load(f)
-            f.close()
             name = f'{file.split(".")[0]}'
-            self.tables.update({name: tmp_dict})
-            # setattr(self, name, self.tables[name])
+            on_disk.add(name)
+            self.tables.register(name)
+            if self.tables.is_loaded(name) and self._stats.get(name) != self._stat(path+'/'+file):
+                self._evict(name)
+
+        # tables dropped by another process
+        for name in list(self._stats):
+            if name not in on_disk and name in self.tables:
+                del self.tables[name]
+                self._evict(name)
+
+        self._refresh_log()
+
+    def _refresh_log(self):
+        '''
+        Re-read the write-ahead log if it was modified by another process. The (unmodified) tables that have
+        records in the log are evicted, so that they are loaded and the records are replayed on their next access.
+        '''
+        wal_stat = self._stat(self.wal.path)
+        if wal_stat == self._wal_stat:
+            return
+        # built aside and then assigned, so that tables loaded meanwhile (by other threads) never see a partial log
+        records = {}
+        for operation, table_name, args in self.wal.read():
+            records.setdefault(table_name, []).append((operation, args))
+        self._wal_records = records
+        for name in records:
+            if not self._is_dirty(name):
+                self._evict(name)
+        self._wal_pending = set(records).intersection(self.tables.keys())
+        self._wal_stat = wal_stat
+
+    def _load_table(self, table_name):
+        '''
+        Load a table from its pkl file and replay its changes that are in the write-ahead log (but not yet in the file).
+        Called by the catalog (self.tables) the first time a table is accessed.
+
+        Args:
+            table_name: string. Table name (must be part of database).
+        '''
+        filename = f'{self.savedir}/{table_name}.pkl'
+        stat = self._stat(filename)
+        with open(filename, 'rb') as f:
+            table = pickle.load(f)
+        if isinstance(table.data, CompressedRows):
+            table.data = table.data.decode()
+        self.tables.set_loaded(table_name, table)
+        self._stats[table_name] = stat
+        self._counted[table_name] = (table, table._version)
+
+        records = self._wal_records.get(table_name, [])
+        for operation, args in records:
+            wal.redo(table, operation, args)
+        self._saved[table_name] = (table, table._version)
+        if records:
+            self._recover_insert_stack(table_name)
+        return table
+
+    def _evict(self, table_name):
+        '''
+        Forget the in-memory state of a table, so that it is loaded again from disk on its next access.
+
+        Args:
+            table_name: string. Table name.
+        '''
+        self.tables.evict(table_name)
+        for state in (self._saved, self._counted, self._stats):
+            state.pop(table_name, None)
+
+    def _stat(self, filename):
+        '''
+        Return the (modification time, size, inode) of a file, or None if it does not exist.
+        Used to cheaply detect whether a file was modified since it was last read. Modification times are coarse
+        (a file can be rewritten with the same size and time), but saved files are replaced (see _write_file),
+        so their inode changes.
+
+        Args:
+            filename: string. Path of the file.
+        '''
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
 
     #### IO ####
 
@@ -97,9 +427,111 @@ class Database:
         '''
         Update all meta tables.
         '''
-        self._update_meta_length()
+        if not self.in_transaction(): # rows are counted once, when the transaction commits
+            self._update_meta_length()
         self._update_meta_insert_stack()
 
+    @contextmanager
+    def batch(self):
+        '''
+        Execute many statements (e.g. a SQL script) as a single transaction (see begin):
+
+            with db.batch():
+                db.insert_into('instructor', '...')
+                ...
+
+        The transaction is committed when the block ends. If an exception is raised, it is rolled back and the
+        exception propagates. Nested batches are part of the outermost one.
+        '''
+        if self.in_transaction():
+            yield self
+            return
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        else:
+            self.commit()
+
+    def begin(self):
+        '''
+        Start a transaction (in the calling thread). The database is loaded once, now, and saved once, on commit.
+        In between, the changes of the statements are kept in memory and are only visible to the calling thread,
+        and the tables that the statements lock (e.g. the tables they modify) stay locked.
+        Note: index files are written (and the files of dropped tables removed) right away, so index and drop
+        statements are not rolled back. (The indexes that other statements would rebuild, e.g. vacuum, are rebuilt
+        when the transaction commits.)
+        '''
+        if self.in_transaction():
+            raise Exception('A transaction is already in progress.')
+        self.load_database()
+        # (indexes: the tables whose indexes are rebuilt when the transaction commits, see _rebuild_indexes)
+        self._local.transaction = {'locks': [], 'in_place': set(), 'indexes': set()}
+        self.tables.begin()
+        # the meta tables are modified in place, so the transaction works on copies of them
+        for name in ('meta_length', 'meta_insert_stack', 'meta_indexes'):
+            self.tables[name] = self.tables[name]._copy()
+
+    def commit(self):
+        '''
+        Commit the transaction of the calling thread (see begin): its changes become visible to everyone and are
+        saved, and its locks are released.
+        '''
+        if not self.in_transaction():
+            raise Exception('No transaction in progress.')
+        self._end_transaction(commit=True)
+
+    def rollback(self):
+        '''
+        Roll back the transaction of the calling thread (see begin): its changes are discarded and its locks are released.
+        '''
+        if not self.in_transaction():
+            raise Exception('No transaction in progress.')
+        self._end_transaction(commit=False)
+
+    def in_transaction(self):
+        '''
+        Check whether the calling thread has a transaction in progress (see begin).
+        '''
+        return getattr(self._local, 'transaction', None) is not None
+
+    def _end_transaction(self, commit):
+        '''
+        Commit (publish and save) or roll back the changes of the transaction of the calling thread and release its locks.
+
+        Args:
+            commit: boolean. Whether to commit the changes (if False, they are rolled back).
+        '''
+        state = self._local.transaction
+        self._local.transaction = None
+        private = self.tables.end()
+        try:
+            if commit:
+                with self._versions_lock: # all the changes become visible at once
+                    for name, table in private.items():
+                        self._publish(name, table)
+                self._update()
+                # the logged changes of the tables that the transaction dropped must not be replayed on new tables (see drop_table)
+                if self._wal_pending.difference(self.tables.keys()):
+                    self.checkpoint()
+                else:
+                    self.save_database()
+                for name in state['indexes']:
+                    if name in self.tables:
+                        self._rebuild_indexes(name)
+            else:
+                # heap tables are modified in place. Their unsaved pages are dropped and the tables loaded again
+                for name in state['in_place']:
+                    if self.tables.is_loaded(name):
+                        buffer_pool.drop(id(self.tables[name].data))
+                    self._evict(name)
+        finally:
+            for name in reversed(state['locks']):
+                self.lock_manager.release(name)
+
+
 
     def create_table(self, name, column_names, column_types, primary_key=None, load=None):
         '''
@@ -114,6 +546,10 @@ class Database:
         '''
         # print('here -> ', column_names.split(','))
         self.tables.update({name: Table(name=name, column_names=column_names.split(','), column_types=column_types.split(','), primary_key=primary_key, load=load)})
+        if name[:4]!='meta':
+            self.tables[name]._storage = self.storage
+            if self.storage == 'typed':
+                self.tables[name].data = TypedColumns(self.tables[name].column_types)
         # self._name = Table(name=name, column_names=column_names, column_types=column_types, load=load)
         # check that new dynamic var doesnt exist already
         # self.no_of_tables += 1
@@ -133,13 +569,21 @@ class Database:
         '''
         self.load_database()
         self.lock_table(table_name)
+        # logged changes of the dropped table must not be replayed on a new table with the same name
+        if table_name in self._wal_pending:
+            self.checkpoint()
 
-        self.tables.pop(table_name)
+        del self.tables[table_name]
+        self._evict(table_name)
+        self.lock_manager.release(table_name, force=True)
         if os.path.isfile(f'{self.savedir}/{table_name}.pkl'):
             os.remove(f'{self.savedir}/{table_name}.pkl')
         else:
             warnings.warn(f'"{self.savedir}/{table_name}.pkl" not found.')
-        self.delete_from('meta_locks', f'table_name={table_name}')
+        for file in os.listdir(self.savedir): # <table>.heap and its generations (see HeapFile.create)
+            if file == f'{table_name}.heap' or file.rpartition('.')[0] == f'{table_name}.heap':
+                os.remove(f'{self.savedir}/{file}')
+        shutil.rmtree(f'{self.savedir}/{table_name}.cols', ignore_errors=True)
         self.delete_from('meta_length', f'table_name={table_name}')
         self.delete_from('meta_insert_stack', f'table_name={table_name}')
 
@@ -160,52 +604,73 @@ class Database:
         self.save_database()
 
 
-    def import_table(self, table_name, filename, column_types=None, primary_key=None):
+    def import_table(self, table_name, filename, column_types=None, primary_key=None, chunk_size=10000, workers=None):
         '''
-        Creates table from CSV file.
+        Creates table from CSV file (or, if the table exists, appends the rows of the file to it).
+        The file is streamed in chunks of rows, which are parsed with the csv module and casted column by column
+        (optionally by a pool of worker processes, see csvio.py). The table is written once, at the end, and its
+        indexes are rebuilt once.
 
         Args:
-            filename: string. CSV filename. If not specified, filename's name will be used.
+            filename: string. CSV filename (compressed if it ends in .gz, .bz2 or .xz). If not specified, filename's name will be used.
             column_types: list. Types of columns. If not specified, all will be set to type str.
             primary_key: string. The primary key (if it exists).
+            chunk_size: int. Number of rows parsed and inserted at a time.
+            workers: int. Number of worker processes that parse the file (None to parse it in this process).
         '''
-        file = open(filename, 'r')
-
-        first_line=True
-        for line in file.readlines():
-            if first_line:
-                colnames = line.strip('\n')
+        self.load_database()
+        with csvio.open_file(filename) as file:
+            colnames = csvio.read_header(file)
+            if table_name not in self.tables:
                 if column_types is None:
-                    column_types = ",".join(['str' for _ in colnames.split(',')])
-                self.create_table(name=table_name, column_names=colnames, column_types=column_types, primary_key=primary_key)
-                lock_ownership = self.lock_table(table_name, mode='x')
-                first_line = False
-                continue
-            self.tables[table_name]._insert(line.strip('\n').split(','))
+                    column_types = ",".join(['str' for _ in colnames])
+                self.create_table(name=table_name, column_names=','.join(colnames), column_types=column_types, primary_key=primary_key)
+            elif colnames != self.tables[table_name].column_names:
+                raise ValueError(f'The columns of "{filename}" do not match the columns of table "{table_name}".')
 
-        if lock_ownership:
-             self.unlock_table(table_name)
+            lock_ownership = self.lock_table(table_name, mode='x')
+            try:
+                table = self._write_version(table_name, copy=True) # (a later chunk may fail)
+                schema = Table(name=table_name, column_names=table.column_names, column_types=table.column_types, primary_key=table.pk)
+                # rows are appended (the places of deleted rows are left for later inserts)
+                for rows in csvio.parse(file, schema, chunk_size, workers):
+                    table._insert_many(rows, cast=False)
+                    if isinstance(table.data, HeapFile) and not self.in_transaction():
+                        # written as we go, so that the dirty pages do not pile up in the buffer pool
+                        table.data.flush()
+                self._publish(table_name, table)
+            finally:
+                if lock_ownership:
+                    self.unlock_table(table_name)
+
+        self._rebuild_indexes(table_name)
         self._update()
+        # the rows are not logged, the table is written as a whole
         self.save_database()
 
 
-    def export(self, table_name, filename=None):
+    def export(self, table_name, filename=None, compression=None):
         '''
-        Transform table to CSV.
+        Transform table to CSV. The rows are written as they are read (using the csv module, so values that contain
+        commas or quotes are quoted), deleted rows are skipped and None values are written as NULL.
 
         Args:
-            table_name: string. Name of table.
+            table_name: string. Name of table, or Table object (e.g. the result of a select).
             filename: string. Output CSV filename.
+            compression: string. 'gzip', 'bz2' or 'lzma' (inferred from the extension of filename if None, see csvio.py).
         '''
-        res = ''
-        for row in [self.tables[table_name].column_names]+self.tables[table_name].data:
-            res+=str(row)[1:-1].replace('\'', '').replace('"','').replace(' ','')+'\n'
-
+        self.load_database()
         if filename is None:
-            filename = f'{table_name}.csv'
+            filename = f'{table_name._name if isinstance(table_name, Table) else table_name}.csv'
 
-        with open(filename, 'w') as file:
-           file.write(res)
+        lock_ownership = self._lock_for_read(table_name)
+        try:
+            table, = self._snapshot(table_name)
+            with csvio.open_file(filename, 'w', compression) as file:
+                csvio.write(file, table.column_names, table.data)
+        finally:
+            if lock_ownership:
+                self.unlock_table(table_name)
 
     def table_from_object(self, new_table):
         '''
@@ -228,10 +693,11 @@ class Database:
     ##### table functions #####
 
     # In every table function a load command is executed to fetch the most recent table.
-    # In every table function, we first check whether the table is locked. Since we have implemented
-    # only the X lock, if the tables is locked we always abort.
+    # Writers lock the table exclusively (X) and modify a new version of it, which is published when the
+    # statement is done (MVCC). Readers do not lock: they read the version that was current when they started
+    # (heap tables are the exception, see _lock_for_read).
     # After every table function, we update and save. Update updates all the meta tables and save saves all
-    # tables.
+    # tables (in a transaction, the load and the save happen once, see begin).
 
     # these function calls are named close to the ones in postgres
 
@@ -248,9 +714,13 @@ class Database:
         self.load_database()
         
         lock_ownership = self.lock_table(table_name, mode='x')
-        self.tables[table_name]._cast_column(column_name, eval(cast_type))
-        if lock_ownership:
-            self.unlock_table(table_name)
+        try:
+            table = self._write_version(table_name, copy=True) # (a value may fail to cast)
+            table._cast_column(column_name, eval(cast_type))
+            self._publish(table_name, table)
+        finally:
+            if lock_ownership:
+                self.unlock_table(table_name)
         self._update()
         self.save_database()
 
@@ -268,16 +738,48 @@ class Database:
         # fetch the insert_stack. For more info on the insert_stack
         # check the insert_stack meta table
         lock_ownership = self.lock_table(table_name, mode='x')
-        insert_stack = self._get_insert_stack_for_table(table_name)
         try:
-            self.tables[table_name]._insert(row, insert_stack)
-        except Exception as e:
-            logging.info(e)
-            logging.info('ABORTED')
-        self._update_meta_insert_stack_for_tb(table_name, insert_stack[:-1])
-
-        if lock_ownership:
-            self.unlock_table(table_name)
+            insert_stack = self._get_insert_stack_for_table(table_name)
+            table = self._write_version(table_name)
+            try:
+                row_id = table._insert(row, insert_stack)
+            except Exception as e:
+                logging.info(e)
+                logging.info('ABORTED')
+            else:
+                self._publish(table_name, table)
+                self._log(wal.INSERT, table_name, [row_id], [row])
+            self._update_meta_insert_stack_for_tb(table_name, insert_stack[:-1])
+        finally:
+            self._end_write(table_name)
+            if lock_ownership:
+                self.unlock_table(table_name)
+        self._update()
+        self.save_database()
+
+    def insert_many(self, table_name, rows):
+        '''
+        Inserts many rows to given table at once. The rows are casted and validated together and the table is
+        written (and logged) once. Either all the rows are inserted or none (an exception is raised).
+
+        Args:
+            table_name: string. Name of table (must be part of database).
+            rows: list. The rows to be inserted, as lists of values or as strings of comma separated values.
+        '''
+        rows = [row.strip().split(',') if isinstance(row, str) else list(row) for row in rows]
+        self.load_database()
+        lock_ownership = self.lock_table(table_name, mode='x')
+        try:
+            insert_stack = self._get_insert_stack_for_table(table_name)
+            table = self._write_version(table_name)
+            row_ids = table._insert_many(rows, insert_stack)
+            self._publish(table_name, table)
+            self._log(wal.INSERT, table_name, row_ids, rows)
+            self._update_meta_insert_stack_for_tb(table_name, insert_stack[:max(len(insert_stack)-len(rows), 0)])
+        finally:
+            self._end_write(table_name)
+            if lock_ownership:
+                self.unlock_table(table_name)
         self._update()
         self.save_database()
 
@@ -291,18 +793,25 @@ class Database:
             set_value: string. New value of the predifined column name.
             set_column: string. The column to be altered.
             condition: string. A condition using the following format:
-                'column[<,<=,==,>=,>]value' or
-                'value[<,<=,==,>=,>]column'.
+                'column[<,<=,=,!=,>=,>]value' or
+                'value[<,<=,=,!=,>=,>]column'.
                 
-                Operatores supported: (<,<=,==,>=,>)
+                Operatores supported: (<,<=,=,!=,>=,>), combined with and/or/not, between and in (see conditions.py)
         '''
         set_column, set_value = set_args.replace(' ','').split('=')
         self.load_database()
         
         lock_ownership = self.lock_table(table_name, mode='x')
-        self.tables[table_name]._update_rows(set_value, set_column, condition)
-        if lock_ownership:
-            self.unlock_table(table_name)
+        try:
+            table = self._write_version(table_name)
+            updated = table._update_rows(set_value, set_column, condition)
+            if updated:
+                self._publish(table_name, table)
+                self._log(wal.UPDATE, table_name, updated, table.column_names.index(set_column), set_value)
+        finally:
+            self._end_write(table_name)
+            if lock_ownership:
+                self.unlock_table(table_name)
         self._update()
         self.save_database()
 
@@ -313,17 +822,24 @@ class Database:
         Args:
             table_name: string. Name of table (must be part of database).
             condition: string. A condition using the following format:
-                'column[<,<=,==,>=,>]value' or
-                'value[<,<=,==,>=,>]column'.
+                'column[<,<=,=,!=,>=,>]value' or
+                'value[<,<=,=,!=,>=,>]column'.
                 
-                Operatores supported: (<,<=,==,>=,>)
+                Operatores supported: (<,<=,=,!=,>=,>), combined with and/or/not, between and in (see conditions.py)
         '''
         self.load_database()
         
         lock_ownership = self.lock_table(table_name, mode='x')
-        deleted = self.tables[table_name]._delete_where(condition)
-        if lock_ownership:
-            self.unlock_table(table_name)
+        try:
+            table = self._write_version(table_name)
+            deleted = table._delete_where(condition)
+            if deleted:
+                self._publish(table_name, table)
+                self._log(wal.DELETE, table_name, deleted)
+        finally:
+            self._end_write(table_name)
+            if lock_ownership:
+                self.unlock_table(table_name)
         self._update()
         self.save_database()
         # we need the save above to avoid loading the old database that still contains the deleted elements
@@ -331,22 +847,29 @@ class Database:
             self._add_to_insert_stack(table_name, deleted)
         self.save_database()
 
+        if self.auto_vacuum is not None and table_name[:4]!='meta' and \
+                len(self._get_insert_stack_for_table(table_name)) > self.auto_vacuum*len(self.tables[table_name].data):
+            self.vacuum(table_name)
+
     def select(self, columns, table_name, condition, distinct=None, order_by=None, \
-               limit=True, desc=None, save_as=None, return_object=True):
+               limit=True, desc=None, group_by=None, save_as=None, return_object=True):
         '''
         Selects and outputs a table's data where condtion is met.
 
         Args:
-            table_name: string. Name of table (must be part of database).
+            table_name: string. Name of table (must be part of database), Table obj or join (dict, see _select_join).
             columns: list. The columns that will be part of the output table (use '*' to select all available columns)
+                or aggregates (count, sum, avg, min, max, e.g. count(*) or avg(salary)).
             condition: string. A condition using the following format:
-                'column[<,<=,==,>=,>]value' or
-                'value[<,<=,==,>=,>]column'.
+                'column[<,<=,=,!=,>=,>]value' or
+                'value[<,<=,=,!=,>=,>]column'.
                 
-                Operatores supported: (<,<=,==,>=,>)
+                Operatores supported: (<,<=,=,!=,>=,>), combined with and/or/not, between and in (see conditions.py)
             order_by: string. A column name that signals that the resulting table should be ordered based on it (no order if None).
             desc: boolean. If True, order_by will return results in descending order (True by default).
             limit: int. An integer that defines the number of rows that will be returned (all rows if None).
+            group_by: string. Comma separated columns. The aggregates are computed for every group of rows with the
+                same values in them (see Table._group), or over all the rows if None.
             save_as: string. The name that will be used to save the resulting table into the database (no save if None).
             return_object: boolean. If True, the result will be a table object (useful for internal use - the result will be printed by default).
             distinct: boolean. If True, the resulting table will contain only unique rows.
@@ -355,24 +878,30 @@ class Database:
         # print(table_name)
         self.load_database()
         if isinstance(table_name,Table):
-            return table_name._select_where(columns, condition, distinct, order_by, desc, limit)
-
-        if condition is not None:
-            condition_column = split_condition(condition)[0]
-        else:
-            condition_column = ''
+            self._snapshot(table_name) # (if it is a version of a table of the database, it is not modified in place from now on)
+            return table_name._select_where(columns, condition, distinct, order_by, desc, limit, view=not self._modified_in_place(table_name), group_by=group_by)
 
-        
-        # self.lock_table(table_name, mode='x')
-        if self.is_locked(table_name):
-            return
-        if self._has_index(table_name) and condition_column==self.tables[table_name].column_names[self.tables[table_name].pk_idx]:
-            index_name = self.select('*', 'meta_indexes', f'table_name={table_name}', return_object=True).column_by_name('index_name')[0]
-            bt = self._load_idx(index_name)
-            table = self.tables[table_name]._select_where_with_btree(columns, bt, condition, distinct, order_by, desc, limit)
+        if isinstance(table_name,dict):
+            table = self._select_join(columns, table_name, condition, distinct, order_by, desc, limit, group_by)
         else:
-            table = self.tables[table_name]._select_where(columns, condition, distinct, order_by, desc, limit)
-        # self.unlock_table(table_name)
+            lock_ownership = self._lock_for_read(table_name)
+            try:
+                # the version of the table as of now. Writers that finish in the meantime do not affect it
+                snapshot, = self._snapshot(table_name)
+                # the result is a view of the rows of the snapshot, unless writers modify them in place
+                view = not self._modified_in_place(table_name)
+                # the index is used for a single comparison on the primary key
+                plan = compile_condition(condition, snapshot) if condition is not None else None
+                if group_by is None and self._index_usable(table_name) and isinstance(plan, Comparison) and plan.is_pk and plan.op != '!=' \
+                        and not (columns != '*' and AGGREGATE.search(columns)):
+                    index_name = self.select('*', 'meta_indexes', f'table_name={table_name}', return_object=True).column_by_name('index_name')[0]
+                    bt = self._load_idx(index_name)
+                    table = snapshot._select_where_with_btree(columns, bt, condition, distinct, order_by, desc, limit, view)
+                else:
+                    table = snapshot._select_where(columns, condition, distinct, order_by, desc, limit, view=view, group_by=group_by)
+            finally:
+                if lock_ownership:
+                    self.unlock_table(table_name)
         if save_as is not None:
             table._name = save_as
             self.table_from_object(table)
@@ -392,7 +921,7 @@ class Database:
         '''
         self.load_database()
         
-        self.tables[table_name].show(no_of_rows, self.is_locked(table_name))
+        self._snapshot(table_name)[0].show(no_of_rows, self.is_locked(table_name))
 
 
     def sort(self, table_name, column_name, asc=False):
@@ -408,12 +937,58 @@ class Database:
         self.load_database()
         
         lock_ownership = self.lock_table(table_name, mode='x')
-        self.tables[table_name]._sort(column_name, asc=asc)
-        if lock_ownership:
-            self.unlock_table(table_name)
+        try:
+            table = self._write_version(table_name)
+            table._sort(column_name, asc=asc)
+            self._publish(table_name, table)
+            # the deleted rows have moved
+            self._recover_insert_stack(table_name)
+        finally:
+            self._end_write(table_name)
+            if lock_ownership:
+                self.unlock_table(table_name)
         self._update()
         self.save_database()
 
+    def vacuum(self, table_name):
+        '''
+        Compact a table. The deleted rows (rows filled with Nones, kept so that their place can be reused by inserts)
+        are removed, the remaining rows are moved next to each other, the row ids stored in the table's indexes are
+        updated and the insert stack is emptied.
+
+        Args:
+            table_name: string. Name of table (must be part of database).
+        '''
+        self.load_database()
+
+        lock_ownership = self.lock_table(table_name, mode='x')
+        try:
+            table = self._write_version(table_name)
+            no_of_rows = len(table.data)
+            new_indexes = table._vacuum()
+            self._publish(table_name, table)
+            if table_name[:4]!='meta':
+                self._update_meta_insert_stack_for_tb(table_name, [])
+        finally:
+            self._end_write(table_name)
+            if lock_ownership:
+                self.unlock_table(table_name)
+        self._update()
+        # the logged changes refer to the old row ids, so the table is checkpointed (not logged)
+        self.save_database()
+
+        if len(new_indexes) < no_of_rows and self._has_index(table_name):
+            if self.in_transaction(): # (the rows may move again, or the transaction may be rolled back)
+                self._rebuild_indexes(table_name)
+            else:
+                for index_name in self.tables['meta_indexes']._select_where('*', f'table_name={table_name}').column_by_name('index_name'):
+                    bt = self._load_idx(index_name)
+                    bt.remap(new_indexes)
+                    self._save_index(index_name, bt)
+
+        if self.verbose:
+            print(f'Vacuumed table "{table_name}" ({no_of_rows-len(new_indexes)} deleted rows removed).')
+
     def create_view(self, table_name, table):
         '''
         Create a virtual table based on the result-set of the SQL statement provided.
@@ -441,9 +1016,60 @@ class Database:
         return_object: boolean. If True, the result will be a table object (useful for internal usage - the result will be printed by default).
         '''
         self.load_database()
-        if self.is_locked(left_table) or self.is_locked(right_table):
-            return
+        lock_ownership = [name for name in (left_table, right_table) if self._lock_for_read(name)]
+        try:
+            res = self._join(mode, *self._snapshot(left_table, right_table), condition)
+        finally:
+            for name in lock_ownership:
+                self.unlock_table(name)
+
+        if save_as is not None:
+            res._name = save_as
+            self.table_from_object(res)
+        else:
+            if return_object:
+                return res
+            else:
+                res.show()
+
+        if return_object:
+            return res
+        else:
+            res.show()
 
+    def _select_join(self, columns, join, condition, distinct=None, order_by=None, desc=None, limit=None, group_by=None):
+        '''
+        Select from the join of two tables. The joined rows stream into the select (see Table._join_rows), so the
+        join is never materialized (index-nested-loop and sort-merge joins are, see _join). Returns the resulting table.
+
+        Args:
+            columns: list. The columns that will be part of the output table (see select).
+            join: dict. The join, as planned by mdb ({'join': mode, 'left': left table, 'right': right table, 'on': condition}).
+            condition: string. The condition of the select (see select).
+        '''
+        mode, left_table, right_table, join_condition = join['join'], join['left'], join['right'], join['on']
+        if mode not in ('inner', 'left', 'right', 'full'):
+            return self.join(mode, left_table, right_table, join_condition)._select_where(columns, condition, distinct, order_by, desc, limit, group_by=group_by)
+
+        lock_ownership = [name for name in (left_table, right_table) if self._lock_for_read(name)]
+        try:
+            left_table, right_table = self._snapshot(left_table, right_table)
+            join_table, rows = left_table._join_rows(right_table, join_condition, mode)
+            return join_table._select_where(columns, condition, distinct, order_by, desc, limit, rows=rows, group_by=group_by)
+        finally:
+            for name in lock_ownership:
+                self.unlock_table(name)
+
+    def _join(self, mode, left_table, right_table, condition):
+        '''
+        Join two tables (snapshots, see _snapshot). Returns the resulting table.
+
+        Args:
+            mode: string. The join algorithm ('inner', 'left', 'right', 'full', 'inl' or 'sm').
+            left_table: string. Name of the left table (must be in DB) or Table obj.
+            right_table: string. Name of the right table (must be in DB) or Table obj.
+            condition: string. The join condition.
+        '''
         left_table = left_table if isinstance(left_table, Table) else self.tables[left_table] 
         right_table = right_table if isinstance(right_table, Table) else self.tables[right_table] 
 
@@ -462,8 +1088,8 @@ class Database:
 
         elif mode=='inl':
             # Check if there is an index of either of the two tables available, as if there isn't we can't use inlj
-            leftIndexExists = self._has_index(left_table._name)
-            rightIndexExists = self._has_index(right_table._name)
+            leftIndexExists = self._index_usable(left_table._name)
+            rightIndexExists = self._index_usable(right_table._name)
 
             if not leftIndexExists and not rightIndexExists:
                 res = None
@@ -481,76 +1107,175 @@ class Database:
         else:
             raise NotImplementedError
 
-        if save_as is not None:
-            res._name = save_as
-            self.table_from_object(res)
-        else:
-            if return_object:
-                return res
-            else:
-                res.show()
+        return res
 
-        if return_object:
-            return res
-        else:
-            res.show()
+    def _write_version(self, table_name, copy=False):
+        '''
+        Return the version of a table that a write statement will modify (the caller holds the X lock).
+        Readers keep using the current version (see _snapshot), so writers modify a copy of it, which is made visible
+        by _publish. Meta tables (internal) and heap tables (their pages are modified in place) are not copied.
+        Neither is a version (with its rows in a list) that no reader has seen: it is modified in place, and the readers
+        that ask for it meanwhile read it as it was published (see _snapshot). The caller must call _end_write when
+        the statement is done, whether it succeeded or not.
 
-    def lock_table(self, table_name, mode='x'):
+        Args:
+            table_name: string. Table name (must be part of database).
+            copy: boolean. If True, a copy is always modified (for statements that may fail after modifying some rows).
+        '''
+        table = self.tables[table_name]
+        if self.in_transaction():
+            if table._storage=='heap':
+                self._local.transaction['in_place'].add(table_name)
+                return table
+            # the transaction keeps private versions of the tables it modifies. They are copied once, on the first write
+            if table_name in self.tables.private():
+                return table
+        if table_name[:4]=='meta' or table._storage=='heap':
+            return table
+        if not copy and not self.in_transaction() and type(table.data) is list:
+            with self._versions_lock:
+                if table not in self._read_versions:
+                    table._start_in_place()
+                    self._writing[table_name] = (table, threading.get_ident())
+                    return table
+        return table._copy()
+
+    def _end_write(self, table_name, published=False):
+        '''
+        Mark the end of a write statement on a table. If the table was modified in place (see _write_version) and the
+        statement did not publish it (e.g. because it failed), the table is restored as it was.
+
+        Args:
+            table_name: string. Table name.
+            published: boolean. Whether the statement published its version of the table (see _publish).
         '''
-        Locks the specified table using the exclusive lock (X).
+        with self._versions_lock:
+            writing = self._writing.get(table_name)
+            if writing is not None and writing[1] == threading.get_ident():
+                del self._writing[table_name]
+                writing[0]._end_in_place(restore=not published)
+
+    def _publish(self, table_name, table):
+        '''
+        Make a modified version of a table (see _write_version) the current one, tagged with a new transaction id.
+        Statements that start from now on see it. The previous version is garbage collected once the last reader
+        that uses it is done.
 
         Args:
             table_name: string. Table name (must be part of database).
+            table: Table. The new version of the table.
         '''
-        if table_name[:4]=='meta' or table_name not in self.tables.keys() or isinstance(table_name,Table):
+        if self.in_transaction(): # published when the transaction commits
+            self.tables[table_name] = table
             return
+        with self._versions_lock:
+            self._xid += 1
+            table._xid = self._xid
+            previous = self.tables.get(table_name)
+            if previous is not None and previous is not table:
+                # the new version continues the version history of the previous one (it is only dirty if that was)
+                for state in (self._saved, self._counted):
+                    if state.get(table_name, (None, None))[0] is previous:
+                        state[table_name] = (table, state[table_name][1])
+            if previous is not table:
+                self.tables[table_name] = table
+            self._end_write(table_name, published=True)
+
+    def _snapshot(self, *table_names):
+        '''
+        Return the current versions of the specified tables (all as of the same moment). They are never modified
+        in place from now on (see _write_version). Readers never wait for writers: a table that another thread is
+        modifying in place is returned as it was published.
 
-        with open(f'{self.savedir}/meta_locks.pkl', 'rb') as f:
-            self.tables.update({'meta_locks': pickle.load(f)})
+        Args:
+            table_names: The table names (or Table objects, which are returned as they are).
+        '''
+        with self._versions_lock:
+            tables = [table_name if isinstance(table_name, Table) else self.tables[table_name] for table_name in table_names]
+            for i, table in enumerate(tables):
+                writing = self._writing.get(table._name)
+                # (a thread that is modifying a table in place reads its own changes)
+                if writing is not None and writing[0] is table and writing[1] != threading.get_ident():
+                    tables[i] = table._published()
+            self._read_versions.update(tables)
+            return tables
 
-        try:
-            pid = self.tables['meta_locks']._select_where('pid',f'table_name={table_name}').data[0][0]
-            if pid!=os.getpid():
-                raise Exception(f'Table "{table_name}" is locked by process with pid={pid}')
-            else:
-                return False
+    def _modified_in_place(self, table_name):
+        '''
+        Check whether writes modify the current version of a table in place, instead of a copy (see _write_version).
+        The results of selects on such tables are copies of their rows instead of views (see selection.py).
 
-        except IndexError:
-            pass
+        Args:
+            table_name: string. Table name or Table object.
+        '''
+        if isinstance(table_name,Table):
+            if self.tables.get(table_name._name) is not table_name:
+                return False # not a table of the database (e.g. the result of a subquery)
+            table_name = table_name._name
+        if self.in_transaction() and table_name in self.tables.private():
+            return True
+        return table_name[:4]=='meta' or self.tables[table_name]._storage=='heap'
 
-        if mode=='x':
-            self.tables['meta_locks']._insert([table_name, os.getpid(), mode])
-        else:
-            raise NotImplementedError
-        self._save_locks()
-        return True
+    def _lock_for_read(self, table_name):
+        '''
+        Lock a table for a read statement, if needed. Returns True if the lock was acquired (and needs to be released).
+        Only heap tables are locked (S), since their pages are modified in place. The readers of any other table use
+        a snapshot and never wait for writers.
+
+        Args:
+            table_name: string. Table name or Table object.
+        '''
+        if isinstance(table_name,Table) or table_name not in self.tables.keys() or self.tables[table_name]._storage!='heap':
+            return False
+        return self.lock_table(table_name, mode='s')
+
+    def lock_table(self, table_name, mode='x'):
+        '''
+        Locks the specified table using the shared (S) or the exclusive (X) lock.
+        If the table is locked in a conflicting mode (by another thread or process), waits until it is released
+        or the lock timeout expires (an exception is raised).
+        Returns True if the lock was acquired and False if it was already held (by the calling thread).
+
+        Args:
+            table_name: string. Table name (must be part of database).
+            mode: string. 's' (shared, for reading) or 'x' (exclusive, for writing).
+        '''
+        if isinstance(table_name,Table) or table_name[:4]=='meta' or table_name not in self.tables.keys():
+            return
+
+        acquired = self.lock_manager.acquire(table_name, mode)
+        if acquired:
+            if self.in_transaction(): # held until the transaction ends
+                self._local.transaction['locks'].append(table_name)
+            # the table (and the meta tables, which are not locked) may have been modified by another process
+            # while it was not locked (or since the transaction started, see begin)
+            private = self.tables.private() or {}
+            for name in (table_name, 'meta_length', 'meta_insert_stack', 'meta_indexes'):
+                if name not in private and self._stats.get(name) != self._stat(f'{self.savedir}/{name}.pkl'):
+                    self._evict(name)
+            self._refresh_log()
+        return acquired
         # print(f'Locking table "{table_name}"')
 
     def unlock_table(self, table_name, force=False):
         '''
-        Unlocks the specified table that is exclusively locked (X).
+        Releases the lock that the calling thread acquired last on the specified table.
 
         Args:
             table_name: string. Table name (must be part of database).
+            force: boolean. If True, all the locks of this process on the table are released.
         '''
         if table_name not in self.tables.keys():
             raise Exception(f'Table "{table_name}" is not in database')
+        if not force and self.in_transaction() and table_name in self._local.transaction['locks']:
+            return # released when the transaction ends
 
-        if not force:
-            try:
-                # pid = self.select('*','meta_locks',  f'table_name={table_name}', return_object=True).data[0][1]
-                pid = self.tables['meta_locks']._select_where('pid',f'table_name={table_name}').data[0][0]
-                if pid!=os.getpid():
-                    raise Exception(f'Table "{table_name}" is locked by the process with pid={pid}')
-            except IndexError:
-                pass
-        self.tables['meta_locks']._delete_where(f'table_name={table_name}')
-        self._save_locks()
+        self.lock_manager.release(table_name, force=force)
         # print(f'Unlocking table "{table_name}"')
 
     def is_locked(self, table_name):
         '''
-        Check whether the specified table is exclusively locked (X).
+        Check whether the specified table is exclusively locked (X) by another thread or process.
 
         Args:
             table_name: string. Table name (must be part of database).
@@ -558,17 +1283,7 @@ class Database:
         if isinstance(table_name,Table) or table_name[:4]=='meta':  # meta tables will never be locked (they are internal)
             return False
 
-        with open(f'{self.savedir}/meta_locks.pkl', 'rb') as f:
-            self.tables.update({'meta_locks': pickle.load(f)})
-
-        try:
-            pid = self.tables['meta_locks']._select_where('pid',f'table_name={table_name}').data[0][0]
-            if pid!=os.getpid():
-                raise Exception(f'Table "{table_name}" is locked by the process with pid={pid}')
-
-        except IndexError:
-            pass
-        return False
+        return self.lock_manager.is_locked(table_name, 's')
 
 
     #### META ####
@@ -579,42 +1294,47 @@ class Database:
 
     def _update_meta_length(self):
         '''
-        Updates the meta_length table.
+        Updates the meta_length table (only for the tables that changed since their rows were last counted).
         '''
-        for table in self.tables.values():
+        for _, table in self.tables.loaded(): # tables that are not in memory have not changed
             if table._name[:4]=='meta': #skip meta tables
                 continue
+            if self._counted.get(table._name, (None, None)) == (table, table._version):
+                continue
+            self._counted[table._name] = (table, table._version)
             if table._name not in self.tables['meta_length'].column_by_name('table_name'): # if new table, add record with 0 no. of rows
                 self.tables['meta_length']._insert([table._name, 0])
 
             # the result needs to represent the rows that contain data. Since we use an insert_stack
-            # some rows are filled with Nones. We skip these rows.
-            non_none_rows = len([row for row in table.data if any(row)])
-            self.tables['meta_length']._update_rows(non_none_rows, 'no_of_rows', f'table_name={table._name}')
+            # some rows are filled with Nones. These rows are not counted (the table keeps count, see Table._no_of_rows).
+            self.tables['meta_length']._update_rows(table._no_of_rows(), 'no_of_rows', f'table_name={table._name}')
             # self.update_row('meta_length', len(table.data), 'no_of_rows', 'table_name', '==', table._name)
 
-    def _update_meta_locks(self):
+    def _update_meta_insert_stack(self):
         '''
-        Updates the meta_locks table.
+        Updates the meta_insert_stack table.
         '''
-        for table in self.tables.values():
-            if table._name[:4]=='meta': #skip meta tables
+        for table_name in self.tables.keys():
+            if table_name[:4]=='meta': #skip meta tables
                 continue
-            if table._name not in self.tables['meta_locks'].column_by_name('table_name'):
+            if table_name not in self.tables['meta_insert_stack'].column_by_name('table_name'):
+                self.tables['meta_insert_stack']._insert([table_name, []])
 
-                self.tables['meta_locks']._insert([table._name, False])
-                # self.insert('meta_locks', [table._name, False])
 
-    def _update_meta_insert_stack(self):
-        '''
-        Updates the meta_insert_stack table.
+    def _recover_insert_stack(self, table_name):
         '''
-        for table in self.tables.values():
-            if table._name[:4]=='meta': #skip meta tables
-                continue
-            if table._name not in self.tables['meta_insert_stack'].column_by_name('table_name'):
-                self.tables['meta_insert_stack']._insert([table._name, []])
+        Rebuild the insert stack of a table from its deleted rows (rows filled with Nones).
+        Used after the rows of a table have been moved (sort) and after replaying logged changes: the meta tables
+        are not logged, so if a process crashed between logging a change and saving the meta tables, the stack
+        may be missing deleted rows or contain rows that have been reused.
 
+        Args:
+            table_name: string. Table name (must be part of database).
+        '''
+        self._update_meta_insert_stack()
+        deleted = {i for i, row in enumerate(self.tables[table_name].data) if all(val is None for val in row)}
+        stack = [i for i in self._get_insert_stack_for_table(table_name) if i in deleted]
+        self._update_meta_insert_stack_for_tb(table_name, stack+sorted(deleted.difference(stack)))
 
     def _add_to_insert_stack(self, table_name, indexes):
         '''
@@ -701,6 +1421,34 @@ class Database:
         '''
         return table_name in self.tables['meta_indexes'].column_by_name('table_name')
 
+    def _index_usable(self, table_name):
+        '''
+        Check whether the index of a table can be used by a statement. In a transaction, the indexes of the tables whose
+        rows moved (see _rebuild_indexes) cannot be used until the transaction commits.
+
+        Args:
+            table_name: string. Table name (must be part of database).
+        '''
+        if self.in_transaction() and table_name in self._local.transaction['indexes']:
+            return False
+        return self._has_index(table_name)
+
+    def _rebuild_indexes(self, table_name):
+        '''
+        Construct the indexes of a table again (e.g. after its rows were imported or moved). In a transaction, they are
+        rebuilt when the transaction commits (and not at all if it is rolled back).
+
+        Args:
+            table_name: string. Table name (must be part of database).
+        '''
+        if not self._has_index(table_name):
+            return
+        if self.in_transaction():
+            self._local.transaction['indexes'].add(table_name)
+            return
+        for index_name in self.tables['meta_indexes']._select_where('*', f'table_name={table_name}').column_by_name('index_name'):
+            self._construct_index(table_name, index_name)
+
     def _save_index(self, index_name, index):
         '''
         Save the index object.
@@ -714,8 +1462,8 @@ class Database:
         except:
             pass
 
-        with open(f'{self.savedir}/indexes/meta_{index_name}_index.pkl', 'wb') as f:
-            pickle.dump(index, f)
+        self._write_file(f'{self.savedir}/indexes/meta_{index_name}_index.pkl', index)
+        self._sync_dir(f'{self.savedir}/indexes')
 
     def _load_idx(self, index_name):
         '''
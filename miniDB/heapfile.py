@@ -0,0 +1,401 @@
+'''
+Paged heap file storage for the rows of a table, read and written through an LRU buffer pool.
+
+A heap file is a sequence of fixed-size pages. Every page uses a slotted layout:
+
+    | no_of_slots | free_end | slot 0 | slot 1 | ... -> free space <- ... | row 1 | row 0 |
+
+where every slot is the (offset, length) of a (pickled) row inside the page. Rows are stored from the end of the
+page towards its start and the slot directory grows from the start towards the end.
+
+The order of the pages (and the number of rows in each one) is kept by the HeapFile object, which is pickled
+with its table. A row is addressed by its index in the table (like Table.data); the HeapFile finds its page
+and slot. Only the pages that are accessed are read from disk.
+
+The layout is saved (atomically) with the table, after the pages are written, so the pages of the saved layout
+are never overwritten (shadow paging): a modified page is written to a free page (or at the end of the file) and
+the new layout points to it. The old page is freed once the new layout has been saved (see HeapFile.saved).
+If the process crashes in between, the saved layout still points to the old pages, unchanged.
+Likewise, rewriting all the rows (see HeapFile.create) writes a new heap file, next to the one of the saved layout.
+'''
+import os
+import pickle
+import struct
+import weakref
+from bisect import bisect_right
+from collections import OrderedDict
+from collections.abc import MutableSequence
+
+PAGE_SIZE = 4096
+
+PAGE_HEADER = struct.Struct('<HH') # no_of_slots, free_end
+SLOT = struct.Struct('<HH') # offset, length
+
+
+class Page:
+    '''
+    A single slotted page (in memory).
+    '''
+    def __init__(self, data):
+        '''
+        Args:
+            data: bytearray. The contents of the page.
+        '''
+        self.data = data
+        self.dirty = False # whether the page has been modified since it was read from/written to disk
+
+    @classmethod
+    def empty(cls, page_size):
+        data = bytearray(page_size)
+        PAGE_HEADER.pack_into(data, 0, 0, page_size)
+        return cls(data)
+
+    @property
+    def no_of_slots(self):
+        return PAGE_HEADER.unpack_from(self.data, 0)[0]
+
+    def free_space(self):
+        no_of_slots, free_end = PAGE_HEADER.unpack_from(self.data, 0)
+        return free_end - PAGE_HEADER.size - no_of_slots*SLOT.size
+
+    def read(self, slot):
+        '''
+        Return the raw (pickled) row stored in the specified slot.
+        '''
+        offset, length = SLOT.unpack_from(self.data, PAGE_HEADER.size + slot*SLOT.size)
+        return bytes(self.data[offset:offset+length])
+
+    def rows(self):
+        '''
+        Return all the rows of the page (unpickled), in slot order.
+        '''
+        return [pickle.loads(self.read(slot)) for slot in range(self.no_of_slots)]
+
+    def insert(self, row_bytes):
+        '''
+        Append a row to the page. Returns False if it doesnt fit.
+        '''
+        if self.free_space() < len(row_bytes)+SLOT.size:
+            return False
+        no_of_slots, free_end = PAGE_HEADER.unpack_from(self.data, 0)
+        offset = free_end - len(row_bytes)
+        self.data[offset:free_end] = row_bytes
+        SLOT.pack_into(self.data, PAGE_HEADER.size + no_of_slots*SLOT.size, offset, len(row_bytes))
+        PAGE_HEADER.pack_into(self.data, 0, no_of_slots+1, offset)
+        self.dirty = True
+        return True
+
+    def update(self, slot, row_bytes):
+        '''
+        Replace the row stored in the specified slot. Returns False if the new row doesnt fit in the page.
+        '''
+        offset, length = SLOT.unpack_from(self.data, PAGE_HEADER.size + slot*SLOT.size)
+        if len(row_bytes) > length:
+            # the row has grown. Write it in the free space (compacting the page first if needed)
+            if self.free_space() < len(row_bytes):
+                self.compact(skip=slot)
+                if self.free_space() < len(row_bytes):
+                    return False
+            no_of_slots, free_end = PAGE_HEADER.unpack_from(self.data, 0)
+            offset = free_end - len(row_bytes)
+            PAGE_HEADER.pack_into(self.data, 0, no_of_slots, offset)
+        self.data[offset:offset+len(row_bytes)] = row_bytes
+        SLOT.pack_into(self.data, PAGE_HEADER.size + slot*SLOT.size, offset, len(row_bytes))
+        self.dirty = True
+        return True
+
+    def truncate(self, no_of_slots):
+        '''
+        Keep only the first no_of_slots rows of the page.
+        '''
+        PAGE_HEADER.pack_into(self.data, 0, no_of_slots, PAGE_HEADER.unpack_from(self.data, 0)[1])
+        self.compact()
+
+    def compact(self, skip=None):
+        '''
+        Rewrite the rows of the page next to each other, so that the space of old row versions is freed.
+        The row of the skip slot (if any) is dropped (its slot is kept, with a length of 0).
+        '''
+        rows = [self.read(slot) if slot != skip else b'' for slot in range(self.no_of_slots)]
+        page = Page.empty(len(self.data))
+        for row_bytes in rows:
+            page.insert(row_bytes)
+        self.data[:] = page.data
+        self.dirty = True
+
+
+class BufferPool:
+    '''
+    Keeps up to capacity pages (of all the heap files of the process) in memory and evicts the least recently used ones.
+
+    Dirty pages are never evicted, they are written to disk when their heap file is flushed (i.e. when the table is saved).
+    Until then, the pool may temporarily hold more than capacity pages.
+    '''
+    def __init__(self, capacity=256):
+        '''
+        Args:
+            capacity: int. Maximum number of (clean) pages kept in memory.
+        '''
+        self.capacity = capacity
+        self.pages = OrderedDict() # (heap file id, page_no) -> Page. The least recently used page is first
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, heap, page_no):
+        '''
+        Return the specified page of a heap file, reading it from disk if it is not in the pool.
+        '''
+        key = (id(heap), page_no)
+        page = self.pages.get(key)
+        if page is not None:
+            self.hits += 1
+            self.pages.move_to_end(key)
+            return page
+        self.misses += 1
+        page = Page(bytearray(heap._read_page(page_no)))
+        self._add(key, page)
+        return page
+
+    def new(self, heap, page_no):
+        '''
+        Add a new (empty) page of a heap file to the pool.
+        '''
+        page = Page.empty(heap.page_size)
+        page.dirty = True
+        self._add((id(heap), page_no), page)
+        return page
+
+    def flush(self, heap):
+        '''
+        Write the dirty pages of a heap file to disk (see HeapFile.flush).
+        '''
+        dirty = [(page_no, page) for (heap_id, page_no), page in self.pages.items() if heap_id == id(heap) and page.dirty]
+        for page_no, page in dirty:
+            new_page_no = heap._write_page(page_no, page.data)
+            if new_page_no != page_no: # the page was written to a new place
+                self.pages[(id(heap), new_page_no)] = self.pages.pop((id(heap), page_no))
+            page.dirty = False
+        self._evict()
+
+    def drop(self, heap_id):
+        '''
+        Remove all pages of a heap file from the pool (without writing them).
+        '''
+        for key in [key for key in self.pages if key[0] == heap_id]:
+            del self.pages[key]
+
+    def resize(self, capacity):
+        self.capacity = capacity
+        self._evict()
+
+    def _add(self, key, page):
+        self.pages[key] = page
+        self._evict()
+
+    def _evict(self):
+        if len(self.pages) <= self.capacity:
+            return
+        # the most recently used page is never evicted (it is the page that the caller is about to use)
+        candidates = [key for key, page in list(self.pages.items())[:-1] if not page.dirty]
+        for key in candidates[:len(self.pages)-self.capacity]:
+            del self.pages[key]
+
+
+# the buffer pool shared by all the heap files of the process
+buffer_pool = BufferPool()
+
+
+class HeapFile(MutableSequence):
+    '''
+    The rows of a table, stored in a heap file. Behaves like the list of rows (Table.data).
+    Note: rows are unpickled on access, so modifying a returned row does not modify the table (assign it back instead).
+    '''
+    def __init__(self, path, page_size=PAGE_SIZE):
+        '''
+        Args:
+            path: string. Path of the heap file (created if it does not exist).
+            page_size: int. Size of every page in bytes.
+        '''
+        self.path = path
+        self.page_size = page_size
+        self.page_order = [] # the page numbers (positions in the file) in the order of the rows
+        self.ends = [] # ends[i] is the number of rows in the pages page_order[:i+1]
+        self.no_of_pages = 0 # pages allocated in the file
+        self.free_pages = [] # pages of the file that no row is stored in (reused before new pages are allocated)
+        self._saved_pages = set() # the pages of the saved layout, which are never overwritten
+        self._replaced_pages = [] # pages of the saved layout that were written to a new place (freed once saved)
+        self._open()
+
+    def _open(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        # the pages of the object are dropped from the pool when it is garbage collected
+        weakref.finalize(self, buffer_pool.drop, id(self))
+        weakref.finalize(self, os.close, self.fd)
+
+    def __getstate__(self):
+        # only the layout is pickled (with the table), the rows are in the file. The layout is only loaded once it
+        # is saved, and from then on the pages it replaced are free
+        state = {key: value for key, value in self.__dict__.items() if key not in ('fd', '_saved_pages', '_replaced_pages')}
+        state['free_pages'] = self.free_pages+self._replaced_pages
+        return state
+
+    def __setstate__(self, state):
+        self.free_pages = []
+        self.__dict__.update(state)
+        # the loaded layout is the saved one
+        self._saved_pages = set(self.page_order)
+        self._replaced_pages = []
+        self._open()
+
+    @classmethod
+    def create(cls, path, rows, page_size=PAGE_SIZE):
+        '''
+        Create a heap file that contains the supplied rows. The file is a new generation of the heap files of
+        the table (<path>.<generation>), so the file of the saved layout is left in place until the new layout
+        is saved (see saved).
+
+        Args:
+            path: string. Path of the table's heap files (<table>.heap).
+            rows: list. The rows to be stored.
+            page_size: int. Size of every page in bytes.
+        '''
+        rows = list(rows) # rows may be read from the current file
+        directory, name = os.path.split(os.path.abspath(path))
+        generations = [int(gen) for prefix, _, gen in (file.rpartition('.') for file in os.listdir(directory)) \
+                       if prefix == name and gen.isdigit()]
+        heap = cls(f'{path}.{max(generations, default=0)+1}', page_size)
+        os.ftruncate(heap.fd, 0) # (a leftover of a process that crashed before its layout was saved)
+        heap.extend(rows)
+        heap.flush()
+        return heap
+
+    def flush(self):
+        '''
+        Write the modified pages to disk. The pages of the saved layout are written to new places (see the top of
+        the file), so the new layout needs to be saved (pickled with the table) for the changes to be visible
+        to other processes, and then saved needs to be called.
+        '''
+        buffer_pool.flush(self)
+        os.fsync(self.fd)
+
+    def saved(self):
+        '''
+        Called once the current layout has been saved (and is durable): the pages it replaced are freed and
+        the heap files of previous generations (see create) are removed.
+        '''
+        self.free_pages += self._replaced_pages
+        self._replaced_pages = []
+        self._saved_pages = set(self.page_order)
+
+        directory, name = os.path.split(os.path.abspath(self.path))
+        base, _, current = name.rpartition('.')
+        if not current.isdigit():
+            return
+        for file in os.listdir(directory):
+            prefix, _, gen = file.rpartition('.')
+            # (<table>.heap is the file of the heap files that were created before generations)
+            if file == base or prefix == base and gen.isdigit() and int(gen) < int(current):
+                os.remove(f'{directory}/{file}')
+
+    def _read_page(self, page_no):
+        return os.pread(self.fd, self.page_size, page_no*self.page_size)
+
+    def _write_page(self, page_no, data):
+        '''
+        Write a page to disk and return its page number, which is a new one if the page is part of the saved layout.
+        '''
+        if page_no in self._saved_pages:
+            new_page_no = self._allocate()
+            self.page_order[self.page_order.index(page_no)] = new_page_no
+            self._replaced_pages.append(page_no)
+            page_no = new_page_no
+        os.pwrite(self.fd, data, page_no*self.page_size)
+        return page_no
+
+    def _allocate(self):
+        '''
+        Return the page number of an unused page (a free page, or a new one at the end of the file).
+        '''
+        if self.free_pages:
+            return self.free_pages.pop()
+        self.no_of_pages += 1
+        return self.no_of_pages-1
+
+    def _locate(self, index):
+        '''
+        Return the position (in page_order) of the page containing the row with the given index and its slot.
+        '''
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('heap file index out of range')
+        pos = bisect_right(self.ends, index)
+        return pos, index - (self.ends[pos-1] if pos else 0)
+
+    def _serialize(self, row):
+        row_bytes = pickle.dumps(list(row), protocol=pickle.HIGHEST_PROTOCOL)
+        if len(row_bytes)+SLOT.size > self.page_size-PAGE_HEADER.size:
+            raise ValueError(f'Row is too large to be stored in a page of {self.page_size} bytes.')
+        return row_bytes
+
+    def __len__(self):
+        return self.ends[-1] if self.ends else 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        pos, slot = self._locate(index)
+        return pickle.loads(buffer_pool.get(self, self.page_order[pos]).read(slot))
+
+    def __iter__(self):
+        # read page by page instead of row by row
+        for page_no in self.page_order:
+            yield from buffer_pool.get(self, page_no).rows()
+
+    def __setitem__(self, index, row):
+        pos, slot = self._locate(index)
+        page_no = self.page_order[pos]
+        row_bytes = self._serialize(row)
+        page = buffer_pool.get(self, page_no)
+        if page.update(slot, row_bytes):
+            return
+        # the page is full. Split it: the updated row and all the rows after it are moved to new page(s)
+        tail = [row_bytes] + [page.read(s) for s in range(slot+1, page.no_of_slots)]
+        page.truncate(slot)
+        start = self.ends[pos-1] if pos else 0
+        next_pages = self.page_order[pos+1:]
+        next_sizes = [end-prev for prev, end in zip(self.ends[pos:], self.ends[pos+1:])]
+        self.page_order, self.ends = self.page_order[:pos+1], self.ends[:pos]+[start+slot]
+        self._place(tail)
+        # the pages that followed the split page come after the new ones
+        for page_no, size in zip(next_pages, next_sizes):
+            self.page_order.append(page_no)
+            self.ends.append(self.ends[-1]+size)
+
+    def append(self, row):
+        self._place([self._serialize(row)])
+
+    def extend(self, rows):
+        self._place([self._serialize(row) for row in rows])
+
+    def _place(self, rows_bytes):
+        '''
+        Store (pickled) rows after the last row, allocating new pages when the last page is full.
+        '''
+        page = buffer_pool.get(self, self.page_order[-1]) if self.page_order else None
+        for row_bytes in rows_bytes:
+            if page is None or not page.insert(row_bytes):
+                page_no = self._allocate()
+                page = buffer_pool.new(self, page_no)
+                self.page_order.append(page_no)
+                self.ends.append(self.ends[-1] if self.ends else 0)
+                page.insert(row_bytes)
+            self.ends[-1] += 1
+
+    def __delitem__(self, index):
+        raise NotImplementedError('Rows cannot be removed from a heap file (replace them with rows of Nones instead).')
+
+    def insert(self, index, row):
+        if index != len(self):
+            raise NotImplementedError('Rows can only be appended to a heap file.')
+        self.append(row)
@@ -0,0 +1,245 @@
+'''
+Table lock manager, with shared (S) and exclusive (X) locks.
+
+Within a process, the locks are kept in memory. Many owners (threads) can hold the S lock of a table at the same
+time, while the X lock is held by a single owner. Requests that conflict with the held locks wait in a (FIFO) queue,
+until they are granted or their timeout expires.
+
+Across processes, every process that holds a lock on a table also holds an advisory file lock (fcntl.lockf) on
+<lock_dir>/<table>.lock, in the strongest mode that its owners hold. (lockf is used instead of flock because
+upgrading a lockf lock is atomic: a failed upgrade keeps the shared lock.)
+'''
+import errno
+import os
+import threading
+from time import monotonic
+
+try:
+    import fcntl
+except ImportError: # not available on windows. Locks only coordinate the threads of a process
+    fcntl = None
+
+SHARED = 's'
+EXCLUSIVE = 'x'
+
+
+def _covers(held, requested):
+    '''
+    Check whether a held lock mode is at least as strong as the requested one.
+    '''
+    return held == EXCLUSIVE or requested == SHARED
+
+
+def _try_lockf(fd, mode):
+    '''
+    Lock a file in the specified mode without waiting. Returns False if another process holds a conflicting lock.
+    '''
+    try:
+        fcntl.lockf(fd, (fcntl.LOCK_EX if mode == EXCLUSIVE else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+    except OSError as e:
+        if e.errno in (errno.EACCES, errno.EAGAIN):
+            return False
+        raise
+    return True
+
+
+class LockManager:
+    '''
+    Grants and releases the locks of the tables of a database.
+    '''
+    def __init__(self, lock_dir, timeout=10):
+        '''
+        Args:
+            lock_dir: string. Directory of the lock files (created on the first lock). If None, the locks only
+                coordinate the threads of the process.
+            timeout: float. Seconds a lock request waits before it fails (None to wait forever).
+        '''
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._owners = {} # table_name -> {owner: stack of the modes the owner acquired}
+        self._queues = {} # table_name -> list of waiting requests (owner, mode), in arrival order
+        self._files = {} # table_name -> (file descriptor, mode) of the table's file lock
+
+    def acquire(self, table_name, mode=SHARED, owner=None, timeout=-1):
+        '''
+        Lock a table. Waits while the table is locked in a conflicting mode (by another owner or process).
+        Returns True if the lock was acquired and False if the owner already holds the table in an (at least as strong) mode.
+
+        Args:
+            table_name: string. Name of the table.
+            mode: string. 's' (shared) or 'x' (exclusive).
+            owner: The owner of the lock (the current thread if None).
+            timeout: float. Seconds to wait (the timeout of the manager if not specified).
+        '''
+        if mode not in (SHARED, EXCLUSIVE):
+            raise ValueError(f'Unknown lock mode "{mode}".')
+        owner = threading.get_ident() if owner is None else owner
+        timeout = self.timeout if timeout == -1 else timeout
+        deadline = None if timeout is None else monotonic()+timeout
+
+        with self._cond:
+            owners = self._owners.setdefault(table_name, {})
+            if owner in owners and _covers(self._mode_of(owners[owner]), mode):
+                return False
+
+            request = (owner, mode)
+            queue = self._queues.setdefault(table_name, [])
+            if owner in owners:
+                queue.insert(0, request) # upgrades (S -> X) go first, they already hold the table
+            else:
+                queue.append(request)
+            try:
+                while not (self._grantable(table_name, request) and self._lock_file(table_name, mode)):
+                    remaining = None if deadline is None else deadline-monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise Exception(f'Table "{table_name}" is locked. Timed out after {timeout} seconds.')
+                    # another process may release its file lock at any time, so we check again periodically
+                    self._cond.wait(0.01 if remaining is None else min(remaining, 0.01))
+            finally:
+                queue.remove(request)
+                self._cond.notify_all()
+
+            owners.setdefault(owner, []).append(mode)
+            return True
+
+    def release(self, table_name, owner=None, force=False):
+        '''
+        Release the lock that the owner acquired last on a table (if the owner upgraded S to X, the S lock is kept).
+
+        Args:
+            table_name: string. Name of the table.
+            owner: The owner of the lock (the current thread if None).
+            force: boolean. If True, the locks of all the owners (of this process) on the table are released.
+        '''
+        owner = threading.get_ident() if owner is None else owner
+        with self._cond:
+            owners = self._owners.get(table_name, {})
+            if force:
+                owners.clear()
+            elif owner in owners:
+                owners[owner].pop()
+                if not owners[owner]:
+                    del owners[owner]
+            self._sync_file(table_name)
+            self._cond.notify_all()
+
+    def release_all(self, owner=None):
+        '''
+        Release all the locks of an owner.
+
+        Args:
+            owner: The owner of the locks (the current thread if None).
+        '''
+        owner = threading.get_ident() if owner is None else owner
+        with self._cond:
+            for table_name, owners in self._owners.items():
+                if owners.pop(owner, None) is not None:
+                    self._sync_file(table_name)
+            self._cond.notify_all()
+
+    def held(self, table_name, owner=None):
+        '''
+        Return the mode in which the owner holds a table ('s' or 'x'), or None.
+
+        Args:
+            table_name: string. Name of the table.
+            owner: The owner of the lock (the current thread if None).
+        '''
+        owner = threading.get_ident() if owner is None else owner
+        with self._cond:
+            modes = self._owners.get(table_name, {}).get(owner)
+            return self._mode_of(modes) if modes else None
+
+    def is_locked(self, table_name, mode=SHARED, owner=None):
+        '''
+        Check whether a lock on a table in the specified mode would have to wait for another owner or process.
+
+        Args:
+            table_name: string. Name of the table.
+            mode: string. 's' (shared) or 'x' (exclusive).
+            owner: The owner asking (the current thread if None).
+        '''
+        owner = threading.get_ident() if owner is None else owner
+        with self._cond:
+            if not self._compatible(table_name, owner, mode):
+                return True
+            if fcntl is None or self.lock_dir is None:
+                return False
+            if table_name in self._files:
+                fd, held = self._files[table_name]
+                if _covers(held, mode):
+                    return False # the file lock is ours
+                # we hold the shared lock. Try the exclusive one and go back
+                if not _try_lockf(fd, EXCLUSIVE):
+                    return True
+                fcntl.lockf(fd, fcntl.LOCK_SH)
+                return False
+            fd = os.open(self._filename(table_name), os.O_RDWR | os.O_CREAT)
+            try:
+                return not _try_lockf(fd, mode)
+            finally:
+                os.close(fd) # releases the lock (if it was acquired)
+
+    def _mode_of(self, modes):
+        return EXCLUSIVE if EXCLUSIVE in modes else SHARED
+
+    def _compatible(self, table_name, owner, mode):
+        '''
+        Check whether the owner can lock a table in the specified mode, given the locks of the other owners.
+        '''
+        others = [self._mode_of(modes) for other, modes in self._owners.get(table_name, {}).items() if other != owner]
+        return not others if mode == EXCLUSIVE else EXCLUSIVE not in others
+
+    def _grantable(self, table_name, request):
+        '''
+        A request is granted when it is compatible with the held locks and is not overtaking a conflicting waiting request.
+        '''
+        owner, mode = request
+        if not self._compatible(table_name, owner, mode):
+            return False
+        for waiting_owner, waiting_mode in self._queues[table_name]:
+            if (waiting_owner, waiting_mode) == request:
+                return True
+            if mode == EXCLUSIVE or waiting_mode == EXCLUSIVE:
+                return False
+        return True
+
+    def _filename(self, table_name):
+        os.makedirs(self.lock_dir, exist_ok=True)
+        return f'{self.lock_dir}/{table_name}.lock'
+
+    def _lock_file(self, table_name, mode):
+        '''
+        Make sure the process holds the file lock of a table in (at least) the specified mode, without waiting.
+        Returns False if another process holds it in a conflicting mode.
+        '''
+        if fcntl is None or self.lock_dir is None:
+            return True
+        fd, held = self._files.get(table_name, (None, None))
+        if held is not None and _covers(held, mode):
+            return True
+        if fd is None:
+            fd = os.open(self._filename(table_name), os.O_RDWR | os.O_CREAT)
+        if not _try_lockf(fd, mode):
+            if held is None:
+                os.close(fd)
+            return False
+        self._files[table_name] = (fd, mode)
+        return True
+
+    def _sync_file(self, table_name):
+        '''
+        Bring the file lock of a table in line with the locks that the owners of the process hold on it (after a release).
+        '''
+        if table_name not in self._files:
+            return
+        fd, held = self._files[table_name]
+        modes = [self._mode_of(modes) for modes in self._owners.get(table_name, {}).values()]
+        if not modes:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+            os.close(fd)
+            del self._files[table_name]
+        elif held == EXCLUSIVE and EXCLUSIVE not in modes:
+            fcntl.lockf(fd, fcntl.LOCK_SH)
+            self._files[table_name] = (fd, SHARED)
@@ -1,28 +1,60 @@
 import operator
+from array import array
+
+from columnar import NullableColumn
+
+try:
+    import numpy
+except ImportError: # optional. Without it, conditions are evaluated value by value
+    numpy = None
+
+# symbol -> operator function. (The two character symbols come first, split_condition looks for them in this order)
+OPERATORS = {'>=': operator.ge,
+             '<=': operator.le,
+             '!=': operator.ne,
+             '=': operator.eq,
+             '>': operator.gt,
+             '<': operator.lt}
 
 def get_op(op, a, b):
     '''
     Get op as a function of a and b by using a symbol
     '''
-    ops = {'>': operator.gt,
-                '<': operator.lt,
-                '>=': operator.ge,
-                '<=': operator.le,
-                '=': operator.eq}
-
     try:
-        return ops[op](a,b)
+        return OPERATORS[op](a,b)
     except TypeError:  # if a or b is None (deleted record), python3 raises typerror
         return False
 
-def split_condition(condition):
-    ops = {'>=': operator.ge,
-           '<=': operator.le,
-           '=': operator.eq,
-           '>': operator.gt,
-           '<': operator.lt}
+def find_rows(column, op, value):
+    '''
+    Return the indexes of the values of a column for which 'value_of_column op value' is true (None values never match).
+    Typed columns (arrays, see columnar.py) are compared in a single vectorized operation if numpy is installed.
 
-    for op_key in ops.keys():
+    Args:
+        column: sequence. The values of the column (a list, or a column of columnar/typed data).
+        op: string. The operator (<,<=,=,!=,>=,>).
+        value: The value the column is compared with (of the column's type).
+    '''
+    if numpy is not None:
+        values, nulls = (column.values, column.nulls) if type(column) is NullableColumn else (column, None)
+        if isinstance(values, (array, memoryview)):
+            try:
+                mask = OPERATORS[op](numpy.frombuffer(values, dtype=values.typecode if isinstance(values, array) else values.format), value)
+            except (TypeError, OverflowError): # e.g. an int that does not fit in the column's type
+                mask = None
+            if isinstance(mask, numpy.ndarray):
+                if nulls is not None:
+                    mask &= numpy.unpackbits(numpy.frombuffer(nulls, dtype=numpy.uint8), bitorder='little')[:len(mask)] == 0
+                return numpy.flatnonzero(mask).tolist()
+
+    compare = OPERATORS[op]
+    try:
+        return [i for i, x in enumerate(column) if x is not None and compare(x, value)]
+    except TypeError: # values of other types (e.g. 'NULL' strings in an int column)
+        return [i for i, x in enumerate(column) if get_op(op, x, value)]
+
+def split_condition(condition):
+    for op_key in OPERATORS.keys():
         splt=condition.split(op_key)
         if len(splt)>1:
             left, right = splt[0].strip(), splt[1].strip()
@@ -46,5 +78,6 @@ def reverse_op(op):
         '>=' : '<=',
         '<' : '>',
         '<=' : '>=',
-        '=' : '='
+        '=' : '=',
+        '!=' : '!='
     }.get(op)
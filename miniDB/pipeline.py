@@ -0,0 +1,329 @@
+'''
+Pull based (volcano style) execution of select statements (see Table._select_where and Database.select).
+
+Every operator is a generator that pulls the rows of its input one at a time and yields its own, e.g.
+    limit(project(where(scan(table), condition), [0, 2]), 10)
+so rows stream through the whole pipeline and the scan stops as soon as limit has its rows. Only the blocking
+operators hold rows: order (all the rows of its input), top (k rows), the build side of a join (its join column)
+and aggregate (one state per group, up to a limit, the rest of the groups are spilled to disk).
+Rows are lists of values, as in Table.data.
+'''
+import heapq
+import pickle
+import tempfile
+from itertools import groupby, islice
+
+from misc import get_op
+
+# aggregate functions (see aggregate)
+AGGREGATES = ('count', 'sum', 'avg', 'min', 'max')
+# groups that aggregate keeps in memory. The rows of the groups that do not fit are spilled to PARTITIONS files
+MAX_GROUPS = 1000000
+PARTITIONS = 16
+
+
+def scan(table, rows=None, columns=None):
+    '''
+    Yield the rows of a table (deleted rows, filled with Nones, included).
+
+    Args:
+        table: Table. The table.
+        rows: iterable. Indexes of the rows to read, in order (all the rows if None).
+        columns: list. Indexes of the columns to read (all the columns if None, see project).
+    '''
+    if columns is not None and hasattr(table.data, 'column'): # columnar data, read only the needed columns
+        columns = [table.data.column(i) for i in columns]
+        for i in range(len(table.data)) if rows is None else rows:
+            yield [column[i] for column in columns]
+        return
+    data = table.data if rows is None else map(table.data.__getitem__, rows)
+    yield from data if columns is None else project(data, columns)
+
+
+def where(rows, condition):
+    '''
+    Yield the rows that satisfy a condition.
+
+    Args:
+        rows: iterable. The input rows.
+        condition: callable. Returns True for the rows to keep (e.g. a compiled condition, see conditions.py).
+    '''
+    return filter(condition, rows)
+
+
+def project(rows, columns):
+    '''
+    Yield the specified columns of every row.
+
+    Args:
+        rows: iterable. The input rows.
+        columns: list. Indexes of the columns.
+    '''
+    for row in rows:
+        yield [row[i] for i in columns]
+
+
+def distinct(rows):
+    '''
+    Yield the first occurrence of every row.
+
+    Args:
+        rows: iterable. The input rows.
+    '''
+    seen = set()
+    for row in rows:
+        key = tuple(row)
+        if key not in seen:
+            seen.add(key)
+            yield row
+
+
+def skip_empty(rows):
+    '''
+    Yield the rows that have at least one value. Deleted rows are filled with Nones, so they are skipped.
+
+    Args:
+        rows: iterable. The input rows.
+    '''
+    return (row for row in rows if any(value is not None for value in row))
+
+
+def _key(column):
+    # None (NULL) values are ordered as 0, as in Table.order_by
+    return lambda row: 0 if row[column] is None else row[column]
+
+
+def order(rows, column, desc=False):
+    '''
+    Return the rows ordered by a column (blocking, all the rows are read first). Equal rows keep their order.
+
+    Args:
+        rows: iterable. The input rows.
+        column: int. Index of the column.
+        desc: boolean. If True, the largest values come first.
+    '''
+    return iter(sorted(rows, key=_key(column), reverse=bool(desc)))
+
+
+def top(rows, column, desc, k):
+    '''
+    Return the first k rows ordered by a column, as order and then limit would (equal rows keep their order).
+    A bounded heap is used, so only k rows are kept at a time.
+
+    Args:
+        rows: iterable. The input rows.
+        column: int. Index of the column.
+        desc: boolean. If True, the largest values come first.
+        k: int. Number of rows.
+    '''
+    return iter((heapq.nlargest if desc else heapq.nsmallest)(k, rows, key=_key(column)))
+
+
+def limit(rows, k):
+    '''
+    Yield the first k rows. The input is not read any further.
+
+    Args:
+        rows: iterable. The input rows.
+        k: int. Number of rows (as in a slice, if negative all but the last -k rows).
+    '''
+    if k < 0:
+        return iter(list(rows)[:k])
+    return islice(rows, k)
+
+
+def join(left, right, left_column, right_column, operator='=', join_type='inner'):
+    '''
+    Yield the rows of the join of two tables (the values of the left row followed by the values of the right one).
+    The rows of one table are streamed (the left one, or the right one for right joins) and matched against the join
+    column of the other table. Equi-joins find the matching rows through a hash table, others check every row.
+    Rows are yielded in the order of the streamed table, and its matches in the order of the other table.
+
+    Args:
+        left: Table. The left table.
+        right: Table. The right table.
+        left_column: int. Index of the join column of the left table.
+        right_column: int. Index of the join column of the right table.
+        operator: string. The operator of the join condition (<,<=,=,!=,>=,>). Outer joins only support '='.
+        join_type: string. 'inner', 'left', 'right' or 'full'.
+    '''
+    if join_type == 'right':
+        # a right join is a left join with the tables swapped (the rows are yielded with the left values first)
+        for row in join(right, left, right_column, left_column, operator, 'left'):
+            yield row[len(right.column_names):] + row[:len(right.column_names)]
+        return
+
+    right_values = right.column_by_name(right.column_names[right_column])
+    if operator == '=':
+        matches = {}
+        for right_idx, value in enumerate(right_values):
+            if value is not None:
+                matches.setdefault(value, []).append(right_idx)
+        find = lambda value: matches.get(value, ())
+    else:
+        find = lambda value: [right_idx for right_idx, right_value in enumerate(right_values) \
+                              if right_value is not None and get_op(operator, value, right_value)]
+
+    # (only the join column of the left table is read, and its rows are read only when they are yielded)
+    left_values = left.column_by_name(left.column_names[left_column])
+    right_padding = len(right.column_names)*['NULL']
+    for left_idx, value in enumerate(left_values):
+        if value is None:
+            continue
+        right_rows = find(value)
+        if right_rows:
+            row = list(left.data[left_idx])
+            for right_idx in right_rows:
+                yield row + list(right.data[right_idx])
+        elif join_type in ('left', 'full'):
+            yield list(left.data[left_idx]) + right_padding
+
+    if join_type == 'full':
+        left_values = set(left_values)
+        left_padding = len(left.column_names)*['NULL']
+        for right_idx, value in enumerate(right_values):
+            if value is not None and value not in left_values:
+                yield left_padding + list(right.data[right_idx])
+
+
+def is_ordered(keys):
+    '''
+    Check whether keys come in (non decreasing) order. Stops at the first key that is out of order.
+
+    Args:
+        keys: iterable. The keys (e.g. the values of a column, or tuples of values).
+    '''
+    keys = iter(keys)
+    previous = next(keys, None)
+    try:
+        for key in keys:
+            if key < previous:
+                return False
+            previous = key
+    except TypeError: # e.g. None values
+        return False
+    return True
+
+
+def aggregate(rows, group_columns, aggregates, ordered=False, max_groups=None):
+    '''
+    Group rows by the values of some columns and yield a row per group: the values of the group columns followed by
+    the results of the aggregates. NULL values (None or 'NULL') are ignored by the aggregates, except count(*).
+    Without group columns, all the rows are a single group (a row is yielded even if there are no rows).
+
+    Rows that come ordered by the group columns are aggregated one group at a time, in a single pass. Otherwise every
+    group has a state in a hash table. Once max_groups groups are in memory, the rows of new groups are partitioned by
+    their hash to temporary files, and every partition is aggregated afterwards (the same way, recursively).
+
+    Args:
+        rows: iterable. The input rows.
+        group_columns: list. Indexes of the columns to group by.
+        aggregates: list. The aggregates, as (function, column index) pairs. function is one of AGGREGATES,
+            column is None for count(*).
+        ordered: boolean. Whether the rows come ordered by the group columns.
+        max_groups: int. Maximum number of groups kept in memory (MAX_GROUPS if None).
+    '''
+    key = lambda row: tuple(row[i] for i in group_columns)
+    if not group_columns:
+        state = _new_state(aggregates)
+        for row in rows:
+            _update(state, row, aggregates)
+        yield _results(state, aggregates)
+    elif ordered:
+        for group, group_rows in groupby(rows, key):
+            state = _new_state(aggregates)
+            for row in group_rows:
+                _update(state, row, aggregates)
+            yield list(group) + _results(state, aggregates)
+    else:
+        yield from _hash_aggregate(rows, key, aggregates, MAX_GROUPS if max_groups is None else max_groups)
+
+
+def _hash_aggregate(rows, key, aggregates, max_groups, level=0):
+    groups = {}
+    partitions = None
+    for row in rows:
+        group = key(row)
+        state = groups.get(group)
+        if state is None:
+            if len(groups) >= max_groups:
+                if partitions is None:
+                    partitions = [_Spill() for _ in range(PARTITIONS)]
+                # (the level is hashed too, so that a partition is split differently than its parent)
+                partitions[hash((level, group)) % PARTITIONS].write(row)
+                continue
+            state = groups[group] = _new_state(aggregates)
+        _update(state, row, aggregates)
+
+    for group, state in groups.items():
+        yield list(group) + _results(state, aggregates)
+    groups.clear()
+    for partition in partitions or ():
+        yield from _hash_aggregate(partition.read(), key, aggregates, max_groups, level+1)
+        partition.close()
+
+
+def _new_state(aggregates):
+    # for every aggregate, the number of (not NULL) values and the sum/min/max of the values
+    return [[0, None] for _ in aggregates]
+
+
+def _update(state, row, aggregates):
+    for aggregate_state, (function, column) in zip(state, aggregates):
+        if column is None: # count(*)
+            aggregate_state[0] += 1
+            continue
+        value = row[column]
+        if value is None or value == 'NULL':
+            continue
+        aggregate_state[0] += 1
+        current = aggregate_state[1]
+        if current is None:
+            aggregate_state[1] = value
+        elif function in ('sum', 'avg'):
+            aggregate_state[1] = current+value
+        elif function == 'min' and value < current or function == 'max' and value > current:
+            aggregate_state[1] = value
+
+
+def _results(state, aggregates):
+    results = []
+    for (count, value), (function, column) in zip(state, aggregates):
+        if function == 'count':
+            results.append(count)
+        elif function == 'avg':
+            results.append(value/count if count else None)
+        else:
+            results.append(value)
+    return results
+
+
+class _Spill:
+    '''
+    Rows written to a temporary file (in batches) and read back once.
+    '''
+    BATCH = 1000
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.batch = []
+
+    def write(self, row):
+        self.batch.append(row)
+        if len(self.batch) >= self.BATCH:
+            pickle.dump(self.batch, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.batch = []
+
+    def read(self):
+        if self.batch:
+            pickle.dump(self.batch, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.batch = []
+        self.file.seek(0)
+        while True:
+            try:
+                yield from pickle.load(self.file)
+            except EOFError:
+                return
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,104 @@
+'''
+Selection vectors: the rows of a select statement as a view of the rows of the table they were selected from
+(the ids of the selected rows and the indexes of the selected columns) instead of a copy of them.
+
+A view behaves like the list of rows (Table.data) and, like columnar data, column(idx) returns a single column.
+It is read only: the first modification copies the selected rows in memory (as a list), and views are pickled
+(e.g. when a result is saved with save_as, or sent to a client by the server) as plain lists of rows.
+The rows of the base table must not change while the view is used, so views are only made of versions of tables
+that are never modified in place (see Database._modified_in_place).
+'''
+from array import array
+from collections.abc import MutableSequence
+
+
+class SelectionRows(MutableSequence):
+    '''
+    The selected rows and columns of a table's rows.
+    '''
+    def __init__(self, base, rows=None, columns=None):
+        '''
+        Args:
+            base: sequence. The rows of the table (Table.data).
+            rows: list. Indexes of the selected rows, in order (all the rows if None).
+            columns: list. Indexes of the selected columns (all the columns if None).
+        '''
+        if isinstance(base, SelectionRows) and not base.modified:
+            # a selection of a selection (e.g. of a subquery) is a selection of the same base rows
+            if base.rows is not None:
+                rows = base.rows if rows is None else [base.rows[i] for i in rows]
+            if base.columns is not None:
+                columns = base.columns if columns is None else [base.columns[j] for j in columns]
+            base = base.base
+        self.base = base
+        self.rows = None if rows is None else array('q', rows) # 8 bytes per row id
+        self.columns = columns
+        self._rows = None # the rows in memory, after the first modification
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    @property
+    def modified(self):
+        return self._rows is not None
+
+    def column(self, idx):
+        '''
+        Return the values of a selected column (reading only this column of the base rows, if they are columnar).
+
+        Args:
+            idx: int. Index of the column (in the selected columns).
+        '''
+        if self._rows is not None:
+            return [row[idx] for row in self._rows]
+        if self.columns is not None:
+            idx = self.columns[idx]
+        if hasattr(self.base, 'column'):
+            column = self.base.column(idx)
+            return column if self.rows is None else [column[i] for i in self.rows]
+        if self.rows is None:
+            return [row[idx] for row in self.base]
+        return [self.base[i][idx] for i in self.rows]
+
+    def copy(self):
+        '''
+        Return a copy (a list of the selected rows) that can be modified independently.
+        '''
+        return list(self)
+
+    def _materialize(self):
+        if self._rows is None:
+            self._rows = list(self)
+            self.base = self.rows = self.columns = None # the base rows are no longer needed
+        return self._rows
+
+    def __len__(self):
+        if self._rows is not None:
+            return len(self._rows)
+        return len(self.base) if self.rows is None else len(self.rows)
+
+    def __getitem__(self, index):
+        if self._rows is not None:
+            return self._rows[index]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        row = self.base[index if self.rows is None else self.rows[index]]
+        return row if self.columns is None else [row[j] for j in self.columns]
+
+    def __iter__(self):
+        if self._rows is not None:
+            return iter(self._rows)
+        if self.columns is not None and hasattr(self.base, 'column'): # columnar data, read only the selected columns
+            columns = [self.base.column(j) for j in self.columns]
+            return ([column[i] for column in columns] for i in (range(len(self.base)) if self.rows is None else self.rows))
+        rows = iter(self.base) if self.rows is None else map(self.base.__getitem__, self.rows)
+        return rows if self.columns is None else ([row[j] for j in self.columns] for row in rows)
+
+    def __setitem__(self, index, row):
+        self._materialize()[index] = row
+
+    def __delitem__(self, index):
+        del self._materialize()[index]
+
+    def insert(self, index, row):
+        self._materialize().insert(index, row)
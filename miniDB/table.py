@@ -1,12 +1,20 @@
 from __future__ import annotations
 from tabulate import tabulate
 import pickle
+import copy
 import os
+import re
 import sys
 
 sys.path.append(f'{os.path.dirname(os.path.dirname(os.path.abspath(__file__)))}/miniDB')
 
-from misc import get_op, split_condition
+from misc import split_condition
+from conditions import compile_condition
+import pipeline
+from selection import SelectionRows
+
+# an aggregate of a select, e.g. count(*) or avg(salary) (see Table._group)
+AGGREGATE = re.compile(rf'\b({"|".join(pipeline.AGGREGATES)})\s*\(\s*(\*|[^\s()]+)\s*\)')
 
 
 class Table:
@@ -26,6 +34,24 @@ class Table:
             - a dictionary that includes the appropriate info (all the attributes in __init__)
 
     '''
+    # incremented by every method that mutates the table's data. The database compares it with the
+    # version it last saved/loaded, so only the tables that actually changed are written back to disk.
+    # (class level default, so that tables pickled before versioning was added still work)
+    _version = 0
+    # how the rows of the table are persisted by the database ('pickle', 'heap' or 'columnar', see Database.__init__)
+    _storage = 'pickle'
+    # id of the transaction (write statement) that created this version of the table (see Database._publish)
+    _xid = 0
+    # the values of the primary key column (see _pk_values). Built when first needed and kept in sync by the
+    # methods that modify the table. It is not pickled, so it is built again after the table is loaded
+    _pk_set = None
+    # the number of rows that are not deleted (see _no_of_rows). Counted when first needed and kept up to date by
+    # the methods that insert and delete rows
+    _row_count = None
+    # while the table is modified in place (see _start_in_place), its rows as they were: the list of rows, its length,
+    # the number of rows and the rows that were replaced since (by index)
+    _undo = None
+
     def __init__(self, name=None, column_names=None, column_types=None, primary_key=None, load=None):
 
         if load is not None:
@@ -73,8 +99,104 @@ class Table:
     # if any of the name, columns_names and column types are none. return an empty table object
 
     def column_by_name(self, column_name):
-        return [row[self.column_names.index(column_name)] for row in self.data]
+        column_idx = self.column_names.index(column_name)
+        if hasattr(self.data, 'column'): # columnar data, read only this column
+            return self.data.column(column_idx)
+        return [row[column_idx] for row in self.data]
+
+    def _gather(self, rows, columns):
+        '''
+        Return the values of the specified columns of the specified rows (as a list of rows).
+
+        Args:
+            rows: list. Indexes of the rows.
+            columns: list. Indexes of the columns.
+        '''
+        if hasattr(self.data, 'column'): # columnar data, read only the needed columns
+            columns = [self.data.column(i) for i in columns]
+            return [[column[i] for column in columns] for i in rows]
+        return [[row[j] for j in columns] for row in map(self.data.__getitem__, rows)]
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_pk_set', None)
+        state.pop('_undo', None)
+        return state
+
+    def _copy(self):
+        '''
+        Return a new version of the table, that can be modified without affecting this one.
+        The rows are shared between the versions (rows are never modified in place, they are replaced).
+        '''
+        table = copy.copy(self)
+        table.data = self.data.copy()
+        # copying the set is cheaper than building it again
+        table._pk_set = None if self._pk_set is None else self._pk_set.copy()
+        table._undo = None
+        return table
+
+    def _start_in_place(self):
+        '''
+        Start modifying this version of the table in place, instead of a copy (see Database._write_version).
+        Until _end_in_place, the rows that are replaced are recorded, so that the version as it was can still be read
+        (see _published) or restored. Only for tables whose rows are a list.
+        '''
+        self._undo = (self.data, len(self.data), self._row_count, {})
+
+    def _published(self):
+        '''
+        Return a copy of the version as it was when _start_in_place was called, for the readers that ask for it while
+        it is modified in place. Safe to call while another thread modifies the table (rows are replaced after they
+        are recorded, and appended rows are cut off).
+        '''
+        data, no_of_rows, row_count, replaced = self._undo
+        rows = data[:no_of_rows]
+        for index, row in replaced.copy().items():
+            if index < no_of_rows:
+                rows[index] = row
+        table = copy.copy(self)
+        table.data, table._row_count, table._pk_set, table._undo = rows, row_count, None, None
+        return table
+
+    def _end_in_place(self, restore=False):
+        '''
+        Stop recording the replaced rows (see _start_in_place).
 
+        Args:
+            restore: boolean. If True, the table is restored as it was (e.g. when the statement that modified it failed).
+        '''
+        data, no_of_rows, row_count, replaced = self._undo
+        self._undo = None
+        if restore and (self.data is not data or len(data) != no_of_rows or replaced):
+            for index, row in replaced.items():
+                data[index] = row
+            del data[no_of_rows:]
+            self.data, self._row_count, self._pk_set = data, row_count, None
+
+    def _set_row(self, index, row):
+        '''
+        Replace the row at index (recording the replaced row while the table is modified in place, see _start_in_place).
+        '''
+        if self._undo is not None:
+            self._undo[3].setdefault(index, self.data[index])
+        self.data[index] = row
+
+    def _pk_values(self):
+        '''
+        Return the set of the values of the primary key column (used to reject duplicate keys without scanning the column).
+        '''
+        if self._pk_set is None:
+            self._pk_set = {value for value in self.column_by_name(self.pk) if value is not None}
+        return self._pk_set
+
+    def _no_of_rows(self):
+        '''
+        Return the number of rows that are not deleted (deleted rows are filled with Nones).
+        '''
+        if self._row_count is None:
+            self._row_count = len(self._live_rows())
+        return self._row_count
 
     def _update(self):
         '''
@@ -95,16 +217,22 @@ class Table:
         # get the column from its name
         column_idx = self.column_names.index(column_name)
         # for every column's value in each row, replace it with itself but casted as the specified type
-        for i in range(len(self.data)):
-            self.data[i][column_idx] = cast_type(self.data[i][column_idx])
-        # change the type of the column
-        self.column_types[column_idx] = cast_type
+        # (rows are assigned back, since data might not be a list of rows in memory, e.g. a heap file)
+        for i, row in enumerate(self.data):
+            row = list(row)
+            row[column_idx] = cast_type(row[column_idx])
+            self.data[i] = row
+        # change the type of the column (a new list, the old one may be shared with another version of the table)
+        self.column_types = self.column_types[:column_idx]+[cast_type]+self.column_types[column_idx+1:]
+        if column_idx == self.pk_idx: # the keys changed, the set is built again when needed
+            self._pk_set = None
+        self._version += 1
         # self._update()
 
 
     def _insert(self, row, insert_stack=[]):
         '''
-        Insert row to table.
+        Insert row to table and return its index (row id).
 
         Args:
             row: list. A list of values to be inserted (will be casted to a predifined type automatically).
@@ -125,47 +253,135 @@ class Table:
                     print(exc)
 
             # if value is to be appended to the primary_key column, check that it doesnt alrady exist (no duplicate primary keys)
-            if i==self.pk_idx and row[i] in self.column_by_name(self.pk):
+            if i==self.pk_idx and row[i] in self._pk_values():
                 raise ValueError(f'## ERROR -> Value {row[i]} already exists in primary key column.')
             elif i==self.pk_idx and row[i] is None:
                 raise ValueError(f'ERROR -> The value of the primary key cannot be None.')
 
         # if insert_stack is not empty, append to its last index
         if insert_stack != []:
-            self.data[insert_stack[-1]] = row
+            row_id = insert_stack[-1]
+            self._set_row(row_id, row)
         else: # else append to the end
+            row_id = len(self.data)
             self.data.append(row)
+        if self.pk_idx is not None:
+            self._pk_values().add(row[self.pk_idx])
+        if self._row_count is not None: # (the places in the insert stack are deleted rows)
+            self._row_count += 1
+        self._version += 1
         # self._update()
+        return row_id
+
+    def _insert_many(self, rows, insert_stack=[], cast=True):
+        '''
+        Insert many rows to table at once and return their indexes (row ids). The rows are casted and validated
+        before any of them is inserted, so either all of them are inserted or none (an exception is raised).
+        Like in _insert, the rows take the places of the insert stack (from its end) before they are appended.
+
+        Args:
+            rows: list. A list of rows (lists of values, will be casted to the predifined types automatically).
+            insert_stack: list. The insert stack (empty by default).
+            cast: boolean. If False, the rows are already casted (see _cast_rows).
+        '''
+        if cast:
+            self._cast_rows(rows)
+
+        if self.pk_idx is not None:
+            existing = self._pk_values()
+            new_keys = set()
+            for row in rows:
+                key = row[self.pk_idx]
+                if key is None:
+                    raise ValueError(f'ERROR -> The value of the primary key cannot be None.')
+                if key in existing or key in new_keys:
+                    raise ValueError(f'## ERROR -> Value {key} already exists in primary key column.')
+                new_keys.add(key)
+            existing.update(new_keys)
+
+        reused = min(len(insert_stack), len(rows))
+        row_ids = list(reversed(insert_stack[len(insert_stack)-reused:]))
+        for row_id, row in zip(row_ids, rows):
+            self._set_row(row_id, row)
+        # the rest of the rows are appended together
+        row_ids += range(len(self.data), len(self.data)+len(rows)-reused)
+        self.data.extend(rows[reused:])
+        if self._row_count is not None:
+            self._row_count += len(rows)
+        self._version += 1
+        return row_ids
+
+    def _cast_rows(self, rows):
+        '''
+        Cast the values of the supplied rows (in place) to the types of the columns, one column at a time.
+        Values that cannot be casted are handled like in _insert ('NULL' values are kept, anything else is an error).
+
+        Args:
+            rows: list. A list of rows (lists of values).
+        '''
+        for row in rows:
+            if len(row)!=len(self.column_names):
+                raise ValueError(f'ERROR -> Cannot insert {len(row)} values. Only {len(self.column_names)} columns exist')
+
+        for i, column_type in enumerate(self.column_types):
+            try:
+                column = list(map(column_type, [row[i] for row in rows]))
+            except (ValueError, TypeError):
+                # some values need special handling. Cast them one by one
+                column = [self._cast_value(column_type, row[i]) for row in rows]
+            for row, value in zip(rows, column):
+                row[i] = value
+
+    def _cast_value(self, column_type, value):
+        '''
+        Cast a single value to a column type (see _cast_rows).
+        '''
+        try:
+            return column_type(value)
+        except ValueError:
+            if value != 'NULL':
+                raise ValueError(f'ERROR -> Value {value} of type {type(value)} is not of type {column_type}.')
+        except TypeError as exc:
+            if value != None:
+                print(exc)
+        return value
 
     def _update_rows(self, set_value, set_column, condition):
         '''
-        Update where Condition is met.
+        Update where Condition is met. Returns the indexes of the rows that changed.
 
         Args:
             set_value: string. The provided set value.
             set_column: string. The column to be altered.
             condition: string. A condition using the following format:
-                'column[<,<=,=,>=,>]value' or
-                'value[<,<=,=,>=,>]column'.
+                'column[<,<=,=,!=,>=,>]value' or
+                'value[<,<=,=,!=,>=,>]column'.
                 
-                Operatores supported: (<,<=,=,>=,>)
+                Operatores supported: (<,<=,=,!=,>=,>), combined with and/or/not, between and in (see conditions.py)
         '''
-        # parse the condition
-        column_name, operator, value = self._parse_condition(condition)
-
-        # get the condition and the set column
-        column = self.column_by_name(column_name)
+        # get the set column
         set_column_idx = self.column_names.index(set_column)
 
         # set_columns_indx = [self.column_names.index(set_column_name) for set_column_name in set_column_names]
 
         # for each value in column, if condition, replace it with set_value
-        for row_ind, column_value in enumerate(column):
-            if get_op(operator, column_value, value):
-                self.data[row_ind][set_column_idx] = set_value
-
+        # (the version is only bumped if a value really changes, so that the meta tables, which are
+        # "updated" after every statement, are not rewritten for nothing)
+        updated = []
+        for row_ind in compile_condition(condition, self).rows(self):
+            row = self.data[row_ind]
+            if row[set_column_idx] != set_value:
+                row = list(row) # the row may be shared with another version of the table
+                row[set_column_idx] = set_value
+                self._set_row(row_ind, row)
+                updated.append(row_ind)
+
+        if updated:
+            if set_column_idx == self.pk_idx: # the set is built again when needed
+                self._pk_set = None
+            self._version += 1
         # self._update()
-                # print(f"Updated {len(indexes_to_del)} rows")
+        return updated
 
 
     def _delete_where(self, condition):
@@ -177,19 +393,12 @@ class Table:
 
         Args:
             condition: string. A condition using the following format:
-                'column[<,<=,==,>=,>]value' or
-                'value[<,<=,==,>=,>]column'.
+                'column[<,<=,=,!=,>=,>]value' or
+                'value[<,<=,=,!=,>=,>]column'.
                 
-                Operatores supported: (<,<=,==,>=,>)
+                Operatores supported: (<,<=,=,!=,>=,>), combined with and/or/not, between and in (see conditions.py)
         '''
-        column_name, operator, value = self._parse_condition(condition)
-
-        indexes_to_del = []
-
-        column = self.column_by_name(column_name)
-        for index, row_value in enumerate(column):
-            if get_op(operator, row_value, value):
-                indexes_to_del.append(index)
+        indexes_to_del = compile_condition(condition, self).rows(self)
 
         # we pop from highest to lowest index in order to avoid removing the wrong item
         # since we dont delete, we dont have to to pop in that order, but since delete is used
@@ -197,32 +406,85 @@ class Table:
 
         for index in sorted(indexes_to_del, reverse=True):
             if self._name[:4] != 'meta':
+                if self.pk_idx is not None and self._pk_set is not None:
+                    self._pk_set.discard(self.data[index][self.pk_idx])
                 # if the table is not a metatable, replace the row with a row of nones
-                self.data[index] = [None for _ in range(len(self.column_names))]
+                self._set_row(index, [None for _ in range(len(self.column_names))])
             else:
                 self.data.pop(index)
 
+        if indexes_to_del:
+            if self._row_count is not None: # (deleted rows never satisfy a condition)
+                self._row_count -= len(indexes_to_del)
+            self._version += 1
         # self._update()
         # we have to return the deleted indexes, since they will be appended to the insert_stack
         return indexes_to_del
 
+    def _vacuum(self):
+        '''
+        Remove the deleted rows (rows filled with Nones) and move the remaining rows next to each other.
+        Returns a dict that maps the old index of every remaining row to its new index.
+        '''
+        rows = []
+        new_indexes = {}
+        for index, row in enumerate(self.data):
+            if all(val is None for val in row):
+                continue
+            new_indexes[index] = len(rows)
+            rows.append(row)
+
+        if len(rows) < len(self.data):
+            # a new list is assigned (instead of removing rows in place), so heap/columnar tables are rewritten when saved
+            self.data = rows
+            self._row_count = len(rows)
+            self._version += 1
+        return new_indexes
 
-    def _select_where(self, return_columns, condition=None, distinct=False, order_by=None, desc=True, limit=None):
+
+    def _select_where(self, return_columns, condition=None, distinct=False, order_by=None, desc=True, limit=None, rows=None, view=False, group_by=None):
         '''
         Select and return a table containing specified columns and rows where condition is met.
+        The rows stream through a pipeline of operators (see pipeline.py), only the result is materialized.
 
         Args:
-            return_columns: list. The columns to be returned.
+            return_columns: list. The columns to be returned. These can also be aggregates (e.g. count(*) or avg(salary),
+                see _group), computed over all the rows or over every group of rows (see group_by).
             condition: string. A condition using the following format:
-                'column[<,<=,==,>=,>]value' or
-                'value[<,<=,==,>=,>]column'.
+                'column[<,<=,=,!=,>=,>]value' or
+                'value[<,<=,=,!=,>=,>]column'.
                 
-                Operatores supported: (<,<=,==,>=,>)
+                Operatores supported: (<,<=,=,!=,>=,>), combined with and/or/not, between and in (see conditions.py)
             distinct: boolean. If True, the resulting table will contain only unique rows (False by default).
             order_by: string. A column name that signals that the resulting table should be ordered based on it (no order if None).
             desc: boolean. If True, order_by will return results in descending order (False by default).
             limit: int. An integer that defines the number of rows that will be returned (all rows if None).
+            rows: iterable. The rows to select from, if they are not the rows of this table (e.g. the rows of a join,
+                streamed by Table._join_rows). This table only provides the columns.
+            view: boolean. If True, a plain selection (without distinct, order_by and limit) returns a view of the
+                rows of this table instead of a copy (see selection.py). Only for tables that are not modified in place.
+            group_by: string. Comma separated columns. The rows with the same values in them are grouped together
+                and the result has a row per group (see _group). distinct, order_by and limit apply to the result.
         '''
+        k = int(limit) if isinstance(limit, str) else None
+
+        # if condition is None, return all rows
+        # if not, return the rows with values where condition is met for value
+        plan = compile_condition(condition, self) if condition is not None else None
+
+        if group_by is not None or (return_columns != '*' and AGGREGATE.search(return_columns)):
+            rows, column_names, column_types = self._group(return_columns, group_by, plan, rows)
+            if distinct:
+                rows = pipeline.distinct(rows)
+            if order_by:
+                column = column_names.index(''.join(order_by.split()))
+                rows = pipeline.top(rows, column, desc, k) if k is not None and k >= 0 else pipeline.order(rows, column, desc)
+            if k is not None:
+                rows = pipeline.limit(rows, k)
+            # the result only has the columns of the aggregation
+            dict = {key: value for key, value in self.__dict__.items() if key not in ('data', '_pk_set', '_row_count')}
+            dict.update(data=list(rows), column_names=column_names, column_types=column_types, pk_idx=None, pk=None)
+            return Table(load=dict)
 
         # if * return all columns, else find the column indexes for the columns specified
         if return_columns == '*':
@@ -230,89 +492,159 @@ class Table:
         else:
             return_cols = [self.column_names.index(col.strip()) for col in return_columns.split(',')]
 
-        # if condition is None, return all rows
-        # if not, return the rows with values where condition is met for value
-        if condition is not None:
-            column_name, operator, value = self._parse_condition(condition)
-            column = self.column_by_name(column_name)
-            rows = [ind for ind, x in enumerate(column) if get_op(operator, x, value)]
+        if view and rows is None and not distinct and not order_by and k is None:
+            rows = SelectionRows(self.data, None if plan is None else plan.rows(self), None if return_columns == '*' else return_cols)
+            return self._selection(rows, return_cols)
+
+        if rows is not None:
+            rows = pipeline.project(rows if plan is None else pipeline.where(rows, plan), return_cols)
+        elif plan is not None and k is not None and not order_by:
+            # only the first rows that match are needed, so the rows are checked one by one until there are enough
+            rows = pipeline.project(pipeline.where(pipeline.scan(self), plan), return_cols)
         else:
-            rows = [i for i in range(len(self.data))]
+            rows = pipeline.scan(self, None if plan is None else plan.rows(self), return_cols)
 
-        # copy the old dict, but only the rows and columns of data with index in rows/columns (the indexes that we want returned)
-        dict = {(key):([[self.data[i][j] for j in return_cols] for i in rows] if key=="data" else value) for key,value in self.__dict__.items()}
+        if distinct:
+            rows = pipeline.distinct(rows)
+        if k is not None:
+            # the rows that would be shown empty (e.g. deleted rows) are not counted
+            rows = pipeline.skip_empty(rows)
+        if order_by:
+            column = [self.column_names[i] for i in return_cols].index(order_by)
+            rows = pipeline.top(rows, column, desc, k) if k is not None and k >= 0 else pipeline.order(rows, column, desc)
+        if k is not None:
+            rows = pipeline.limit(rows, k)
 
-        # we need to set the new column names/types and no of columns, since we might
-        # only return some columns
-        dict['column_names'] = [self.column_names[i] for i in return_cols]
-        dict['column_types']   = [self.column_types[i] for i in return_cols]
+        return self._selection(list(rows), return_cols)
 
-        s_table = Table(load=dict)
+    def _group(self, return_columns, group_by, plan, rows=None):
+        '''
+        Group the rows that satisfy a condition and compute aggregates over every group (see pipeline.aggregate).
+        The aggregates are count(*), count(column), sum(column), avg(column), min(column) and max(column).
+        Returns the rows of the result (a generator), and the names and types of its columns.
 
-        s_table.data = list(set(map(lambda x: tuple(x), s_table.data))) if distinct else s_table.data
+        Args:
+            return_columns: string. Comma separated group by columns and aggregates, in the order of the result.
+            group_by: string. Comma separated columns to group the rows by (all the rows are a single group if None).
+            plan: compiled condition. The condition that the rows must satisfy (see conditions.py), or None.
+            rows: iterable. The rows to group, if they are not the rows of this table (see _select_where).
+        '''
+        if return_columns == '*':
+            raise ValueError('Select the group by columns and aggregates instead of *.')
+        group_names = [] if group_by is None else [col.strip() for col in group_by.split(',')]
+        for name in group_names:
+            if name not in self.column_names:
+                raise ValueError(f'Column "{name}" does not exist.')
+        group_cols = [self.column_names.index(name) for name in group_names]
+
+        # the aggregates, as (function, column) pairs, and where every result column is in the aggregated rows
+        # (the values of the group by columns come first, then the results of the aggregates)
+        aggregates, output = [], []
+        column_names, column_types = [], []
+        for col in return_columns.split(','):
+            col = ''.join(col.split()) # the names of the aggregates have no whitespace, e.g. count(*)
+            match = AGGREGATE.fullmatch(col)
+            if match is None:
+                if col not in group_names:
+                    raise ValueError(f'Column "{col}" must be in group by or used in an aggregate.')
+                output.append(group_names.index(col))
+                column_type = self.column_types[self.column_names.index(col)]
+            else:
+                function, argument = match.groups()
+                if argument == '*':
+                    if function != 'count':
+                        raise ValueError(f'Only count can be used with *, not {function}.')
+                    column, column_type = None, int
+                else:
+                    if argument not in self.column_names:
+                        raise ValueError(f'Column "{argument}" does not exist.')
+                    column = self.column_names.index(argument)
+                    column_type = self.column_types[column]
+                    if function in ('sum', 'avg') and column_type not in (int, float):
+                        raise ValueError(f'{function} needs a numeric column, "{argument}" is {column_type.__name__}.')
+                    column_type = {'count': int, 'avg': float}.get(function, column_type)
+                output.append(len(group_names)+len(aggregates))
+                aggregates.append((function, column))
+            column_names.append(col)
+            column_types.append(column_type)
+
+        # only the columns that are grouped by or aggregated are read
+        needed = sorted(set(group_cols) | {column for _, column in aggregates if column is not None})
+        position = {column: i for i, column in enumerate(needed)}
+        if rows is not None:
+            rows = pipeline.project(rows if plan is None else pipeline.where(rows, plan), needed)
+            ordered = False
+        else:
+            ids = plan.rows(self) if plan is not None else self._live_rows()
+            rows = pipeline.scan(self, ids, needed)
+            # rows that come ordered by the group by columns (e.g. inserted in order) are grouped as they are read
+            columns = [self.column_by_name(name) for name in group_names]
+            ordered = bool(columns) and pipeline.is_ordered(zip(*[map(column.__getitem__, ids) for column in columns]))
 
-        if order_by:
-            s_table.order_by(order_by, desc)
+        rows = pipeline.aggregate(rows, [position[column] for column in group_cols],
+                                  [(function, position.get(column)) for function, column in aggregates], ordered)
+        return pipeline.project(rows, output), column_names, column_types
 
-        # if isinstance(limit, str):
-        #     try:
-        #         k = int(limit)
-        #     except ValueError:
-        #         raise Exception("The value following 'top' in the query should be a number.")
-            
-        #     # Remove from the table's data all the None-filled rows, as they are not shown by default
-        #     # Then, show the first k rows 
-        #     s_table.data.remove(len(s_table.column_names) * [None])
-        #     s_table.data = s_table.data[:k]
-        if isinstance(limit,str):
-            s_table.data = [row for row in s_table.data if any(row)][:int(limit)]
+    def _live_rows(self):
+        '''
+        Return the indexes of the rows that are not deleted (deleted rows are filled with Nones).
+        '''
+        if self.pk_idx is not None: # the primary key is never None, unless the row is deleted
+            return [i for i, value in enumerate(self.column_by_name(self.pk)) if value is not None]
+        return [i for i, row in enumerate(self.data) if any(value is not None for value in row)]
 
-        return s_table
+    def _selection(self, data, columns):
+        '''
+        Return a table with the attributes of this one, the specified columns and data (the result of a select).
 
+        Args:
+            data: list. The rows of the result (or a view of the rows of this table, see selection.py).
+            columns: list. Indexes of the columns of the result.
+        '''
+        # copy the old dict, but with the rows and columns of the result
+        dict = {key: value for key, value in self.__dict__.items() if key not in ('data', '_pk_set', '_row_count')}
+        dict['data'] = data
 
-    def _select_where_with_btree(self, return_columns, bt, condition, distinct=False, order_by=None, desc=True, limit=None):
+        # we need to set the new column names/types and no of columns, since we might
+        # only return some columns
+        dict['column_names'] = [self.column_names[i] for i in columns]
+        dict['column_types']   = [self.column_types[i] for i in columns]
+        # the primary key is only kept if its column is selected
+        pk_idx = getattr(self, 'pk_idx', None)
+        dict['pk_idx'] = columns.index(pk_idx) if pk_idx in columns else None
+        dict['pk'] = self.column_names[pk_idx] if dict['pk_idx'] is not None else None
+
+        return Table(load=dict)
+
+
+    def _select_where_with_btree(self, return_columns, bt, condition, distinct=False, order_by=None, desc=True, limit=None, view=False):
 
         # if * return all columns, else find the column indexes for the columns specified
         if return_columns == '*':
             return_cols = [i for i in range(len(self.column_names))]
         else:
-            return_cols = [self.column_names.index(colname) for colname in return_columns]
+            return_cols = [self.column_names.index(col.strip()) for col in return_columns.split(',')]
 
 
-        column_name, operator, value = self._parse_condition(condition)
+        plan = compile_condition(condition, self) # a single comparison (see Database.select)
+        column_name, operator, value = plan.column, plan.op, plan.value
 
         # if the column in condition is not a primary key, abort the select
-        if column_name != self.column_names[self.pk_idx]:
-            print('Column is not PK. Aborting')
-
-        # here we run the same select twice, sequentially and using the btree.
-        # we then check the results match and compare performance (number of operation)
-        column = self.column_by_name(column_name)
-
-        # sequential
-        rows1 = []
-        opsseq = 0
-        for ind, x in enumerate(column):
-            opsseq+=1
-            if get_op(operator, x, value):
-                rows1.append(ind)
-
-        # btree find
+        if self.pk_idx is None or column_name != self.column_names[self.pk_idx]:
+            raise ValueError(f'Column "{column_name}" is not the primary key. The index cannot be used.')
+
+        # btree find (the table itself is not scanned)
         rows = bt.find(operator, value)
 
-        try:
-            k = int(limit)
-        except TypeError:
-            k = None
+        # (limit is a string, see _select_where. It can only be applied now if the rows are not reordered or removed)
+        k = int(limit) if isinstance(limit, str) else None
+        if not (distinct or order_by):
+            rows = rows[:k]
         # same as simple select from now on
-        rows = rows[:k]
-        # TODO: this needs to be dumbed down
-        dict = {(key):([[self.data[i][j] for j in return_cols] for i in rows] if key=="data" else value) for key,value in self.__dict__.items()}
-
-        dict['column_names'] = [self.column_names[i] for i in return_cols]
-        dict['column_types']   = [self.column_types[i] for i in return_cols]
-
-        s_table = Table(load=dict)
+        if view: # see _select_where
+            s_table = self._selection(SelectionRows(self.data, rows, None if return_columns == '*' else return_cols), return_cols)
+        else:
+            s_table = self._selection(self._gather(rows, return_cols), return_cols)
 
         s_table.data = list(set(map(lambda x: tuple(x), s_table.data))) if distinct else s_table.data
 
@@ -336,8 +668,19 @@ class Table:
         idx = sorted(range(len(column)), key=lambda k: column[k], reverse=desc)
         # print(idx)
         self.data = [self.data[i] for i in idx]
+        self._version += 1
         # self._update()
 
+    def _sort(self, column_name, asc=False):
+        '''
+        Sort the table (in place) based on a column.
+
+        Args:
+            column_name: string. Name of column.
+            asc: boolean. If True, the table will be sorted in ascending order (False by default).
+        '''
+        self.order_by(column_name, desc=not asc)
+
 
     def _general_join_processing(self, table_right:Table, condition, join_type):
         '''
@@ -383,6 +726,23 @@ class Table:
         return join_table, column_index_left, column_index_right, operator
 
 
+    def _join_rows(self, table_right: Table, condition, join_type):
+        '''
+        Return the (empty) joined table and a generator of its rows (see pipeline.join), which can stream into
+        the next operator (see _select_where) instead of being materialized.
+
+        Args:
+            table_right: Table. The right table.
+            condition: string. A condition using the following format:
+                'column[<,<=,==,>=,>]value' or
+                'value[<,<=,==,>=,>]column'.
+                
+                Operators supported: (<,<=,==,>=,>)
+            join_type: string. 'inner', 'left', 'right' or 'full'.
+        '''
+        join_table, column_index_left, column_index_right, operator = self._general_join_processing(table_right, condition, join_type)
+        return join_table, pipeline.join(self, table_right, column_index_left, column_index_right, operator, join_type)
+
     def _inner_join(self, table_right: Table, condition):
         '''
         Join table (left) with a supplied table (right) where condition is met.
@@ -394,24 +754,10 @@ class Table:
                 
                 Operators supported: (<,<=,==,>=,>)
         '''
-        join_table, column_index_left, column_index_right, operator = self._general_join_processing(table_right, condition, 'inner')
-
-        # count the number of operations (<,> etc)
-        no_of_ops = 0
-        # this code is dumb on purpose... it needs to illustrate the underline technique
-        # for each value in left column and right column, if condition, append the corresponding row to the new table
-        for row_left in self.data:
-            left_value = row_left[column_index_left]
-            for row_right in table_right.data:
-                right_value = row_right[column_index_right]
-                if(left_value is None and right_value is None):
-                    continue
-                no_of_ops+=1
-                if get_op(operator, left_value, right_value): #EQ_OP
-                    join_table._insert(row_left+row_right)
-
+        join_table, rows = self._join_rows(table_right, condition, 'inner')
+        join_table.data = list(rows)
         return join_table
-    
+
     def _left_join(self, table_right: Table, condition):
         '''
         Perform a left join on the table with the supplied table (right).
@@ -423,23 +769,8 @@ class Table:
                 
                 Operators supported: (<,<=,==,>=,>)
         '''
-        join_table, column_index_left, column_index_right, operator = self._general_join_processing(table_right, condition, 'left')
-
-        right_column = table_right.column_by_name(table_right.column_names[column_index_right])
-        right_table_row_length = len(table_right.column_names)
-
-        for row_left in self.data:
-            left_value = row_left[column_index_left]
-            if left_value is None:
-                continue
-            elif left_value not in right_column:
-                join_table._insert(row_left + right_table_row_length*["NULL"])
-            else:
-                for row_right in table_right.data:
-                    right_value = row_right[column_index_right]
-                    if left_value == right_value:
-                        join_table._insert(row_left + row_right)
-
+        join_table, rows = self._join_rows(table_right, condition, 'left')
+        join_table.data = list(rows)
         return join_table
 
     def _right_join(self, table_right: Table, condition):
@@ -453,25 +784,10 @@ class Table:
                 
                 Operators supported: (<,<=,==,>=,>)
         '''
-        join_table, column_index_left, column_index_right, operator = self._general_join_processing(table_right, condition, 'right')
-
-        left_column = self.column_by_name(self.column_names[column_index_left])
-        left_table_row_length = len(self.column_names)
-
-        for row_right in table_right.data:
-            right_value = row_right[column_index_right]
-            if right_value is None:
-                continue
-            elif right_value not in left_column:
-                join_table._insert(left_table_row_length*["NULL"] + row_right)
-            else:
-                for row_left in self.data:
-                    left_value = row_left[column_index_left]
-                    if left_value == right_value:
-                        join_table._insert(row_left + row_right)
-
+        join_table, rows = self._join_rows(table_right, condition, 'right')
+        join_table.data = list(rows)
         return join_table
-    
+
     def _full_join(self, table_right: Table, condition):
         '''
         Perform a full join on the table with the supplied table (right).
@@ -483,34 +799,8 @@ class Table:
                 
                 Operators supported: (<,<=,==,>=,>)
         '''
-        join_table, column_index_left, column_index_right, operator = self._general_join_processing(table_right, condition, 'full')
-
-        right_column = table_right.column_by_name(table_right.column_names[column_index_right])
-        left_column = self.column_by_name(self.column_names[column_index_left])
-
-        right_table_row_length = len(table_right.column_names)
-        left_table_row_length = len(self.column_names)
-        
-        for row_left in self.data:
-            left_value = row_left[column_index_left]
-            if left_value is None:
-                continue
-            if left_value not in right_column:
-                join_table._insert(row_left + right_table_row_length*["NULL"])
-            else:
-                for row_right in table_right.data:
-                    right_value = row_right[column_index_right]
-                    if left_value == right_value:
-                        join_table._insert(row_left + row_right)
-
-        for row_right in table_right.data:
-            right_value = row_right[column_index_right]
-
-            if right_value is None:
-                continue
-            elif right_value not in left_column:
-                join_table._insert(left_table_row_length*["NULL"] + row_right)
-
+        join_table, rows = self._join_rows(table_right, condition, 'full')
+        join_table.data = list(rows)
         return join_table
 
     def show(self, no_of_rows=None, is_locked=False):
@@ -535,7 +825,7 @@ class Table:
             headers[self.pk_idx] = headers[self.pk_idx]+' #PK#'
         # detect the rows that are no tfull of nones (these rows have been deleted)
         # if we dont skip these rows, the returning table has empty rows at the deleted positions
-        non_none_rows = [row for row in self.data if any(row)]
+        non_none_rows = [row for row in self.data if any(value is not None for value in row)]
         # print using tabulate
         print(tabulate(non_none_rows[:no_of_rows], headers=headers)+'\n')
 
@@ -0,0 +1,205 @@
+'''
+Append-only write-ahead log (WAL) of a database.
+
+Every insert/update/delete on a (non meta) table is appended to the log as a binary record, instead of
+pickling the whole table after every statement. The table files are brought up to date periodically
+(checkpoint), after which the log is truncated. On load, the log is replayed on top of the table files.
+
+Record format: a fixed size header (operation, payload length, crc32 of the payload) followed by the
+pickled payload (table name and the arguments of the operation). A record whose header or payload is
+incomplete or does not match its checksum (e.g. the process crashed while writing it) ends the log.
+
+Many processes may append to the log: every record is written with a single write on a file opened for appending,
+so records are never interleaved. They hold the log lock (LOCK, see Database._log) in shared mode while they
+append, and processes that need the log to themselves (recovery, checkpoints) hold it in exclusive mode.
+
+Records are flushed to disk with group commit: while a thread flushes the log, the records appended by other
+threads wait and are flushed together by the next flush, so concurrent statements share a single fsync.
+'''
+import os
+import pickle
+import struct
+import threading
+import zlib
+from time import sleep
+
+# operations
+INSERT = 1 # args: row ids, rows (the rows are placed at the row ids)
+UPDATE = 2 # args: row ids, column index, value (the column of the rows is set to value)
+DELETE = 3 # args: row ids (the rows are replaced with rows of Nones)
+
+HEADER = struct.Struct('<BII')
+
+# name of the log lock in the lock manager of the database (tables whose names start with meta are never locked,
+# so it does not clash with the lock of a table)
+LOCK = 'meta_log'
+
+
+class WriteAheadLog:
+    '''
+    The write-ahead log of a database, stored in a single file.
+    '''
+    def __init__(self, path, commit_window=0):
+        '''
+        Args:
+            path: string. Path of the log file (created on the first append).
+            commit_window: float. Seconds a flush waits for more records to be appended before it starts (0 to not wait).
+        '''
+        self.path = path
+        self.commit_window = commit_window
+        self.fd = None # opened for appending
+        self.no_of_records = 0 # records written since the last checkpoint
+        self._lock = threading.Lock() # guards the file (writes, truncation)
+        self._flushed = threading.Condition()
+        self._written = 0 # sequence number of the last record written to the file
+        self._synced = 0 # sequence number of the last record flushed to disk
+        self._syncing = False # whether a thread is flushing the log
+
+    def append(self, operation, table_name, *args):
+        '''
+        Append a record to the log. Returns (the size of the record) when the record has been flushed to disk.
+
+        Args:
+            operation: int. One of INSERT, UPDATE, DELETE.
+            table_name: string. The table the operation was applied to.
+            args: The arguments of the operation (see the operations above).
+        '''
+        payload = pickle.dumps((table_name,)+args, protocol=pickle.HIGHEST_PROTOCOL)
+        record = HEADER.pack(operation, len(payload), zlib.crc32(payload))+payload
+        with self._lock:
+            if self.fd is None:
+                self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            written = os.write(self.fd, record)
+            if written < len(record): # (only if the disk is full, the rest of the record is not written)
+                raise OSError(f'Could not append to the write-ahead log ({written} of {len(record)} bytes written).')
+            self.no_of_records += 1
+            self._written += 1
+            seq = self._written
+        self._sync(seq)
+        return len(record)
+
+    def _sync(self, seq):
+        '''
+        Wait until the record with the specified sequence number is on disk. If no other thread is flushing the log,
+        the calling thread flushes it (along with the records appended by the threads that wait for it).
+        '''
+        with self._flushed:
+            while self._synced < seq and self._syncing:
+                self._flushed.wait()
+            if self._synced >= seq:
+                return
+            self._syncing = True
+
+        synced = None
+        try:
+            if self.commit_window:
+                sleep(self.commit_window) # let more records join this flush
+            with self._lock:
+                written = self._written
+                fd = None
+                if self.fd is not None: # else the log was emptied by a checkpoint (the records are in the table files)
+                    fd = os.dup(self.fd) # the file may be closed by a checkpoint while we fsync
+            if fd is not None:
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            synced = written
+        finally:
+            with self._flushed:
+                self._syncing = False
+                if synced is not None:
+                    self._synced = synced
+                self._flushed.notify_all()
+
+    def read(self):
+        '''
+        Return the list of valid records in the log as (operation, table_name, args) tuples.
+        The bytes after the last valid record (a record that another process is appending, or a torn write) are ignored.
+        '''
+        records, _ = self._read()
+        self.no_of_records = len(records)
+        return records
+
+    def recover(self):
+        '''
+        Cut an incomplete/corrupted record (a torn write) off the end of the log, so that new records are not appended
+        after it. Only while no other process appends to the log (holding the log lock in exclusive mode).
+        '''
+        records, end = self._read()
+        if os.path.isfile(self.path) and os.path.getsize(self.path) != end:
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)
+                f.flush()
+                os.fsync(f.fileno())
+        self.no_of_records = len(records)
+
+    def _read(self):
+        '''
+        Return the valid records of the log and the offset right after the last one.
+        '''
+        records = []
+        if not os.path.isfile(self.path):
+            return records, 0
+
+        with open(self.path, 'rb') as f:
+            end = 0
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                operation, length, crc = HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                table_name, *args = pickle.loads(payload)
+                records.append((operation, table_name, args))
+                end = f.tell()
+        return records, end
+
+    def truncate(self):
+        '''
+        Empty the log (called after a checkpoint, when every logged change is in the table files).
+        '''
+        with self._lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+            with open(self.path, 'wb'):
+                pass
+            self.no_of_records = 0
+
+
+def redo(table, operation, args):
+    '''
+    Apply a logged operation to a table (used when replaying the log).
+    Every operation places values on specific row ids, so applying a record twice has no extra effect.
+
+    Args:
+        table: Table. The table the operation was logged for.
+        operation: int. One of INSERT, UPDATE, DELETE.
+        args: list. The arguments of the operation.
+    '''
+    if operation == INSERT:
+        row_ids, rows = args
+        for row_id, row in zip(row_ids, rows):
+            if row_id < len(table.data):
+                table.data[row_id] = list(row)
+            else:
+                table.data.append(list(row))
+    elif operation == UPDATE:
+        row_ids, column_idx, value = args
+        for row_id in row_ids:
+            row = list(table.data[row_id])
+            row[column_idx] = value
+            table.data[row_id] = row
+    elif operation == DELETE:
+        row_ids, = args
+        for row_id in row_ids:
+            table.data[row_id] = [None for _ in range(len(table.column_names))]
+    else:
+        raise ValueError(f'Unknown log operation {operation}.')
+    # the rows were modified directly, the set of keys and the number of rows are computed again when needed
+    table._pk_set = None
+    table._row_count = None
+    table._version += 1
@@ -1,28 +1,85 @@
-from ..db.btree import Btree
-from random import randrange
+import os
 import sys
+import unittest
+from random import randrange, Random
+
+sys.path.append(f'{os.path.dirname(os.path.dirname(os.path.abspath(__file__)))}/miniDB')
+from btree import Btree
 
-import os
 os.environ["PATH"] += os.pathsep + 'C:/Program Files/Graphviz/bin/'
 
 '''
 Test the Btree
+
+Run the tests with
+    python -m pytest tests/btreeTest.py
+or plot a tree of NUM random values with branching factor B with
+    python tests/btreeTest.py NUM B
 '''
 
-NUM = int(sys.argv[1])
-B = int(sys.argv[2])
 
-lst = []
+def build(keys, b):
+    '''
+    Return a Btree with branching factor b, where the ptr of every key is its position in keys.
+    '''
+    bt = Btree(b)
+    for ptr, key in enumerate(keys):
+        bt.insert(key, ptr)
+    return bt
+
+
+class BtreeTest(unittest.TestCase):
+
+    def setUp(self):
+        # keys inserted out of order land in the middle of leaves (and split them)
+        self.keys = list(range(300))
+        Random(7).shuffle(self.keys)
+
+    def test_equality_returns_the_ptr_of_the_value(self):
+        # odd and even branching factors split leaves differently
+        for b in (3, 4, 5, 6):
+            bt = build(self.keys, b)
+            for ptr, key in enumerate(self.keys):
+                self.assertEqual(bt.find('=', key), [ptr], f'b={b}, key={key}')
+            self.assertEqual(bt.find('=', 1000), [])
+
+    def test_ranges_return_the_ptrs_of_the_matching_values(self):
+        for b in (3, 4):
+            bt = build(self.keys, b)
+            for operator, matches in (('>', lambda key: key>150), ('>=', lambda key: key>=150),
+                                      ('<', lambda key: key<42), ('<=', lambda key: key<=42)):
+                value = 150 if operator[0] == '>' else 42
+                expected = sorted(ptr for ptr, key in enumerate(self.keys) if matches(key))
+                self.assertEqual(sorted(bt.find(operator, value)), expected, f'b={b}, {operator}{value}')
+
+    def test_remap_moves_the_ptrs_and_drops_the_removed_rows(self):
+        bt = build(self.keys, 3)
+        # every other row is removed and the rest are moved next to each other (see Table._vacuum)
+        new_ptrs = {ptr: ptr//2 for ptr in range(0, len(self.keys), 2)}
+        bt.remap(new_ptrs)
+        for ptr, key in enumerate(self.keys):
+            self.assertEqual(bt.find('=', key), [new_ptrs[ptr]] if ptr in new_ptrs else [])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        unittest.main()
+        sys.exit()
+
+    NUM = int(sys.argv[1])
+    B = int(sys.argv[2])
+
+    lst = []
 
-while len(lst)!=NUM:
-    new_v = randrange(100)
-    if new_v not in lst:
-        lst.append(new_v)
+    while len(lst)!=NUM:
+        new_v = randrange(100)
+        if new_v not in lst:
+            lst.append(new_v)
 
-bt = Btree(B)
+    bt = Btree(B)
 
-for ind, el in enumerate(lst):
-    bt.insert(el, ind)
+    for ind, el in enumerate(lst):
+        bt.insert(el, ind)
 
-print(lst)
-bt.plot()
+    print(lst)
+    bt.plot()
@@ -0,0 +1,51 @@
+import unittest
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+
+class LazyLoadTest(DatabaseTestCase):
+    '''
+    Tables are loaded the first time they are accessed, kept in memory, and loaded again if another process
+    (here, another Database object) modified them.
+    '''
+    def setUp(self):
+        super().setUp()
+        db = self.database()
+        db.create_table('a', 'id,name', 'int,str', primary_key='id')
+        db.create_table('b', 'id', 'int')
+        db.insert_into('a', '1,x')
+        db.checkpoint()
+
+    def test_tables_are_loaded_when_accessed(self):
+        db = self.database(load=True)
+        self.assertEqual(set(db.tables.keys()), {'a', 'b', 'meta_length', 'meta_insert_stack', 'meta_indexes'})
+        self.assertFalse(db.tables.is_loaded('a'))
+        self.assertEqual(live_rows(db.select('*', 'a', None)), [[1, 'x']])
+        self.assertTrue(db.tables.is_loaded('a'))
+        self.assertFalse(db.tables.is_loaded('b'))
+
+    def test_loaded_tables_are_kept_in_memory(self):
+        db = self.database(load=True)
+        table = db.tables['a']
+        db.select('*', 'a', None)
+        db.load_database()
+        self.assertIs(db.tables['a'], table)
+
+    def test_tables_modified_by_another_process_are_loaded_again(self):
+        db, other = self.database(load=True), self.database(load=True)
+        db.select('*', 'a', None)
+        other.insert_into('a', '2,y') # logged
+        self.assertEqual(live_rows(db.select('*', 'a', None)), [[1, 'x'], [2, 'y']])
+        other.sort('a', 'id', asc=False) # saved
+        self.assertEqual(live_rows(db.select('*', 'a', None)), [[2, 'y'], [1, 'x']])
+
+    def test_tables_dropped_by_another_process_are_forgotten(self):
+        db, other = self.database(load=True), self.database(load=True)
+        db.select('*', 'b', None)
+        other.drop_table('b')
+        db.load_database()
+        self.assertNotIn('b', db.tables)
+
+
+if __name__ == '__main__':
+    unittest.main()
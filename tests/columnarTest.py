@@ -0,0 +1,85 @@
+import unittest
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+from columnar import ColumnarData, TypedColumns
+
+
+class ColumnarTest(DatabaseTestCase):
+    '''
+    Columnar data (and typed columns) read back the rows they were created from, whatever their values.
+    '''
+    rows = [[1, 1.5, 'a'], [None, None, None], [-2**63, -0.0, ''], [2**63-1, 1e300, 'ünï']]
+
+    def test_rows_are_read_back(self):
+        data = ColumnarData.create('t.cols', self.rows, [int, float, str])
+        self.assertEqual(list(data), self.rows)
+        self.assertEqual(data[1], [None, None, None])
+        self.assertEqual(list(data.column(2)), [row[2] for row in self.rows])
+        self.assertEqual(list(TypedColumns([int, float, str], self.rows)), self.rows)
+
+    def test_values_that_do_not_fit_in_an_array_are_read_back(self):
+        # 'NULL' strings, uncasted values (e.g. set by update) and ints that do not fit in 8 bytes
+        rows = self.rows+[['NULL', 'NULL', 'NULL'], ['5000', 2, 'x'], [2**64, 1.0, 'y']]
+        data = ColumnarData.create('t.cols', rows, [int, float, str])
+        self.assertEqual(list(data), rows)
+        self.assertEqual(list(data.column(0)), [row[0] for row in rows])
+        self.assertEqual(type(data[-2][1]), int)
+        self.assertEqual(list(data.copy()), rows)
+        self.assertEqual(list(TypedColumns([int, float, str], rows)), rows)
+
+    def test_columnar_tables(self):
+        db = self.database(storage='columnar')
+        db.create_table('a', 'id,salary', 'int,int', primary_key='id')
+        db.insert_many('a', ['1,100', '2,NULL', '3,300'])
+        db.checkpoint()
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), [[1, 100], [2, 'NULL'], [3, 300]])
+        db.update_table('a', 'salary=500', 'id=3') # (the set value is stored as it was given)
+        db.delete_from('a', 'id=1')
+        db.vacuum('a')
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), live_rows(db.tables['a']))
+        self.assertEqual(live_rows(db.tables['a'])[0], [2, 'NULL'])
+
+
+class TypedColumnsTest(DatabaseTestCase):
+    '''
+    Rows kept in memory column by column (the 'typed' storage).
+    '''
+    def test_rows_and_columns(self):
+        data = TypedColumns([int, float, str], [[1, 1.5, 'a'], [None, 2.5, None]])
+        data.append([3, None, 'c'])
+        data[0] = [4, 4.5, 'd']
+        self.assertEqual(list(data), [[4, 4.5, 'd'], [None, 2.5, None], [3, None, 'c']])
+        self.assertEqual(data[-2], [None, 2.5, None])
+        self.assertEqual(list(data.column(1)), [4.5, 2.5, None])
+        self.assertEqual(data.null_counts, [1, 1, 0])
+        copy = data.copy()
+        data[1] = [5, 5.5, 'e']
+        self.assertEqual(copy[1], [None, 2.5, None])
+        self.assertEqual(data.null_counts, [0, 1, 0])
+        with self.assertRaises(NotImplementedError):
+            del data[0]
+        with self.assertRaises(NotImplementedError):
+            data.insert(0, [6, 6.5, 'f'])
+
+    def test_typed_tables(self):
+        results = {}
+        for storage in ('pickle', 'typed'):
+            db = self.database(storage, storage=storage)
+            db.create_table('a', 'id,dept,salary', 'int,str,int', primary_key='id')
+            db.insert_many('a', [[i, f'dept {i%3}', 1000*i] for i in range(100)])
+            db.cast('salary', 'a', 'float')
+            db.insert_into('a', '100,dept 0,NULL')
+            db.update_table('a', 'dept=none', 'salary>90000')
+            db.delete_from('a', 'id<10')
+            db.vacuum('a')
+            db.sort('a', 'id', asc=False)
+            results[storage] = [live_rows(db.select('*', 'a', 'salary>=50000 or id=100')),
+                                live_rows(db.select('dept,count(*)', 'a', None, group_by='dept', order_by='dept', desc=False)),
+                                live_rows(self.database(storage, load=True).tables['a'])]
+        self.assertEqual(results['typed'], results['pickle'])
+        self.assertIsInstance(db.tables['a'].data, TypedColumns)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import random
+import unittest
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+from compression import CompressedRows, COMPRESSORS, encode_column, decode_column
+
+
+class CompressionTest(DatabaseTestCase):
+    '''
+    Compressed rows (and every column encoding) decode to the rows they were encoded from.
+    '''
+    def setUp(self):
+        super().setUp()
+        random.seed(7)
+
+    def round_trip(self, values):
+        encoding, data = encode_column(values)
+        decoded = decode_column(encoding, data, len(values))
+        self.assertEqual(decoded, values)
+        self.assertEqual([type(value) for value in decoded], [type(value) for value in values])
+        return encoding
+
+    def test_column_encodings(self):
+        self.assertEqual(self.round_trip(sorted(random.randrange(5) for _ in range(1000))), 'rle')
+        self.assertEqual(self.round_trip(list(range(-500, 500, 3))), 'delta')
+        self.assertEqual(self.round_trip([random.randrange(-2**70, 2**70) for _ in range(100)]), 'delta')
+        self.assertEqual(self.round_trip([random.choice(['a', 'b', None, 'NULL', 1, 1.0, True]) for _ in range(1000)]), 'dict')
+        self.assertEqual(self.round_trip([random.random() for _ in range(100)]), 'plain')
+        self.assertEqual(self.round_trip([[i] for i in range(10)]), 'plain')
+        for values in ([], [5], [None], [0, 0], [1, 2]):
+            self.round_trip(values)
+
+    def test_rows_are_decoded(self):
+        rows = [[i, f'name {i%10}', i*0.5, None] for i in range(2000)]+[[None]*4]*10
+        for compressor in COMPRESSORS:
+            encoded = CompressedRows.encode(rows, 4, compressor)
+            self.assertEqual(encoded.decode(), rows)
+        self.assertEqual(CompressedRows.encode([], 4).decode(), [])
+
+    def test_compressed_tables(self):
+        sizes = {}
+        for storage in ('pickle', 'compressed'):
+            db = self.database(storage, storage=storage)
+            db.create_table('a', 'id,dept,salary', 'int,str,int', primary_key='id')
+            db.insert_many('a', [[i, f'dept {i%5}', 1000+i%7] for i in range(5000)])
+            db.delete_from('a', 'id<100')
+            db.checkpoint()
+            self.assertEqual(live_rows(self.database(storage, load=True).tables['a']), live_rows(db.tables['a']))
+            sizes[storage] = os.path.getsize(f'{db.savedir}/a.pkl')
+        self.assertLess(sizes['compressed'], sizes['pickle']/5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import random
+import unittest
+from array import array
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+import misc
+from columnar import ColumnarData, NullableColumn, TypedColumns
+from conditions import And, Or, compile_condition
+from misc import OPERATORS, find_rows, get_op
+from table import Table
+
+
+class FindRowsTest(DatabaseTestCase):
+    '''
+    Comparisons evaluated over a whole column (misc.find_rows) match the ones evaluated value by value (get_op).
+    '''
+    def setUp(self):
+        super().setUp()
+        random.seed(3)
+        self.values = [random.choice([None, random.randrange(-5, 5)]) for _ in range(200)]
+
+    def columns(self):
+        # the same values as a list, a typed column, a memory-mapped column and a list with other types of values
+        yield self.values
+        yield TypedColumns([int], [[value] for value in self.values]).column(0)
+        yield ColumnarData.create('t.cols', [[value] for value in self.values], [int]).column(0)
+        yield self.values+['NULL']
+
+    def check(self):
+        for column in self.columns():
+            self.assertIsInstance(column, (list, array, NullableColumn))
+            for op in OPERATORS:
+                for value in (-6, 0, 3, 2**70):
+                    expected = [i for i, x in enumerate(column) if x is not None and get_op(op, x, value)]
+                    self.assertEqual(find_rows(column, op, value), expected, (type(column), op, value))
+
+    def test_find_rows(self):
+        self.check()
+
+    @unittest.skipIf(misc.numpy is None, 'numpy is not installed')
+    def test_find_rows_without_numpy(self):
+        numpy, misc.numpy = misc.numpy, None
+        try:
+            self.check()
+        finally:
+            misc.numpy = numpy
+
+
+class StorageConditionsTest(DatabaseTestCase):
+    '''
+    Selects return the same rows whichever way the rows are stored (the typed and columnar storages evaluate conditions
+    on whole columns).
+    '''
+    def test_the_storages_select_the_same_rows(self):
+        results = {}
+        for storage in ('pickle', 'typed', 'columnar'):
+            db = self.database(storage, storage=storage)
+            db.create_table('a', 'id,score,name', 'int,float,str')
+            db.insert_many('a', [[i, i/4, f'n{i%7}'] for i in range(60)])
+            db.delete_from('a', 'id<5')
+            db.insert_into('a', '100,NULL,x')
+            db.checkpoint()
+            db = self.database(storage, load=True)
+            results[storage] = [live_rows(db.select('*', 'a', condition))
+                                for condition in ('id>=50', 'id!=7', 'score<3', 'score=2.5', 'name=n3', 'id>99999999999999999999')]
+        self.assertEqual(results['typed'], results['pickle'])
+        self.assertEqual(results['columnar'], results['pickle'])
+        self.assertEqual(len(results['pickle'][1]), 55) # the deleted rows never match
+
+
+class CompileConditionTest(DatabaseTestCase):
+    '''
+    WHERE clauses with and, or, not, between and in, compiled into plans that check single rows or find the matching
+    rows of a table.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.table = Table(name='t', column_names=['id', 'dept', 'salary', 'bonus'], column_types=[int, str, int, int], primary_key='id')
+        depts = ['comp. sci.', 'physics', 'music', None]
+        for i in range(40):
+            salary = None if i % 9 == 0 else 1000*(i % 13)
+            self.table.data.append([i, depts[i % 4], salary, i % 5 * 1000])
+        self.table.data[7] = [None]*4 # deleted
+        self.table.data[8][2] = 'NULL'
+
+    def check(self, condition, expected):
+        '''
+        Check that the rows matching condition are the ones for which expected(id, dept, salary, bonus) is true.
+        (Deleted rows and None values never satisfy a comparison, negated or not. 'NULL' strings are values.)
+        '''
+        plan = compile_condition(condition, self.table)
+        rows = plan.rows(self.table)
+        self.assertEqual(rows, [i for i, row in enumerate(self.table.data) if plan(row)], condition)
+        self.assertEqual(rows, [i for i, row in enumerate(self.table.data) if row[0] is not None and expected(*row)], condition)
+        return plan
+
+    def test_comparisons(self):
+        number = lambda value: isinstance(value, int)
+        self.check('salary>5000', lambda id, dept, salary, bonus: number(salary) and salary > 5000)
+        self.check('5000<salary', lambda id, dept, salary, bonus: number(salary) and salary > 5000)
+        self.check('salary!=5000', lambda id, dept, salary, bonus: salary is not None and salary != 5000)
+        self.check('dept="comp. sci."', lambda id, dept, salary, bonus: dept == 'comp. sci.')
+        self.check('salary<=bonus', lambda id, dept, salary, bonus: number(salary) and salary <= bonus)
+        self.check('not salary>5000', lambda id, dept, salary, bonus: number(salary) and salary <= 5000)
+
+    def test_and_or_not(self):
+        self.check('salary>5000 and dept=physics or id<3',
+                   lambda id, dept, salary, bonus: isinstance(salary, int) and salary > 5000 and dept == 'physics' or id < 3)
+        self.check('salary>5000 and (dept=physics or id<3)',
+                   lambda id, dept, salary, bonus: isinstance(salary, int) and salary > 5000 and (dept == 'physics' or id < 3))
+        self.check('not (dept=music or id>=30) and bonus=0',
+                   lambda id, dept, salary, bonus: dept is not None and dept != 'music' and id < 30 and bonus == 0)
+        self.check('not not id=3', lambda id, dept, salary, bonus: id == 3)
+        # (the second operand only checks the rows that matched the first one)
+        self.check('id<20 and salary!=5000', lambda id, dept, salary, bonus: id < 20 and salary is not None and salary != 5000)
+
+    def test_between_and_in(self):
+        number = lambda value: isinstance(value, int)
+        self.check('salary between 2000 and 4000', lambda id, dept, salary, bonus: number(salary) and 2000 <= salary <= 4000)
+        self.check('salary not between 2000 and 4000', lambda id, dept, salary, bonus: number(salary) and not 2000 <= salary <= 4000)
+        self.check('not salary between 2000 and 4000', lambda id, dept, salary, bonus: number(salary) and not 2000 <= salary <= 4000)
+        self.check('dept in (music, "comp. sci.")', lambda id, dept, salary, bonus: dept in ('music', 'comp. sci.'))
+        self.check('dept not in (music)', lambda id, dept, salary, bonus: dept is not None and dept != 'music')
+        self.check('id in (1, 2, 7, 100) or salary between 12000 and 12000',
+                   lambda id, dept, salary, bonus: id in (1, 2) or salary == 12000)
+
+    def test_operands_are_ordered_by_selectivity(self):
+        plan = self.check('dept!=music and id=5 and salary>1000',
+                          lambda id, dept, salary, bonus: id == 5)
+        self.assertIsInstance(plan, And)
+        self.assertEqual([repr(operand) for operand in plan._ordered], ['id=5', 'salary>1000', "dept!='music'"])
+        plan = self.check('id=5 or dept!=music', lambda id, dept, salary, bonus: id == 5 or dept not in (None, 'music'))
+        self.assertIsInstance(plan, Or)
+        self.assertEqual([repr(operand) for operand in plan._ordered], ["dept!='music'", 'id=5'])
+
+    def test_invalid_conditions(self):
+        for condition in ('salary>', 'salary>5000 and', '(id=1', 'id=1)', 'id not =1', 'name=x', 'id in ()', 'id between 1', 'id=x y'):
+            with self.assertRaises(ValueError, msg=condition):
+                compile_condition(condition, self.table)
+
+
+class WhereTest(DatabaseTestCase):
+    '''
+    Selects, updates and deletes with compound conditions.
+    '''
+    def test_statements(self):
+        db = self.database()
+        db.create_table('a', 'id,dept,salary', 'int,str,int', primary_key='id')
+        db.insert_many('a', [[i, ['x', 'y', 'z'][i % 3], 100*i] for i in range(30)])
+        self.assertEqual(live_rows(self.query(db, 'select id from a where dept in (x, y) and not salary between 300 and 2500')),
+                         [[0], [1], [27], [28]])
+        db.update_table('a', 'dept=w', 'id<3 or id>=27')
+        db.delete_from('a', 'dept=w and not (id=0 or id=29)')
+        self.assertEqual(live_rows(db.select('*', 'a', 'dept=w')), [[0, 'w', 0], [29, 'w', 2900]])
+        self.assertEqual(len(live_rows(db.tables['a'])), 26)
+
+
+if __name__ == '__main__':
+    unittest.main()
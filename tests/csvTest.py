@@ -0,0 +1,91 @@
+import bz2
+import csv
+import gzip
+import unittest
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+
+def write_csv(filename, rows, opener=open):
+    with opener(filename, 'wt', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+
+class ImportTest(DatabaseTestCase):
+    '''
+    Importing CSV files (Database.import_table), in chunks of rows.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.db = self.database()
+        self.rows = [[i, f'name {i}', 'a, "quoted"\nmultiline value' if i % 7 == 0 else 'plain', i/4] for i in range(100)]
+
+    def test_import(self):
+        write_csv('a.csv', [['id', 'name', 'note', 'score']]+self.rows)
+        for chunk_size in (1, 6, 1000): # (chunks never split a quoted value)
+            for workers in (None, 2):
+                name = f'a{chunk_size}_{workers}'
+                self.db.import_table(name, 'a.csv', 'int,str,str,float', 'id', chunk_size=chunk_size, workers=workers)
+                self.assertEqual(live_rows(self.db.tables[name]), self.rows)
+        self.assertEqual(live_rows(self.database(load=True).tables['a1_2']), self.rows)
+
+    def test_import_compressed_file_without_types(self):
+        write_csv('a.csv.gz', [['id', 'name']]+[[1, 'x'], [2, 'y']], gzip.open)
+        self.db.import_table('a', 'a.csv.gz')
+        self.assertEqual(self.db.tables['a'].column_types, [str, str])
+        self.assertEqual(live_rows(self.db.tables['a']), [['1', 'x'], ['2', 'y']])
+
+    def test_import_into_an_existing_table(self):
+        self.db.create_table('a', 'id,name', 'int,str', primary_key='id')
+        self.db.create_index('a_idx', 'a')
+        self.db.insert_into('a', '1,x')
+        write_csv('more.csv', [['id', 'name'], [2, 'y'], [3, 'z']])
+        self.db.import_table('a', 'more.csv')
+        self.assertEqual(live_rows(self.db.tables['a']), [[1, 'x'], [2, 'y'], [3, 'z']])
+        self.assertEqual(live_rows(self.db.select('*', 'a', 'id=3')), [[3, 'z']]) # (through the rebuilt index)
+        self.assertEqual(self.db.select('*', 'meta_length', 'table_name=a').column_by_name('no_of_rows'), [3])
+
+        write_csv('bad.csv', [['id', 'name']]+[[i, 'w'] for i in range(4, 20)]+[[1, 'w']])
+        with self.assertRaises(ValueError): # a duplicate key in the last chunk
+            self.db.import_table('a', 'bad.csv', chunk_size=5)
+        write_csv('other.csv', [['id', 'title'], [4, 'w']])
+        with self.assertRaises(ValueError):
+            self.db.import_table('a', 'other.csv')
+        self.assertEqual(live_rows(self.db.tables['a']), [[1, 'x'], [2, 'y'], [3, 'z']])
+
+
+class ExportTest(DatabaseTestCase):
+    '''
+    Exporting tables to CSV files (Database.export), and importing them back.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.db = self.database()
+        self.db.create_table('a', 'id,name,score', 'int,str,float', primary_key='id')
+        self.rows = [[i, f'{i}, "{i}"\nünï', i/3] for i in range(50)]
+        self.db.insert_many('a', self.rows)
+        self.db.delete_from('a', 'id<5')
+
+    def test_round_trip(self):
+        for filename in ('a.csv', 'a.csv.xz'):
+            self.db.export('a', filename)
+            self.db.import_table(filename.replace('.', '_'), filename, 'int,str,float', 'id')
+            self.assertEqual(live_rows(self.db.tables[filename.replace('.', '_')]), self.rows[5:]) # (deleted rows are not exported)
+        self.db.export('a', 'a.data', 'bz2')
+        with bz2.open('a.data', 'rt', newline='') as f:
+            self.assertEqual(len(list(csv.reader(f))), 46)
+
+    def test_export_a_selection(self):
+        self.db.export(self.db.select('id,score', 'a', 'id<8'), 'sel.csv')
+        with open('sel.csv', newline='') as f:
+            self.assertEqual(list(csv.reader(f)), [['id', 'score'], ['5', str(5/3)], ['6', '2.0'], ['7', str(7/3)]])
+
+    def test_nones_are_exported_as_null(self):
+        self.db.insert_many('a', [[100, 'x', None]])
+        self.db.export('a')
+        with open('a.csv', newline='') as f:
+            self.assertIn(['100', 'x', 'NULL'], list(csv.reader(f)))
+
+
+if __name__ == '__main__':
+    unittest.main()
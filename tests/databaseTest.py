@@ -0,0 +1,43 @@
+import unittest
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+
+class SaveTest(DatabaseTestCase):
+    '''
+    save_database only writes the tables that changed since they were last saved or loaded.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.db = self.database()
+        self.db.create_table('a', 'id,name', 'int,str', primary_key='id')
+        self.db.create_table('b', 'id,name', 'int,str', primary_key='id')
+
+    def test_only_the_modified_table_is_written(self):
+        before = {name: self.file_id(self.db, f'{name}.pkl') for name in ('a', 'b', 'meta_indexes')}
+        # sort is not logged (see walTest), the table is written as a whole
+        self.db.insert_into('a', '2,x')
+        self.db.insert_into('a', '1,y')
+        self.db.sort('a', 'id', asc=True)
+        self.assertNotEqual(self.file_id(self.db, 'a.pkl'), before['a'])
+        self.assertEqual(self.file_id(self.db, 'b.pkl'), before['b'])
+        self.assertEqual(self.file_id(self.db, 'meta_indexes.pkl'), before['meta_indexes'])
+
+    def test_saving_without_changes_writes_nothing(self):
+        before = {name: self.file_id(self.db, f'{name}.pkl') for name in self.db.tables.keys()}
+        self.db.save_database()
+        self.db.select('*', 'a', None)
+        self.assertEqual({name: self.file_id(self.db, f'{name}.pkl') for name in self.db.tables.keys()}, before)
+
+    def test_changes_are_saved(self):
+        self.db.insert_into('a', '1,x')
+        self.db.update_table('a', 'name=z', 'id=1')
+        self.db.sort('b', 'id')
+        self.db.checkpoint()
+        db = self.database(load=True)
+        self.assertEqual(live_rows(db.tables['a']), [[1, 'z']])
+        self.assertEqual(db.select('*', 'meta_length', 'table_name=a').column_by_name('no_of_rows'), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+from unittest import mock
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+import pipeline
+
+
+class AggregateTest(unittest.TestCase):
+    '''
+    pipeline.aggregate groups rows in a hash table, one group at a time if they are ordered, or spilling the groups
+    that do not fit in memory to disk.
+    '''
+    def setUp(self):
+        self.rows = [[i % 7, i % 3, None if i % 5 == 0 else 'NULL' if i % 11 == 0 else i] for i in range(200)]
+        self.aggregates = [('count', None), ('count', 2), ('sum', 2), ('avg', 2), ('min', 2), ('max', 2)]
+
+    def expected(self, rows, group_columns):
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(row[i] for i in group_columns), []).append(row)
+        result = []
+        for group, group_rows in groups.items():
+            values = [row[2] for row in group_rows if row[2] not in (None, 'NULL')]
+            result.append(list(group) + [len(group_rows), len(values), sum(values), sum(values)/len(values), min(values), max(values)])
+        return sorted(result)
+
+    def test_hash_aggregate(self):
+        self.assertEqual(sorted(pipeline.aggregate(self.rows, [0, 1], self.aggregates)), self.expected(self.rows, [0, 1]))
+
+    def test_ordered_rows_are_grouped_as_they_come(self):
+        rows = sorted(self.rows, key=lambda row: row[0])
+        with mock.patch.object(pipeline, '_hash_aggregate', side_effect=AssertionError('hashed')):
+            result = list(pipeline.aggregate(rows, [0], self.aggregates, ordered=True))
+        self.assertEqual(result, self.expected(rows, [0]))
+
+    def test_groups_that_do_not_fit_are_spilled(self):
+        rows = [[i % 50, 0, i] for i in range(1000)]
+        with mock.patch.object(pipeline, 'PARTITIONS', 3), mock.patch.object(pipeline._Spill, 'BATCH', 7), \
+                mock.patch.object(pipeline, '_Spill', wraps=pipeline._Spill) as spill:
+            result = list(pipeline.aggregate(rows, [0], self.aggregates, max_groups=4))
+        self.assertGreater(spill.call_count, 3) # the partitions were split again
+        self.assertEqual(len(result), 50)
+        self.assertEqual(sorted(result), self.expected(rows, [0]))
+
+    def test_without_group_columns(self):
+        self.assertEqual(list(pipeline.aggregate(self.rows, [], self.aggregates)), [self.expected(self.rows, [])[0]])
+        self.assertEqual(list(pipeline.aggregate([], [], self.aggregates)), [[0, 0, None, None, None, None]])
+
+
+class GroupByTest(DatabaseTestCase):
+    '''
+    Selects with aggregates and group by.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.rows = [[i, ['music', 'physics', 'biology'][i % 3], None if i % 10 == 0 else 1000*(i % 4)] for i in range(60)]
+
+    def create(self, storage):
+        db = self.database(storage, storage=storage)
+        db.create_table('a', 'id,dept,salary', 'int,str,int', primary_key='id')
+        db.insert_many('a', self.rows)
+        db.delete_from('a', 'id>=57')
+        db.checkpoint()
+        return self.database(storage, load=True)
+
+    def test_aggregates_for_every_storage(self):
+        expected = {}
+        for id, dept, salary in self.rows[:57]:
+            expected.setdefault(dept, []).append(salary)
+        expected = sorted([dept, len(salaries), sum(s for s in salaries if s is not None),
+                           max(s for s in salaries if s is not None)] for dept, salaries in expected.items())
+        for storage in ('pickle', 'typed', 'columnar', 'heap'):
+            db = self.create(storage)
+            result = db.select('dept, count(*), sum(salary), max(salary)', 'a', None, group_by='dept')
+            self.assertEqual(result.column_names, ['dept', 'count(*)', 'sum(salary)', 'max(salary)'])
+            self.assertEqual(result.column_types, [str, int, int, int])
+            self.assertEqual(sorted(live_rows(result)), expected, storage)
+
+    def test_sql(self):
+        db = self.create('pickle')
+        result = self.query(db, 'select dept, count(salary), avg(salary) from a where id<30 group by dept order by dept desc')
+        expected = []
+        for dept in ('physics', 'music', 'biology'):
+            salaries = [salary for id, d, salary in self.rows[:30] if d == dept and salary is not None]
+            expected.append([dept, len(salaries), sum(salaries)/len(salaries)])
+        self.assertEqual(live_rows(result), expected)
+        result = self.query(db, 'select count ( * ), min(dept) from a where dept!=music')
+        self.assertEqual(live_rows(result), [[38, 'biology']])
+
+    def test_spill(self):
+        db = self.database()
+        db.create_table('a', 'id,grp', 'int,int')
+        db.insert_many('a', [[i, i*7 % 40] for i in range(400)])
+        with mock.patch.object(pipeline, 'MAX_GROUPS', 5), mock.patch.object(pipeline, '_Spill', wraps=pipeline._Spill) as spill:
+            result = db.select('grp, count(*), min(id)', 'a', None, group_by='grp')
+            rows = sorted(live_rows(result))
+        self.assertTrue(spill.called)
+        self.assertEqual(rows, [[grp, 10, next(i for i in range(400) if i*7 % 40 == grp)] for grp in range(40)])
+
+    def test_null_values_are_ignored(self):
+        db = self.database()
+        db.create_table('a', 'dept,salary', 'str,int')
+        db.insert_many('a', [['x', 10], ['x', 'NULL'], ['y', 'NULL'], ['x', 20]])
+        result = db.select('dept, count(*), count(salary), sum(salary), avg(salary)', 'a', None, group_by='dept')
+        self.assertEqual(sorted(live_rows(result)), [['x', 3, 2, 30, 15.0], ['y', 1, 0, None, None]])
+
+    def test_invalid_aggregates(self):
+        db = self.create('pickle')
+        for columns, group_by in (('*', 'dept'), ('id, count(*)', 'dept'), ('sum(dept)', None), ('max(*)', None),
+                                  ('count(name)', None), ('dept', 'name')):
+            with self.assertRaises(ValueError, msg=columns):
+                db.select(columns, 'a', None, group_by=group_by)
+
+
+if __name__ == '__main__':
+    unittest.main()
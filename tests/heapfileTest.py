@@ -0,0 +1,97 @@
+import os
+import pickle
+import unittest
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+from heapfile import HeapFile, BufferPool, buffer_pool
+
+
+class HeapFileTest(DatabaseTestCase):
+    '''
+    The rows of heap tables are stored in pages, read and written through the buffer pool.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.rows = [[i, f'name {i}'] for i in range(500)]
+        self.heap = HeapFile.create('t.heap', self.rows, page_size=512)
+        self.heap.saved()
+
+    def test_rows_are_read_back(self):
+        self.assertGreater(len(self.heap.page_order), 1)
+        self.assertEqual(list(self.heap), self.rows)
+        self.assertEqual(self.heap[42], self.rows[42])
+        self.assertEqual(self.heap[-1], self.rows[-1])
+        self.assertEqual(list(pickle.loads(pickle.dumps(self.heap))), self.rows)
+
+    def test_rows_that_grow_split_their_page(self):
+        no_of_pages = len(self.heap.page_order)
+        for i in range(0, 500, 7):
+            self.rows[i] = [i, 'x'*100]
+            self.heap[i] = self.rows[i]
+        self.heap.append([500, 'last'])
+        self.rows.append([500, 'last'])
+        self.assertGreater(len(self.heap.page_order), no_of_pages)
+        self.assertEqual(list(self.heap), self.rows)
+        self.heap.flush()
+        self.assertEqual(list(pickle.loads(pickle.dumps(self.heap))), self.rows)
+
+    def test_the_pages_of_the_saved_layout_are_not_overwritten(self):
+        layout = pickle.dumps(self.heap) # the layout as it was saved (with the table)
+        for i in range(0, 500, 3):
+            self.heap[i] = [i, 'x'*100]
+        self.heap.flush()
+        # the process crashes before the new layout is saved: the saved one still reads the old rows
+        self.assertEqual(list(pickle.loads(layout)), self.rows)
+
+    def test_replaced_pages_are_reused_once_the_layout_is_saved(self):
+        sizes = []
+        for round in range(5):
+            for i in range(0, 500, 5):
+                self.heap[i] = [i, f'round {round}']
+            self.heap.flush()
+            self.heap.saved()
+            sizes.append(self.heap.no_of_pages)
+        # the first round allocates a page for every page it modifies, the rest reuse the pages freed by the previous one
+        self.assertEqual(len(set(sizes[1:])), 1)
+        self.assertEqual([row[1] for row in self.heap][:5], ['round 4']+[f'name {i}' for i in range(1, 5)])
+
+    def test_create_writes_a_new_generation(self):
+        heap = HeapFile.create('t.heap', [[1, 'a']])
+        self.assertEqual(sorted(os.listdir('.')), ['t.heap.1', 't.heap.2'])
+        self.assertEqual(list(self.heap), self.rows)
+        heap.saved()
+        self.assertEqual(os.listdir('.'), ['t.heap.2'])
+        self.assertEqual(list(heap), [[1, 'a']])
+
+    def test_the_buffer_pool_evicts_the_least_recently_used_pages(self):
+        pool = BufferPool(capacity=2)
+        for page_no in (0, 1, 0, 2):
+            pool.get(self.heap, page_no)
+        self.assertEqual([page_no for _, page_no in pool.pages], [0, 2])
+        self.assertEqual((pool.hits, pool.misses), (1, 3))
+
+
+class HeapTableTest(DatabaseTestCase):
+    '''
+    Tables stored in heap files (Database(storage='heap')).
+    '''
+    def test_statements_and_reload(self):
+        db = self.database(storage='heap', buffer_pool_pages=4)
+        db.create_table('a', 'id,name', 'int,str', primary_key='id')
+        db.insert_many('a', [[i, 'x'] for i in range(1000)])
+        db.update_table('a', 'name=yyyyyyyyyyyyyyyyyyyy', 'id<100')
+        db.delete_from('a', 'id>=900')
+        db.checkpoint()
+        self.assertLessEqual(len(buffer_pool.pages), 5)
+        expected = [[i, 'yyyyyyyyyyyyyyyyyyyy' if i < 100 else 'x'] for i in range(900)]
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), expected)
+        db.vacuum('a')
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), expected)
+        self.assertEqual([file for file in os.listdir(db.savedir) if '.heap' in file], ['a.heap.2'])
+        db.drop_table('a')
+        self.assertEqual([file for file in os.listdir(db.savedir) if '.heap' in file], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
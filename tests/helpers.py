@@ -0,0 +1,57 @@
+'''
+Shared by the tests of the database: the modules are imported as mdb.py imports them (with miniDB in the path),
+and every test runs in a temporary directory, since databases are saved under dbdata/ (relative to the working directory).
+'''
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, f'{ROOT}/miniDB'):
+    if path not in sys.path:
+        sys.path.append(path)
+
+import mdb
+from database import Database
+
+
+def live_rows(table):
+    '''
+    Return the rows of a table that are not deleted (deleted rows are filled with Nones), as lists.
+    '''
+    return [list(row) for row in table.data if any(value is not None for value in row)]
+
+
+class DatabaseTestCase(unittest.TestCase):
+    '''
+    A test that runs in an empty working directory.
+    '''
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp(prefix='minidb-test-')
+        os.chdir(self.dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def database(self, name='test', load=False, **kwargs):
+        '''
+        Return a (new, unless load is True) database.
+        '''
+        return Database(name, load=load, verbose=False, **kwargs)
+
+    def query(self, database, query):
+        '''
+        Execute an SQL statement on a database and return its result (see mdb.interpret).
+        '''
+        return mdb.execute_dic(mdb.interpret(query), database)
+
+    def file_id(self, database, filename):
+        '''
+        Return the inode of a file in the directory of a database. Saved files are replaced (see Database._write_file),
+        so it changes every time the file is written.
+        '''
+        return os.stat(f'{database.savedir}/{filename}').st_ino
@@ -0,0 +1,92 @@
+import unittest
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+import mdb
+
+
+class InsertTest(DatabaseTestCase):
+    '''
+    Inserting one row or many rows at once (insert into ... values (...), (...) and Database.insert_many).
+    '''
+    def setUp(self):
+        super().setUp()
+        self.db = self.database()
+        self.db.create_table('a', 'id,name,salary', 'int,str,float', primary_key='id')
+
+    def test_multi_row_insert_syntax(self):
+        # (the values are stripped when they are inserted)
+        self.assertEqual(mdb.interpret('insert into a values (1,x,2.5);'), {'insert into': 'a', 'values': ' 1,x,2.5 '})
+        self.assertEqual(mdb.interpret('insert into a values (1,x,2.5), (2,y,3) ,(3,z,NULL);'),
+                         {'insert many': 'a', 'values': [' 1,x,2.5 ', ' 2,y,3 ', ' 3,z,NULL ']})
+        for values in ('(1,x,2.5', '(1,x,2.5) (2,y,3)', '(1,x,(2.5))', '1,x,2.5'):
+            with self.assertRaises(ValueError):
+                mdb.interpret(f'insert into a values {values};')
+
+    def test_rows_are_casted_and_inserted(self):
+        self.query(self.db, 'insert into a values (1,x,2.5), (2,y,3), (3,z,NULL);')
+        self.query(self.db, 'insert into a values (4,w,1);')
+        self.db.insert_many('a', [[5, 'v', 7], '6,u,8'])
+        rows = [[1, 'x', 2.5], [2, 'y', 3.0], [3, 'z', 'NULL'], [4, 'w', 1.0], [5, 'v', 7.0], [6, 'u', 8.0]]
+        self.assertEqual(live_rows(self.db.tables['a']), rows)
+        self.assertEqual([type(row[2]) for row in self.db.tables['a'].data], [float, float, str, float, float, float])
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), rows)
+        self.assertEqual(self.db.select('*', 'meta_length', 'table_name=a').column_by_name('no_of_rows'), [6])
+
+    def test_inserts_take_the_places_of_deleted_rows(self):
+        self.db.insert_many('a', [[i, 'x', 0.0] for i in range(10)])
+        self.db.delete_from('a', 'id<3')
+        self.db.insert_many('a', ['10,y,0', '11,y,0'])
+        self.db.insert_into('a', '12,y,0')
+        self.db.insert_many('a', ['13,y,0', '14,y,0'])
+        ids = [row[0] for row in self.db.tables['a'].data]
+        self.assertEqual(ids, [12, 11, 10]+list(range(3, 10))+[13, 14])
+        self.assertEqual(self.db._get_insert_stack_for_table('a'), [])
+
+    def test_a_bad_row_rejects_all_the_rows(self):
+        self.db.insert_into('a', '1,x,0')
+        for rows in (['2,y,0', '3,y,abc'], ['2,y,0', '1,y,0'], ['2,y,0', '2,z,0'], ['2,y,0', '3,y'], ['2,y,0', [None, 'y', 0]]):
+            with self.assertRaises(ValueError):
+                self.db.insert_many('a', rows)
+        self.assertEqual(live_rows(self.db.tables['a']), [[1, 'x', 0.0]])
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), [[1, 'x', 0.0]])
+
+
+class PrimaryKeyTest(DatabaseTestCase):
+    '''
+    Duplicate primary keys are rejected, using the set of keys that the table keeps up to date.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.db = self.database()
+        self.db.create_table('a', 'id,name', 'int,str', primary_key='id')
+        self.db.insert_many('a', [[i, 'x'] for i in range(10)])
+
+    def assertRejected(self, key):
+        with self.assertRaisesRegex(ValueError, 'already exists'):
+            self.db.insert_many('a', [[key, 'y']])
+
+    def test_keys_of_inserted_rows(self):
+        self.assertRejected(3)
+        self.db.insert_into('a', '10,y')
+        self.assertRejected(10)
+        self.assertEqual(self.db.tables['a']._pk_values(), set(range(11)))
+
+    def test_keys_of_deleted_and_updated_rows(self):
+        self.db.delete_from('a', 'id<2')
+        self.db.insert_many('a', [[0, 'y']])
+        self.assertRejected(0)
+        self.db.update_table('a', 'id=20', 'id=5') # (the value is stored as it was given)
+        self.db.insert_many('a', [[5, 'y']])
+        self.assertEqual(self.db.tables['a']._pk_values(), {0, 2, 3, 4, 5, 6, 7, 8, 9, '20'})
+
+    def test_keys_after_load(self):
+        self.db.insert_into('a', '10,y') # logged, replayed on load
+        db = self.database(load=True)
+        with self.assertRaisesRegex(ValueError, 'already exists'):
+            db.insert_many('a', [[10, 'z']])
+        self.assertEqual(db.tables['a']._pk_values(), set(range(11)))
+
+
+if __name__ == '__main__':
+    unittest.main()
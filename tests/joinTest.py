@@ -0,0 +1,57 @@
+import unittest
+from unittest import mock
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+import pipeline
+
+
+class JoinTest(DatabaseTestCase):
+    '''
+    pipeline.join streams the rows of the left table and finds their matches in the right one.
+    '''
+    def create(self, storage):
+        db = self.database(storage, storage=storage)
+        db.create_table('a', 'id,name,value', 'int,str,int')
+        db.insert_many('a', [[i, f'a{i}', i*10] for i in range(20)])
+        db.create_table('b', 'ref,label', 'int,str')
+        db.insert_many('b', [[i, f'b{i}'] for i in range(15, 30, 3)] + [[18, 'again']])
+        db.checkpoint()
+        return self.database(storage, load=True)
+
+    def expected(self, join_type):
+        left = [[i, f'a{i}', i*10] for i in range(20)]
+        right = [[i, f'b{i}'] for i in range(15, 30, 3)] + [[18, 'again']]
+        rows = [l + r for l in left for r in right if l[0] == r[0]]
+        if join_type in ('left', 'full'):
+            rows += [l + ['NULL']*2 for l in left if all(l[0] != r[0] for r in right)]
+        if join_type in ('right', 'full'):
+            rows += [['NULL']*3 + r for r in right if all(l[0] != r[0] for l in left)]
+        return sorted(rows, key=str)
+
+    def test_join_types(self):
+        for storage in ('pickle', 'typed', 'columnar'):
+            db = self.create(storage)
+            for join_type in ('inner', 'left', 'right', 'full'):
+                result = db.join(join_type, 'a', 'b', 'id=ref')
+                self.assertEqual(sorted(live_rows(result), key=str), self.expected(join_type), (storage, join_type))
+
+    def test_only_the_join_column_of_the_left_table_is_read(self):
+        db = self.create('columnar')
+        left, right = db.tables['a'], db.tables['b']
+        columns = []
+        column = type(left.data).column
+        def read_column(data, idx):
+            if data is left.data:
+                columns.append(idx)
+            return column(data, idx)
+        with mock.patch.object(type(left.data), 'column', side_effect=read_column, autospec=True), \
+                mock.patch.object(type(left.data), '__iter__', side_effect=AssertionError('every row was read')):
+            rows = list(pipeline.join(left, right, 0, 0, '=', 'inner'))
+        self.assertEqual(len(rows), 3)
+        # the other columns are only read for the rows of the matches (15 and 18)
+        self.assertEqual((columns.count(1), columns.count(2)), (2, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import multiprocessing
+import threading
+import time
+import unittest
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+from database import Database
+from locks import LockManager
+
+
+class LockManagerTest(unittest.TestCase):
+    '''
+    Shared and exclusive locks between the threads of a process (the owners below).
+    '''
+    def setUp(self):
+        self.locks = LockManager(None, timeout=0.1)
+
+    def test_shared_locks_are_compatible(self):
+        self.assertTrue(self.locks.acquire('a', 's', owner=1))
+        self.assertTrue(self.locks.acquire('a', 's', owner=2))
+        self.assertFalse(self.locks.acquire('a', 's', owner=1)) # already held
+        self.assertTrue(self.locks.is_locked('a', 'x', owner=1))
+        self.assertFalse(self.locks.is_locked('a', 's', owner=3))
+
+    def test_conflicting_requests_time_out(self):
+        self.locks.acquire('a', 'x', owner=1)
+        for mode in ('s', 'x'):
+            with self.assertRaisesRegex(Exception, 'Timed out'):
+                self.locks.acquire('a', mode, owner=2)
+        self.locks.release('a', owner=1)
+        self.assertTrue(self.locks.acquire('a', 'x', owner=2, timeout=0))
+        self.assertEqual(self.locks.held('a', owner=2), 'x')
+
+    def test_waiting_requests_are_granted_in_arrival_order(self):
+        self.locks.acquire('a', 'x', owner=0)
+        granted = []
+        def request(owner, mode):
+            self.locks.acquire('a', mode, owner=owner, timeout=5)
+            granted.append(owner)
+            time.sleep(0.05)
+            self.locks.release('a', owner=owner)
+        threads = []
+        # (a shared request that arrives after an exclusive one does not overtake it)
+        for owner, mode in ((1, 'x'), (2, 's'), (3, 'x'), (4, 's')):
+            threads.append(threading.Thread(target=request, args=(owner, mode)))
+            threads[-1].start()
+            time.sleep(0.05)
+        self.locks.release('a', owner=0)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(granted, [1, 2, 3, 4])
+
+    def test_upgrades_go_first(self):
+        self.locks.acquire('a', 's', owner=1)
+        self.locks.acquire('a', 's', owner=2)
+        waiting = threading.Thread(target=self.locks.acquire, args=('a', 'x'), kwargs={'owner': 3, 'timeout': 5})
+        waiting.start()
+        time.sleep(0.05)
+        self.locks.release('a', owner=2)
+        self.assertTrue(self.locks.acquire('a', 'x', owner=1, timeout=0.5))
+        self.locks.release('a', owner=1) # the S lock is kept
+        self.assertEqual(self.locks.held('a', owner=1), 's')
+        self.locks.release('a', owner=1)
+        waiting.join()
+        self.assertEqual(self.locks.held('a', owner=3), 'x')
+
+
+def insert_rows(process_no, no_of_rows, checkpoint_interval):
+    db = Database('test', load=True, verbose=False, checkpoint_interval=checkpoint_interval)
+    for i in range(no_of_rows):
+        db.insert_into('a', f'{process_no*no_of_rows+i},p{process_no}')
+
+
+class ProcessesTest(DatabaseTestCase):
+    '''
+    Many processes modifying the same database (the tables are locked with file locks).
+    '''
+    def test_inserts_of_many_processes(self):
+        db = self.database()
+        db.create_table('a', 'id,name', 'int,str', primary_key='id')
+        context = multiprocessing.get_context('fork')
+        # (every process checkpoints every few inserts, while the others insert)
+        processes = [context.Process(target=insert_rows, args=(process_no, 100, 7)) for process_no in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual([process.exitcode for process in processes], [0, 0, 0])
+        db = self.database(load=True)
+        self.assertEqual(sorted(row[0] for row in live_rows(db.tables['a'])), list(range(300)))
+        self.assertEqual(db.select('*', 'meta_length', 'table_name=a').column_by_name('no_of_rows'), [300])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import threading
+import unittest
+from unittest import mock
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+from table import Table
+
+
+class SnapshotTest(DatabaseTestCase):
+    '''
+    Readers see the version of a table that was current when they started, while writers publish new versions.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.db = self.database()
+        self.db.create_table('a', 'id,name', 'int,str', primary_key='id')
+        self.db.insert_many('a', [[i, 'x'] for i in range(10)])
+
+    def test_results_are_not_affected_by_later_writes(self):
+        result = self.db.select('*', 'a', 'id<5') # a view of the rows of the table (see selection.py)
+        snapshot, = self.db._snapshot('a')
+        self.db.insert_into('a', '10,y')
+        self.db.update_table('a', 'name=z', 'id=1')
+        self.db.delete_from('a', 'id=2')
+        self.db.sort('a', 'id')
+        self.assertEqual(live_rows(result), [[i, 'x'] for i in range(5)])
+        self.assertEqual(live_rows(snapshot), [[i, 'x'] for i in range(10)])
+        self.assertEqual(len(live_rows(self.db.tables['a'])), 10)
+
+    def test_versions_that_no_reader_has_seen_are_modified_in_place(self):
+        table = self.db.tables['a']
+        data = table.data
+        self.db.insert_into('a', '10,y')
+        self.db.update_table('a', 'name=z', 'id=1')
+        self.db.delete_from('a', 'id=2')
+        self.assertIs(self.db.tables['a'], table)
+        self.assertIs(table.data, data)
+        # once a reader has the current version, the next write copies it, and the copy can be modified in place
+        self.db.select('*', 'a', None)
+        self.db.insert_into('a', '11,y')
+        self.assertIsNot(self.db.tables['a'], table)
+        self.assertEqual(len(live_rows(table)), 10)
+        table = self.db.tables['a']
+        self.db.insert_into('a', '12,y')
+        self.assertIs(self.db.tables['a'], table)
+
+    def test_failed_statements_do_not_modify_the_table(self):
+        self.db.update_table('a', 'name=1', 'id<5')
+        with self.assertRaises(ValueError):
+            self.db.cast('name', 'a', 'int')
+        self.assertEqual(self.db.tables['a'].column_types, [int, str])
+        self.assertEqual(live_rows(self.db.tables['a'])[0], [0, '1'])
+        with self.assertRaises(ValueError):
+            self.db.insert_many('a', ['20,y', '1,y'])
+        self.assertEqual(len(live_rows(self.db.tables['a'])), 10)
+
+    def test_readers_do_not_wait_for_a_version_that_is_modified_in_place(self):
+        halfway, read = threading.Event(), threading.Event()
+        set_row = Table._set_row
+        def slow_set_row(table, index, row):
+            set_row(table, index, row)
+            if index == 4: # the writer stops in the middle of the update, until the reader is done
+                halfway.set()
+                read.wait(10)
+        self.db.delete_from('a', 'id=9') # (the insert takes the place of the deleted row)
+        with mock.patch.object(Table, '_set_row', slow_set_row):
+            writer = threading.Thread(target=self.db.update_table, args=('a', 'name=y', 'id<8'))
+            writer.start()
+            halfway.wait(10)
+            self.assertEqual(live_rows(self.db.select('*', 'a', None)), [[i, 'x'] for i in range(9)])
+            self.assertEqual(self.db.select('count(*)', 'a', None).data, [[9]])
+            read.set()
+            writer.join()
+        self.assertEqual(live_rows(self.db.select('name', 'a', None)), [['y']]*8+[['x']])
+
+    def test_failed_statements_end_their_writes(self):
+        table = self.db.tables['a']
+        with self.assertRaises(ValueError):
+            self.db.delete_from('a', 'nosuch=1')
+        set_row = Table._set_row
+        def failing_set_row(table, index, row):
+            if index == 4:
+                raise RuntimeError('failed')
+            set_row(table, index, row)
+        with mock.patch.object(Table, '_set_row', failing_set_row), self.assertRaises(RuntimeError):
+            self.db.update_table('a', 'name=y', 'id<8')
+        # the table was modified in place, and is restored
+        self.assertIs(self.db.tables['a'], table)
+        self.assertEqual(self.db._writing, {})
+        self.assertEqual(live_rows(table), [[i, 'x'] for i in range(10)])
+        # other threads read and write it
+        other = []
+        thread = threading.Thread(target=lambda: (self.db.insert_into('a', '10,y'), other.append(live_rows(self.db.select('*', 'a', None)))))
+        thread.start()
+        thread.join(10)
+        self.assertEqual(len(other[0]), 11)
+
+    def test_transactions_modify_private_versions(self):
+        self.db.begin()
+        self.db.insert_into('a', '10,y')
+        self.assertEqual(len(live_rows(self.db.select('*', 'a', None))), 11)
+        other = []
+        reader = threading.Thread(target=lambda: other.append(live_rows(self.db.select('*', 'a', None))))
+        reader.start()
+        reader.join()
+        self.assertEqual(len(other[0]), 10)
+        self.db.rollback()
+        self.assertEqual(len(live_rows(self.db.select('*', 'a', None))), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import random
+import unittest
+from unittest import mock
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+import pipeline
+
+
+class IndexTest(DatabaseTestCase):
+    '''
+    Selects with a single comparison on the primary key use the table's index (a btree).
+    '''
+    def setUp(self):
+        super().setUp()
+        self.db = self.database()
+        self.db.create_table('a', 'id,name', 'int,str', primary_key='id')
+        self.db.insert_many('a', [[i, f'n{i%7}'] for i in range(100)])
+        self.db.create_index('a_idx', 'a')
+
+    def test_the_index_finds_the_same_rows_as_a_scan(self):
+        for condition, ids in (('id=42', [42]), ('id<10', range(10)), ('id>=95', range(95, 100)), ('id=1000', [])):
+            self.assertEqual(sorted(live_rows(self.db.select('*', 'a', condition))), [[i, f'n{i%7}'] for i in ids])
+        self.assertEqual(live_rows(self.db.select('name', 'a', 'id=8')), [['n1']])
+        self.assertEqual(live_rows(self.db.select('id', 'a', 'id<10', order_by='id', desc=False, limit='3')), [[0], [1], [2]])
+
+    def test_the_table_is_not_scanned(self):
+        table = self.db.tables['a']
+        with mock.patch.object(table, 'column_by_name', side_effect=AssertionError('scanned')):
+            result = table._select_where_with_btree('*', self.db._load_idx('a_idx'), 'id=42')
+        self.assertEqual(live_rows(result), [[42, 'n0']])
+
+    def test_the_index_is_only_used_on_the_primary_key(self):
+        table = self.db.tables['a']
+        with self.assertRaises(ValueError):
+            table._select_where_with_btree('*', self.db._load_idx('a_idx'), 'name=n1')
+        self.assertEqual(len(live_rows(self.db.select('*', 'a', 'name=n1'))), 15)
+
+
+class OrderLimitTest(DatabaseTestCase):
+    '''
+    order by ... limit k keeps the first k rows in a bounded heap (pipeline.top) instead of sorting all the rows,
+    with the same result.
+    '''
+    def setUp(self):
+        super().setUp()
+        random.seed(4)
+        self.db = self.database()
+        self.db.create_table('a', 'id,score', 'int,int', primary_key='id')
+        self.db.insert_many('a', [[i, random.randrange(20)] for i in range(300)])
+        self.db.insert_many('a', [[300, None]]) # (ordered as 0)
+        self.db.delete_from('a', 'id<20')
+
+    def sorted_rows(self, desc, k, condition=None):
+        rows = live_rows(self.db.select('*', 'a', condition))
+        return sorted(rows, key=lambda row: 0 if row[1] is None else row[1], reverse=desc)[:k]
+
+    def test_top_returns_the_first_rows_of_the_sorted_rows(self):
+        rows = [[i, random.randrange(10)] for i in range(100)]
+        for desc in (False, True):
+            for k in (0, 1, 10, 100, 200):
+                self.assertEqual(list(pipeline.top(rows, 1, desc, k)), list(pipeline.order(rows, 1, desc))[:k])
+
+    def test_order_by_with_limit(self):
+        with mock.patch.object(pipeline, 'order', side_effect=AssertionError('all the rows were sorted')):
+            for desc in (False, True):
+                for k in (1, 5, 50, 400):
+                    for condition in (None, 'score>10'):
+                        result = self.db.select('*', 'a', condition, order_by='score', desc=desc, limit=str(k))
+                        self.assertEqual(live_rows(result), self.sorted_rows(desc, k, condition))
+
+
+if __name__ == '__main__':
+    unittest.main()
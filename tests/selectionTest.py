@@ -0,0 +1,105 @@
+import os
+import pickle
+import unittest
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+from columnar import ColumnarData
+from selection import SelectionRows
+
+
+class SelectionRowsTest(DatabaseTestCase):
+    '''
+    Views of the selected rows and columns of a table's rows.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.base = [[i, f'name {i}', i*10] for i in range(10)]
+
+    def test_selected_rows_and_columns(self):
+        view = SelectionRows(self.base, [1, 4, 7], [2, 0])
+        self.assertEqual(list(view), [[10, 1], [40, 4], [70, 7]])
+        self.assertEqual(len(view), 3)
+        self.assertEqual(view[-1], [70, 7])
+        self.assertEqual(view[:2], [[10, 1], [40, 4]])
+        self.assertEqual(view.column(1), [1, 4, 7])
+        self.assertEqual(list(SelectionRows(self.base)), self.base)
+        self.assertEqual(list(SelectionRows(self.base, [])), [])
+
+    def test_a_selection_of_a_selection_refers_to_the_base_rows(self):
+        view = SelectionRows(SelectionRows(self.base, [1, 4, 7, 8], [2, 0]), [0, 2], [1])
+        self.assertIs(view.base, self.base)
+        self.assertEqual(list(view.rows), [1, 7])
+        self.assertEqual(list(view), [[1], [7]])
+
+    def test_modifications_copy_the_rows(self):
+        view = SelectionRows(self.base, [1, 4], [0])
+        view.append([100])
+        view[0] = [-1]
+        del view[1]
+        self.assertTrue(view.modified)
+        self.assertEqual(list(view), [[-1], [100]])
+        self.assertEqual(view.column(0), [-1, 100])
+        self.assertEqual(self.base, [[i, f'name {i}', i*10] for i in range(10)])
+
+    def test_views_are_pickled_as_lists(self):
+        data = pickle.loads(pickle.dumps(SelectionRows(self.base, [2, 3], [1])))
+        self.assertEqual(data, [['name 2'], ['name 3']])
+        self.assertIs(type(data), list)
+
+    def test_columnar_base_rows(self):
+        base = ColumnarData.create('t.cols', self.base, [int, str, int])
+        view = SelectionRows(base, [0, 9], [2])
+        self.assertEqual(list(view), [[0], [90]])
+        self.assertEqual(list(view.column(0)), [0, 90])
+
+
+class SelectViewTest(DatabaseTestCase):
+    '''
+    Selects return views of the rows of the table's version they read, which writers never modify.
+    '''
+    def create(self, storage):
+        db = self.database(storage, storage=storage)
+        db.create_table('a', 'id,name', 'int,str', primary_key='id')
+        db.insert_many('a', [[i, 'x'] for i in range(20)])
+        return db
+
+    def test_results_do_not_change_after_writes(self):
+        for storage in ('pickle', 'typed', 'columnar', 'compressed'):
+            db = self.create(storage)
+            db.checkpoint()
+            db = self.database(storage, load=True)
+            everything, selected = db.select('*', 'a', None), db.select('name', 'a', 'id<5')
+            self.assertIsInstance(everything.data, SelectionRows)
+            self.assertIsInstance(selected.data, SelectionRows)
+            db.update_table('a', 'name=y', 'id<10')
+            db.delete_from('a', 'id=2')
+            db.insert_into('a', '20,z')
+            self.assertEqual(live_rows(everything), [[i, 'x'] for i in range(20)], storage)
+            self.assertEqual(live_rows(selected), [['x']]*5, storage)
+            self.assertEqual(len(live_rows(db.select('*', 'a', 'name=y'))), 9)
+
+    def test_heap_tables_return_copies(self):
+        # (their pages are modified in place)
+        db = self.create('heap')
+        result = db.select('*', 'a', 'id<5')
+        self.assertNotIsInstance(result.data, SelectionRows)
+        db.update_table('a', 'name=y', 'id<10')
+        self.assertEqual(live_rows(result), [[i, 'x'] for i in range(5)])
+
+    def test_subqueries_and_saved_results(self):
+        db = self.create('pickle')
+        result = self.query(db, 'select name from (select * from a where id>=15) where id!=17')
+        self.assertIsInstance(result.data, SelectionRows)
+        self.assertIs(result.data.base, db.tables['a'].data)
+        self.assertEqual(live_rows(result), [['x']]*4)
+        db.select('*', 'a', 'id<3', save_as='b')
+        db.checkpoint()
+        saved = self.database('pickle', load=True).tables['b']
+        self.assertIs(type(saved.data), list)
+        self.assertEqual(live_rows(saved), [[0, 'x'], [1, 'x'], [2, 'x']])
+        self.assertIn('b.pkl', os.listdir(db.savedir))
+
+
+if __name__ == '__main__':
+    unittest.main()
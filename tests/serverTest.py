@@ -0,0 +1,116 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+from tests.helpers import ROOT, DatabaseTestCase, live_rows
+
+from client import Client, send_message, recv_message
+
+
+class ServerTestCase(DatabaseTestCase):
+    '''
+    A test that runs an mdb server (SERVE mode) on a database with a table 'a'.
+    '''
+    max_clients = 64
+
+    def setUp(self):
+        super().setUp()
+        self.database().create_table('a', 'id,name', 'int,str', primary_key='id')
+        self.path = f'{self.dir}/mdb.sock'
+        # (mdb.py finds the modules in miniDB/ relative to the working directory, which is the test's directory)
+        env = dict(os.environ, SERVE=self.path, DB='test', WORKERS='2', MAX_CLIENTS=str(self.max_clients), PYTHONPATH=f'{ROOT}/miniDB')
+        self.server = subprocess.Popen([sys.executable, f'{ROOT}/mdb.py'], cwd=self.dir, env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # (the socket file exists before the server listens, wait until a client can connect)
+        deadline = time.monotonic() + 10
+        while True:
+            if self.server.poll() is not None:
+                self.fail(f'The server exited with {self.server.returncode}.')
+            try:
+                Client(self.path).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    self.server.terminate()
+                    self.server.wait()
+                    self.fail('Timed out waiting for the server.')
+                time.sleep(0.01)
+
+    def tearDown(self):
+        self.server.terminate()
+        self.server.wait()
+        super().tearDown()
+
+
+class ServerTest(ServerTestCase):
+    '''
+    The mdb server executing the queries of clients.
+    '''
+    def test_queries(self):
+        with Client(self.path) as client:
+            self.assertIsNone(client.execute('insert into a values (1,x)'))
+            client.execute('insert into a values (2,y)')
+            self.assertEqual(live_rows(client.execute('select * from a where id>1')), [[2, 'y']])
+            with self.assertRaisesRegex(Exception, 'Traceback'): # the server's traceback
+                client.execute('select * from missing')
+            with self.assertRaisesRegex(Exception, 'not supported'):
+                client.execute('begin')
+            # the session goes on after errors
+            self.assertEqual(len(live_rows(client.execute('select * from a'))), 2)
+        # the changes are saved by the server
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), [[1, 'x'], [2, 'y']])
+
+    def test_concurrent_clients(self):
+        def insert(client_no):
+            with Client(self.path, 'test') as client:
+                for i in range(20):
+                    client.execute(f'insert into a values ({client_no*20+i},c{client_no})')
+                    client.execute('select * from a')
+        clients = [threading.Thread(target=insert, args=(client_no,)) for client_no in range(5)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        with Client(self.path) as client:
+            self.assertEqual(sorted(row[0] for row in live_rows(client.execute('select * from a'))), list(range(100)))
+
+
+class SessionsTest(ServerTestCase):
+    '''
+    The server serves a limited number of sessions at a time, and the queries of a session in order.
+    '''
+    max_clients = 2
+
+    def test_connections_over_the_limit_wait(self):
+        first, second = Client(self.path), Client(self.path)
+        for client in (first, second):
+            client.execute('select * from a')
+        results = []
+        third = Client(self.path)
+        waiting = threading.Thread(target=lambda: results.append(third.execute('select * from a')))
+        waiting.start()
+        waiting.join(0.3)
+        self.assertEqual(results, [])
+        first.close() # its session ends, the third one starts
+        waiting.join(5)
+        self.assertEqual(len(results), 1)
+        second.close()
+        third.close()
+
+    def test_queued_queries_are_executed_in_order(self):
+        with Client(self.path) as client:
+            # sent without waiting for the responses (more than a session queues, see serve)
+            for i in range(20):
+                send_message(client.sock, {'db': None, 'query': f'insert into a values ({i},x)'})
+                send_message(client.sock, {'db': None, 'query': 'select * from a'})
+            for i in range(20):
+                self.assertEqual(recv_message(client.sock), ('ok', None))
+                status, result = recv_message(client.sock)
+                self.assertEqual([row[0] for row in live_rows(result)], list(range(i+1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
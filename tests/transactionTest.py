@@ -0,0 +1,150 @@
+import os
+import subprocess
+import sys
+import threading
+import unittest
+
+from tests.helpers import ROOT, DatabaseTestCase, live_rows
+
+
+class BatchTest(DatabaseTestCase):
+    '''
+    Statements executed as a batch (e.g. a SQL script) are saved once, at the end, or rolled back if one fails.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.db = self.database()
+        self.db.create_table('a', 'id,name', 'int,str', primary_key='id')
+        self.db.insert_into('a', '1,x')
+
+    def test_a_batch_is_saved_once(self):
+        writes = []
+        write_file = self.db._write_file
+        self.db._write_file = lambda filename, obj: (writes.append(filename), write_file(filename, obj))
+        self.db.wal.append = lambda *args: self.fail('a statement of the batch was logged')
+        with self.db.batch():
+            for i in range(2, 12):
+                self.db.insert_into('a', f'{i},y')
+            self.db.update_table('a', 'name=z', 'id<5')
+            with self.db.batch(): # part of the outer one
+                self.db.delete_from('a', 'id=11')
+        self.assertEqual(len(writes), len(set(writes)))
+        rows = [[1, 'z']]+[[i, 'z' if i < 5 else 'y'] for i in range(2, 11)]
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), rows)
+
+    def test_a_failed_batch_is_rolled_back(self):
+        with self.assertRaises(ZeroDivisionError):
+            with self.db.batch():
+                self.db.insert_into('a', '2,y')
+                self.db.update_table('a', 'name=z', 'id=1')
+                1/0
+        self.assertFalse(self.db.in_transaction())
+        self.assertEqual(live_rows(self.db.select('*', 'a', None)), [[1, 'x']])
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), [[1, 'x']])
+        self.assertEqual(self.db.select('*', 'meta_length', 'table_name=a').column_by_name('no_of_rows'), [1])
+
+    def run_script(self, *lines):
+        with open('script.sql', 'w') as f:
+            f.write('\n'.join(lines)+'\n')
+        env = dict(os.environ, SQL='script.sql', DB='test', PYTHONPATH=f'{ROOT}/miniDB')
+        return subprocess.run([sys.executable, f'{ROOT}/mdb.py'], cwd=self.dir, env=env, stdin=subprocess.DEVNULL,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+
+    def test_scripts_run_as_a_batch(self):
+        self.assertNotEqual(self.run_script('insert into a values (2,y);', 'select * from missing;'), 0)
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), [[1, 'x']])
+        self.assertEqual(self.run_script('-- a comment', 'insert into a values (2,y);', 'insert into a values (3,z);'), 0)
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), [[1, 'x'], [2, 'y'], [3, 'z']])
+
+
+class TransactionTest(DatabaseTestCase):
+    '''
+    begin, commit and rollback.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.db = self.database(lock_timeout=0.2)
+        self.db.create_table('a', 'id,name', 'int,str', primary_key='id')
+        self.db.insert_into('a', '1,x')
+
+    def test_commit(self):
+        self.query(self.db, 'begin transaction;')
+        self.query(self.db, 'insert into a values (2,y);')
+        self.query(self.db, 'delete from a where id=1;')
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), [[1, 'x']])
+        self.query(self.db, 'commit work;')
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), [[2, 'y']])
+        self.assertEqual(self.db._get_insert_stack_for_table('a'), [0])
+
+    def test_rollback(self):
+        for storage in ('pickle', 'heap'):
+            db = self.database(storage, storage=storage, buffer_pool_pages=2)
+            db.create_table('a', 'id,name', 'int,str', primary_key='id')
+            db.insert_many('a', [[i, 'x'] for i in range(1000)])
+            db.checkpoint()
+            self.query(db, 'begin;')
+            # (the modified heap pages do not fit in the buffer pool, they are written to the heap file)
+            self.query(db, 'update table a set name=yyyyyyyyyy where id>10;')
+            self.query(db, 'delete from a where id<5;')
+            db.create_table('b', 'id', 'int')
+            self.query(db, 'rollback;')
+            expected = [[i, 'x'] for i in range(1000)]
+            self.assertEqual(live_rows(db.select('*', 'a', None)), expected)
+            self.assertNotIn('b', db.tables)
+            self.assertEqual(db._get_insert_stack_for_table('a'), [])
+            self.assertEqual(live_rows(self.database(storage, load=True).tables['a']), expected)
+
+    def test_indexes_are_rebuilt_when_the_transaction_commits(self):
+        self.db.insert_many('a', [[i, f'n{i}'] for i in range(2, 10)])
+        self.db.create_index('a_id', 'a')
+        self.query(self.db, 'begin;')
+        self.query(self.db, 'delete from a where id<5;')
+        self.query(self.db, 'vacuum a;')
+        self.assertEqual(live_rows(self.query(self.db, 'select * from a where id=7;')), [[7, 'n7']])
+        self.query(self.db, 'rollback;')
+        self.assertEqual(live_rows(self.query(self.db, 'select * from a where id=7;')), [[7, 'n7']])
+        self.assertEqual(live_rows(self.query(self.db, 'select * from a where id=2;')), [[2, 'n2']])
+        self.query(self.db, 'begin;')
+        self.query(self.db, 'delete from a where id<5;')
+        self.query(self.db, 'vacuum a;')
+        self.query(self.db, 'commit;')
+        for db in (self.db, self.database(load=True)):
+            self.assertEqual(live_rows(self.query(db, 'select * from a where id=7;')), [[7, 'n7']])
+            self.assertEqual(live_rows(self.query(db, 'select * from a where id=2;')), [])
+            self.assertEqual(sorted(db._load_idx('a_id').find('>=', 0)), list(range(5)))
+
+    def test_locks_are_held_until_the_transaction_ends(self):
+        self.db.begin()
+        self.db.insert_into('a', '2,y')
+        errors = []
+        def insert():
+            try:
+                self.db.insert_into('a', '3,z')
+            except Exception as e:
+                errors.append(e)
+        other = threading.Thread(target=insert)
+        other.start()
+        other.join()
+        self.assertRegex(str(errors[0]), 'Timed out')
+        self.db.commit()
+        other = threading.Thread(target=insert)
+        other.start()
+        other.join()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(len(live_rows(self.db.select('*', 'a', None))), 3)
+
+    def test_statements_out_of_place(self):
+        with self.assertRaises(Exception):
+            self.db.commit()
+        with self.assertRaises(Exception):
+            self.db.rollback()
+        self.db.begin()
+        with self.assertRaises(Exception):
+            self.db.begin()
+        self.db.rollback()
+        with self.assertRaises(ValueError):
+            self.query(self.db, 'begin something;')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import multiprocessing
+import os
+import unittest
+
+from tests.helpers import DatabaseTestCase, live_rows
+
+import wal
+from database import Database
+from table import Table
+
+
+class WriteAheadLogTest(DatabaseTestCase):
+    '''
+    Inserts, updates and deletes are appended to the write-ahead log and replayed on load.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.db = self.database()
+        self.db.create_table('a', 'id,name', 'int,str', primary_key='id')
+
+    def test_statements_are_logged_instead_of_saved(self):
+        before = self.file_id(self.db, 'a.pkl')
+        self.db.insert_into('a', '1,x')
+        self.db.update_table('a', 'name=y', 'id=1')
+        self.db.delete_from('a', 'id=1')
+        self.assertEqual(self.file_id(self.db, 'a.pkl'), before)
+        self.assertEqual([operation for operation, table_name, _ in self.db.wal.read()], [wal.INSERT, wal.UPDATE, wal.DELETE])
+
+    def test_the_log_is_replayed_after_a_crash(self):
+        self.db.insert_many('a', ['1,x', '2,y', '3,z'])
+        self.db.update_table('a', 'name=w', 'id=2')
+        self.db.delete_from('a', 'id=3')
+        self.db.insert_into('a', '4,v') # takes the place of the deleted row
+        # the process stops here: the table file was never written after the create
+        db = self.database(load=True)
+        self.assertEqual(live_rows(db.tables['a']), [[1, 'x'], [2, 'w'], [4, 'v']])
+        self.assertEqual(db.select('*', 'meta_length', 'table_name=a').column_by_name('no_of_rows'), [3])
+        self.assertEqual(db._get_insert_stack_for_table('a'), [])
+
+    def test_a_torn_record_ends_the_log(self):
+        self.db.insert_into('a', '1,x')
+        with open(self.db.wal.path, 'ab') as f: # a record that was being written when the process crashed
+            f.write(wal.HEADER.pack(wal.INSERT, 100, 0)+b'partial')
+        db = self.database(load=True)
+        self.assertEqual(live_rows(db.tables['a']), [[1, 'x']])
+        # the garbage is cut off, so the next records are read back
+        db.insert_into('a', '2,y')
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), [[1, 'x'], [2, 'y']])
+
+    def test_readers_do_not_cut_a_record_that_is_being_appended(self):
+        self.db.insert_into('a', '1,x')
+        other = self.database(load=True)
+        other.insert_into('a', '2,y')
+        # another process is in the middle of appending a record (all but its last bytes are in the file)
+        with open(self.db.wal.path, 'rb') as f:
+            records = f.read()
+        last = records[-5:]
+        with open(self.db.wal.path, 'wb') as f:
+            f.write(records[:-5])
+        self.db.load_database()
+        self.assertEqual(os.path.getsize(self.db.wal.path), len(records)-5)
+        with open(self.db.wal.path, 'ab') as f:
+            f.write(last)
+        self.db.load_database()
+        self.assertEqual(live_rows(self.db.tables['a']), [[1, 'x'], [2, 'y']])
+
+    def test_checkpoint_saves_the_tables_and_empties_the_log(self):
+        self.db.insert_into('a', '1,x')
+        self.db.checkpoint()
+        self.assertEqual(self.db.wal.read(), [])
+        self.assertEqual(os.path.getsize(self.db.wal.path), 0)
+        self.assertEqual(live_rows(self.database(load=True).tables['a']), [[1, 'x']])
+
+    def test_checkpoint_interval(self):
+        db = self.database('small', checkpoint_interval=3)
+        db.create_table('a', 'id', 'int')
+        for i in range(7):
+            db.insert_into('a', str(i))
+        self.assertEqual(len(db.wal.read()), 1)
+        self.assertEqual(live_rows(self.database('small', load=True).tables['a']), [[i] for i in range(7)])
+
+    def test_redo_is_idempotent(self):
+        table = Table(name='t', column_names=['id', 'name'], column_types=[int, str])
+        records = [(wal.INSERT, [[0, 1], [[1, 'x'], [2, 'y']]]), (wal.UPDATE, [[1], 1, 'z']), (wal.DELETE, [[0]])]
+        for _ in range(2):
+            for operation, args in records:
+                wal.redo(table, operation, args)
+        self.assertEqual(table.data, [[None, None], [2, 'z']])
+        self.assertEqual(table._no_of_rows(), 1)
+
+
+class CheckpointCrashTest(DatabaseTestCase):
+    '''
+    A checkpoint that is interrupted (the process crashes) at any step leaves the database as it was before it,
+    or as it is after it.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.rows = {}
+        for storage in ('pickle', 'heap', 'columnar'):
+            db = self.database(storage, storage=storage)
+            db.create_table('a', 'id,name', 'int,str', primary_key='id')
+            db.insert_many('a', [[i, 'x'] for i in range(200)])
+            db.checkpoint()
+            db.update_table('a', 'name=y', 'id<50')
+            db.delete_from('a', 'id>=150')
+            db.insert_into('a', '200,z')
+            self.rows[storage] = live_rows(db.tables['a'])
+            setattr(self, storage, db)
+
+    def crash(self, db, method, statement=None):
+        '''
+        Checkpoint (or run statement), making a method of the database (or of its log) raise the first time it is called.
+        '''
+        obj = db.wal if method == 'truncate' else db
+        original = getattr(obj, method)
+        def crashing(*args, **kwargs):
+            setattr(obj, method, original)
+            raise SystemExit('crash')
+        setattr(obj, method, crashing)
+        with self.assertRaises(SystemExit):
+            (statement or db.checkpoint)()
+
+    def check(self, storage):
+        db = self.database(storage, load=True)
+        self.assertEqual(live_rows(db.tables['a']), self.rows[storage])
+        self.assertEqual(db.select('*', 'meta_length', 'table_name=a').column_by_name('no_of_rows'), [len(self.rows[storage])])
+        # and the next checkpoint completes
+        db.checkpoint()
+        self.assertEqual(live_rows(self.database(storage, load=True).tables['a']), self.rows[storage])
+
+    def test_crash_before_the_table_file_is_replaced(self):
+        # (heap pages and columns are written before the table file that points to them)
+        for storage in self.rows:
+            self.crash(getattr(self, storage), '_write_file')
+            self.check(storage)
+
+    def test_crash_before_the_log_is_emptied(self):
+        # the log is replayed on tables that already contain its changes
+        for storage in self.rows:
+            self.crash(getattr(self, storage), 'truncate')
+            self.check(storage)
+
+    def test_previous_table_files_are_kept_until_the_new_ones_are_durable(self):
+        self.crash(self.columnar, '_sync_dir')
+        self.assertEqual(sorted(os.listdir(f'{self.columnar.savedir}/a.cols')), ['2', '3'])
+        self.crash(self.heap, '_sync_dir', statement=lambda: self.heap.vacuum('a')) # (writes a new heap file)
+        heap_files = [file for file in os.listdir(self.heap.savedir) if file.startswith('a.heap')]
+        self.assertEqual(sorted(heap_files), ['a.heap.1', 'a.heap.2'])
+        # they are released by the next checkpoint
+        self.heap.checkpoint()
+        self.assertEqual([file for file in os.listdir(self.heap.savedir) if file.startswith('a.heap')], ['a.heap.2'])
+
+
+def insert_rows(table_name, no_of_rows, checkpoint_interval):
+    db = Database('test', load=True, verbose=False, checkpoint_interval=checkpoint_interval)
+    for i in range(no_of_rows):
+        db.insert_into(table_name, f'{i},x')
+
+
+class ConcurrentCheckpointTest(DatabaseTestCase):
+    '''
+    Processes that checkpoint while other processes append to the log.
+    '''
+    def test_no_logged_change_is_lost(self):
+        db = self.database()
+        for table_name in ('a', 'b'):
+            db.create_table(table_name, 'id,name', 'int,str', primary_key='id')
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=insert_rows, args=(table_name, 300, 7)) for table_name in ('a', 'b')]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual([process.exitcode for process in processes], [0, 0])
+        db = self.database(load=True)
+        for table_name in ('a', 'b'):
+            self.assertEqual(sorted(row[0] for row in live_rows(db.tables[table_name])), list(range(300)))
+
+
+class RowCountTest(DatabaseTestCase):
+    '''
+    meta_length is kept up to date from the number of rows the table keeps, without counting the rows again.
+    '''
+    def setUp(self):
+        super().setUp()
+        self.db = self.database()
+        self.db.create_table('a', 'id,name', 'int,str')
+
+    def no_of_rows(self):
+        return self.db.select('*', 'meta_length', 'table_name=a').column_by_name('no_of_rows')[0]
+
+    def test_rows_of_zeros_and_empty_strings_are_counted(self):
+        self.db.insert_many('a', [[0, ''], [1, 'x'], [0, '']])
+        self.assertEqual(self.no_of_rows(), 3)
+        self.db.delete_from('a', 'id=1')
+        self.assertEqual(self.no_of_rows(), 2)
+        self.db.vacuum('a')
+        self.assertEqual(self.no_of_rows(), 2)
+
+    def test_inserts_do_not_scan_the_rows(self):
+        self.db.insert_many('a', [[i, 'x'] for i in range(100)])
+        table = self.db.tables['a']
+        table.data = NoScan(table.data)
+        self.db.insert_into('a', '100,y')
+        self.db.insert_many('a', ['101,z', '102,z'])
+        self.assertEqual(self.no_of_rows(), 103)
+        self.db.tables['a'].data = list.copy(self.db.tables['a'].data)
+        self.db.delete_from('a', 'id<10')
+        self.db.update_table('a', 'name=w', 'id=50')
+        self.assertEqual(self.no_of_rows(), 93)
+
+
+class NoScan(list):
+    '''
+    Rows that fail the test if they are iterated (e.g. to count them).
+    '''
+    def __iter__(self):
+        raise AssertionError('the rows were scanned')
+
+    def copy(self):
+        return NoScan(list.copy(self))
+
+
+if __name__ == '__main__':
+    unittest.main()